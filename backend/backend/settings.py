@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 import environ
@@ -180,6 +181,26 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Cache dùng chung (VD: CACHE_URL=rediscache://127.0.0.1:6379/1 khi chạy nhiều process)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Broker pub/sub cho luồng sự kiện chấm công (SSE); mặc định chỉ trong process hiện tại
+ATTENDANCE_EVENT_BROKER = env('ATTENDANCE_EVENT_BROKER', default='hrms.live_events.InProcessBroker')
+
+# Cách chiếu nhật ký punch (AttendanceEvent) vào Attendance: sync / background / worker
+ATTENDANCE_PROJECTION = env('ATTENDANCE_PROJECTION', default='sync')
+
+# Bộ đếm chấm công trong ngày (toàn công ty / phòng ban) cho dashboard, giữ trong cache
+ATTENDANCE_LIVE_COUNTERS = env.bool('ATTENDANCE_LIVE_COUNTERS', default=True)
+
+# Thư mục cache payslip PDF (file đặt tên theo hash nội dung payslip)
+PAYSLIP_PDF_CACHE_DIR = env('PAYSLIP_PDF_CACHE_DIR', default=str(BASE_DIR / 'payslip_cache'))
+PAYSLIP_PDF_WORKERS = env.int('PAYSLIP_PDF_WORKERS', default=2)
+# Số process render PDF khi xuất ZIP payslip cả phòng ban
+PAYSLIP_EXPORT_WORKERS = env.int('PAYSLIP_EXPORT_WORKERS', default=os.cpu_count() or 1)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Employee, Department, Position, Attendance, LeaveRequest, LeaveType, Performance
+from .models import Employee, Department, Position, Attendance, AttendanceEvent, AttendanceMonthlySummary, Holiday, LeaveAccrualRun, LeaveBalance, LeaveLedgerEntry, LeaveRequest, LeaveType, Performance
 
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
@@ -24,9 +24,25 @@ class AttendanceAdmin(admin.ModelAdmin):
     list_filter = ['date', 'employee__department']      
     date_hierarchy = 'date'
 
+@admin.register(AttendanceEvent)
+class AttendanceEventAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'date', 'type', 'timestamp', 'source', 'status', 'error']
+    list_filter = ['type', 'status', 'source', 'date']
+    date_hierarchy = 'date'
+
+@admin.register(AttendanceMonthlySummary)
+class AttendanceMonthlySummaryAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'month', 'present_days', 'late_days', 'incomplete_days', 'on_leave_days', 'worked_seconds']
+    list_filter = ['month', 'employee__department']
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'name']
+    date_hierarchy = 'date'
+
 @admin.register(LeaveType)
 class LeaveTypeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'max_days_per_year', 'is_paid']
+    list_display = ['name', 'max_days_per_year', 'is_paid', 'accrual_method', 'max_balance', 'carry_over_max']
 
 @admin.register(LeaveRequest)
 class LeaveRequestAdmin(admin.ModelAdmin):
@@ -34,6 +50,46 @@ class LeaveRequestAdmin(admin.ModelAdmin):
     list_filter = ['status', 'leave_type_id', 'start_date']
     date_hierarchy = 'request_date'
 
+@admin.register(LeaveLedgerEntry)
+class LeaveLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'leave_type', 'year', 'kind', 'days', 'period', 'leave_request', 'note', 'created_at']
+    list_filter = ['kind', 'leave_type', 'year']
+    search_fields = ['employee__employee_id', 'note']
+
+    # Sổ cái chỉ ghi thêm: thêm bút toán (VD: adjustment) qua LeaveBalance.post để số dư cập nhật cùng lúc
+    def save_model(self, request, obj, form, change):
+        LeaveBalance.post([obj])
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(LeaveBalance)
+class LeaveBalanceAdmin(admin.ModelAdmin):
+    list_display = ['employee', 'leave_type', 'year', 'accrued', 'used', 'remaining', 'updated_at']
+    list_filter = ['leave_type', 'year']
+    search_fields = ['employee__employee_id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(LeaveAccrualRun)
+class LeaveAccrualRunAdmin(admin.ModelAdmin):
+    list_display = ['leave_type', 'accrual_period', 'employees', 'accrual_entries', 'accrued_days',
+                    'carry_over_entries', 'carried_days', 'skipped', 'duration_ms', 'started_at']
+    list_filter = ['leave_type', 'accrual_period']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Performance)
 class PerformanceAdmin(admin.ModelAdmin):
     list_display = [
@@ -0,0 +1,135 @@
+"""
+Department attendance calendar
+==============================
+
+GET /api/attendance/calendar/?month=2025-03&department=<id> trả về lưới chấm công một tháng
+của cả phòng ban dạng bitset: với mỗi nhân viên, mỗi trạng thái là một số nguyên trong đó
+bit (d - 1) bật nghĩa là ngày d của tháng có trạng thái đó.
+
+    {"employee": 12, "present": 1048575, "late": 4, "leave": 0, "absent": 0, "incomplete": 0}
+
+Các bitset được tính trong DB bằng một truy vấn GROUP BY nhân viên (SUM(1 << (DAY(date) - 1))
+theo điều kiện; mỗi nhân viên có tối đa một dòng mỗi ngày nên SUM bằng OR bit).
+
+Kết quả được cache theo (phòng ban, tháng, phiên bản dữ liệu). Mỗi lần ghi/xóa Attendance
+tăng phiên bản của phòng ban và tháng đó sau khi transaction commit, nên không cần xóa cache;
+thay đổi danh sách nhân viên của phòng ban được cập nhật khi cache hết hạn.
+"""
+
+import calendar
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Q, Sum, Value, When
+from django.db.models.functions import ExtractDay
+
+from . import business_calendar
+
+CALENDAR_CACHE_SECONDS = 600
+VERSION_CACHE_SECONDS = 60 * 60 * 24 * 45
+MASKS = (
+    ('present', Q(status__in=('checked_in', 'on_break', 'checked_out'))),
+    ('late', Q(late_arrival=True)),
+    ('leave', Q(status='on_leave')),
+    ('absent', Q(status='absent')),
+    ('incomplete', Q(status='incomplete')),
+)
+
+
+def _version_key(department_id, month):
+    return f"attendance-calendar-version:{department_id}:{month:%Y-%m}"
+
+
+def data_version(department_id, month):
+    """Phiên bản dữ liệu hiện tại; khởi tạo bằng thời điểm hiện tại nếu chưa có (hoặc đã bị evict)"""
+    key = _version_key(department_id, month)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_CACHE_SECONDS)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(department_id, day):
+    """Tăng phiên bản của (phòng ban, tháng) sau khi transaction commit"""
+    if not department_id:
+        return
+    key = _version_key(department_id, day)
+
+    def apply():
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Chưa có phiên bản: lần đọc sau khởi tạo phiên bản mới, khác mọi phiên bản cũ
+            pass
+
+    transaction.on_commit(apply)
+
+
+def bump_versions(employee_ids, day):
+    """bump_version cho các phòng ban của nhiều nhân viên (job đóng ngày)"""
+    from .models import Employee
+    department_ids = Employee.objects.filter(id__in=employee_ids).values_list('department_id', flat=True).distinct()
+    for department_id in department_ids:
+        bump_version(department_id, day)
+
+
+def build_calendar(department_id, month):
+    """Lưới tháng của phòng ban: một truy vấn nhân viên và một truy vấn aggregate Attendance"""
+    from .models import Attendance, Employee
+
+    first = month.replace(day=1)
+    days = calendar.monthrange(first.year, first.month)[1]
+    last = first.replace(day=days)
+
+    bit = Value(1, output_field=BigIntegerField()).bitleftshift(ExtractDay('date') - 1)
+    masks = Attendance.objects.filter(
+        employee__department_id=department_id, date__range=(first, last),
+    ).values('employee_id').annotate(**{
+        name: Sum(Case(When(condition, then=bit), default=Value(0), output_field=BigIntegerField()))
+        for name, condition in MASKS
+    }).order_by()
+    by_employee = {row.pop('employee_id'): row for row in masks}
+
+    employees = []
+    for employee in Employee.objects.filter(department_id=department_id).order_by('employee_id').values(
+        'id', 'employee_id', 'user__first_name', 'user__last_name', 'status',
+    ):
+        row = by_employee.get(employee['id'], {})
+        if employee['status'] != 'active' and not row:
+            continue
+        entry = {
+            'employee': employee['id'],
+            'employee_id': employee['employee_id'],
+            'name': f"{employee['user__first_name']} {employee['user__last_name']}",
+        }
+        # MySQL trả SUM dạng Decimal
+        entry.update({name: int(row.get(name) or 0) for name, _ in MASKS})
+        employees.append(entry)
+
+    working_days = 0
+    for day in range(1, days + 1):
+        if business_calendar.is_working_day(first.replace(day=day)):
+            working_days |= 1 << (day - 1)
+
+    return {
+        'department': department_id,
+        'month': f"{first:%Y-%m}",
+        'days': days,
+        'working_days': working_days,
+        'masks': [name for name, _ in MASKS],
+        'employees': employees,
+    }
+
+
+def get_calendar(department_id, month):
+    """build_calendar qua cache theo (phòng ban, tháng, phiên bản dữ liệu)"""
+    version = data_version(department_id, month)
+    key = f"attendance-calendar:{department_id}:{month:%Y-%m}:{version}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_calendar(department_id, month)
+        payload['version'] = version
+        cache.set(key, payload, CALENDAR_CACHE_SECONDS)
+    return payload
@@ -0,0 +1,113 @@
+"""
+Attendance live counters
+========================
+
+Bộ đếm chấm công trong ngày cho dashboard (AttendanceViewSet.stats), giữ trong Django cache:
+
+- toàn công ty: attendance-counters:<ngày>:org:<tên>
+- theo phòng ban: attendance-counters:<ngày>:department:<id>:<tên>
+
+Lần đọc đầu dựng bộ đếm bằng một truy vấn aggregate. Sau đó mỗi lần ghi Attendance
+(punch, ngày nghỉ phép...) cộng phần chênh lệch giữa trạng thái mới và trạng thái đã đọc
+từ DB bằng cache.incr sau khi transaction commit, nên dashboard không quét lại bảng.
+Bộ đếm hết hạn sau COUNTER_CACHE_SECONDS để tự sửa các thay đổi ngoài ORM (update()).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, Q, Sum
+
+COUNTER_CACHE_SECONDS = 300
+COUNTERS = ('total_present', 'checked_out', 'late_arrivals', 'on_break', 'completed_count', 'completed_microseconds')
+PRESENT_STATUSES = ('checked_in', 'on_break', 'checked_out')
+
+
+def enabled():
+    return getattr(settings, 'ATTENDANCE_LIVE_COUNTERS', True)
+
+
+def _prefix(day, department_id=None):
+    scope = f"department:{department_id}" if department_id else 'org'
+    return f"attendance-counters:{day.isoformat()}:{scope}"
+
+
+def aggregate(queryset):
+    """Các bộ đếm của queryset Attendance trong một truy vấn (kèm average_hours tính trong DB)"""
+    completed = Q(status='checked_out', total_hours__isnull=False)
+    row = queryset.aggregate(
+        total_present=Count('id', filter=Q(status__in=PRESENT_STATUSES)),
+        checked_out=Count('id', filter=Q(status='checked_out')),
+        late_arrivals=Count('id', filter=Q(late_arrival=True)),
+        on_break=Count('id', filter=Q(status='on_break')),
+        completed_count=Count('id', filter=completed),
+        completed_total=Sum('total_hours', filter=completed),
+        average_total=Avg('total_hours', filter=completed),
+    )
+    total, average = row.pop('completed_total'), row.pop('average_total')
+    row['completed_microseconds'] = total // timedelta(microseconds=1) if total else 0
+    row['average_hours'] = average.total_seconds() / 3600 if average else 0
+    return row
+
+
+def get_counters(day, department_id=None):
+    """Bộ đếm của ngày (toàn công ty hoặc một phòng ban), dựng lại từ DB nếu chưa có trong cache"""
+    prefix = _prefix(day, department_id)
+    keys = {name: f"{prefix}:{name}" for name in COUNTERS}
+    cached = cache.get_many(keys.values())
+    if len(cached) == len(keys):
+        counters = {name: cached[key] for name, key in keys.items()}
+        completed = counters['completed_count']
+        counters['average_hours'] = counters['completed_microseconds'] / completed / 3_600_000_000 if completed else 0
+        return counters
+
+    from .models import Attendance
+    queryset = Attendance.objects.filter(date=day)
+    if department_id:
+        queryset = queryset.filter(employee__department_id=department_id)
+    counters = aggregate(queryset)
+    cache.set_many({keys[name]: counters[name] for name in COUNTERS}, COUNTER_CACHE_SECONDS)
+    return counters
+
+
+def contribution(attendance):
+    """Phần một dòng Attendance đóng góp vào từng bộ đếm (cùng điều kiện với aggregate())"""
+    completed = attendance.status == 'checked_out' and attendance.total_hours is not None
+    return (
+        int(attendance.status in PRESENT_STATUSES),
+        int(attendance.status == 'checked_out'),
+        int(bool(attendance.late_arrival)),
+        int(attendance.status == 'on_break'),
+        int(completed),
+        attendance.total_hours // timedelta(microseconds=1) if completed else 0,
+    )
+
+
+def record_change(day, department_id, previous, current):
+    """
+    Cộng (current - previous) vào bộ đếm sau khi transaction commit.
+    previous = None: không biết trạng thái cũ → xóa bộ đếm để lần đọc sau dựng lại.
+    """
+    prefixes = [_prefix(day)] + ([_prefix(day, department_id)] if department_id else [])
+    if previous is None:
+        keys = [f"{prefix}:{name}" for prefix in prefixes for name in COUNTERS]
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        return
+
+    delta = {name: new - old for name, new, old in zip(COUNTERS, current, previous) if new != old}
+    if not delta:
+        return
+
+    def apply():
+        for prefix in prefixes:
+            for name, amount in delta.items():
+                try:
+                    cache.incr(f"{prefix}:{name}", amount)
+                except ValueError:
+                    # Bộ đếm chưa được dựng (hoặc đã hết hạn): lần đọc sau sẽ dựng từ DB
+                    pass
+
+    transaction.on_commit(apply)
@@ -0,0 +1,312 @@
+"""
+Attendance projection
+=====================
+
+Mỗi punch (check-in, break, check-out) chỉ là một INSERT vào AttendanceEvent.
+Projector gấp (fold) các event của từng (nhân viên, ngày) vào dòng Attendance theo
+cùng state machine với các action của AttendanceViewSet, theo lô và trong một transaction.
+
+- Event mới không cũ hơn trạng thái đã chiếu: áp tiếp lên dòng Attendance hiện tại
+- Event đến trễ (cũ hơn trạng thái đã chiếu) hoặc rebuild: gấp lại cả ngày từ đầu
+- rebuild() dùng khi đổi luật chấm công: chiếu lại chính xác từ nhật ký
+
+settings.ATTENDANCE_PROJECTION:
+- 'sync' (mặc định): chiếu ngay trong request, response có trạng thái mới
+- 'background': chiếu trong thread nền của process sau khi transaction commit
+- 'worker': chỉ ghi event; lệnh `manage.py project_attendance_events --loop` chiếu
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytz
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendanceEvent, AttendanceMonthlySummary, Employee, LeaveDay
+
+VIETNAM_TZ = pytz.timezone('Asia/Ho_Chi_Minh')
+PUNCH_TYPES = ('check_in', 'start_break', 'end_break', 'check_out')
+NO_RECORD_ERROR = 'No check-in record found for today'
+PROJECTION_BATCH_SIZE = 500
+
+WRITE_FIELDS = [
+    'check_in', 'check_out', 'break_start', 'break_end', 'break_duration', 'total_hours',
+    'overtime_hours', 'status', 'location', 'late_arrival', 'early_departure', 'updated_at',
+]
+
+_background = ThreadPoolExecutor(max_workers=1)
+
+
+def projection_mode():
+    return getattr(settings, 'ATTENDANCE_PROJECTION', 'sync')
+
+
+def to_vietnam_time(value):
+    """datetime theo giờ Việt Nam (timestamp không có múi giờ coi như đã là giờ Việt Nam)"""
+    if timezone.is_naive(value):
+        return VIETNAM_TZ.localize(value)
+    return value.astimezone(VIETNAM_TZ)
+
+
+def local_time(event):
+    return event.timestamp.astimezone(VIETNAM_TZ).time()
+
+
+def _elapsed(day, start, end):
+    return datetime.combine(day, end) - datetime.combine(day, start)
+
+
+def apply_punch(attendance, punch_type, at_time, location='', approved_leave=None):
+    """
+    Áp một punch vào attendance theo đúng luật của các action trong AttendanceViewSet.
+    Trả về None nếu đã áp dụng, ngược lại là thông báo lỗi (attendance không bị đổi).
+    """
+    if punch_type == 'check_in':
+        if approved_leave:
+            return f'Cannot check in while on {approved_leave.leave_type.name} leave'
+        if attendance.status == 'on_leave':
+            return 'Cannot check in while on leave'
+        if attendance.status == 'checked_out':
+            return 'Already completed attendance for today'
+        if not attendance.can_check_in():
+            return 'Already checked in today'
+        attendance.check_in = at_time
+        attendance.status = 'checked_in'
+        attendance.location = location
+        return None
+
+    if attendance.status == 'not_started' and attendance.check_in is None:
+        return NO_RECORD_ERROR
+
+    if punch_type == 'start_break':
+        if not attendance.can_start_break():
+            return f'Cannot start break. Current status: {attendance.get_status_display()}'
+        attendance.break_start = at_time
+        attendance.status = 'on_break'
+        return None
+
+    if punch_type == 'end_break':
+        if not attendance.can_end_break():
+            return f'Cannot end break. Current status: {attendance.get_status_display()}'
+        attendance.break_end = at_time
+        attendance.status = 'checked_in'
+        if attendance.break_start:
+            attendance.break_duration += _elapsed(attendance.date, attendance.break_start, at_time)
+        return None
+
+    # check_out
+    if not attendance.can_check_out():
+        return f'Cannot check out. Current status: {attendance.get_status_display()}'
+    if attendance.check_out:
+        return 'Already checked out today'
+    if attendance.status == 'on_break':
+        attendance.break_end = at_time
+        if attendance.break_start:
+            attendance.break_duration += _elapsed(attendance.date, attendance.break_start, at_time)
+    attendance.check_out = at_time
+    attendance.status = 'checked_out'
+    return None
+
+
+def latest_punch_time(attendance):
+    times = [attendance.check_in, attendance.break_start, attendance.break_end, attendance.check_out]
+    times = [value for value in times if value is not None]
+    return max(times) if times else None
+
+
+def reset_punches(attendance):
+    """Xóa phần do punch tạo ra, giữ lịch làm việc, ghi chú và trạng thái nghỉ phép"""
+    attendance.check_in = attendance.check_out = None
+    attendance.break_start = attendance.break_end = None
+    attendance.break_duration = timedelta(hours=0)
+    attendance.total_hours = None
+    attendance.overtime_hours = timedelta(hours=0)
+    attendance.late_arrival = attendance.early_departure = False
+    attendance.location = ''
+    attendance.status = 'on_leave' if attendance.status == 'on_leave' else 'not_started'
+
+
+def fold_day(attendance, events, approved_leave=None, refold=False):
+    """
+    Gấp các event (đã sắp theo thời gian) của một ngày vào attendance.
+    Trả về các event có kết quả (status / error) thay đổi.
+    """
+    pending = [event for event in events if event.status == 'pending']
+    latest = latest_punch_time(attendance)
+    auto_closed = attendance.status in Attendance.AUTO_CLOSED_STATUSES
+    if not refold and pending and not auto_closed and (latest is None or local_time(pending[0]) >= latest):
+        to_apply = pending
+    else:
+        reset_punches(attendance)
+        to_apply = events
+
+    changed = []
+    for event in to_apply:
+        leave = approved_leave if event.type == 'check_in' else None
+        error = apply_punch(attendance, event.type, local_time(event), event.location, leave) or ''
+        outcome = 'rejected' if error else 'applied'
+        if (event.status, event.error) != (outcome, error):
+            event.status, event.error = outcome, error[:255]
+            changed.append(event)
+
+    # Ngày đã đóng sổ vẫn đóng: chưa check-out thì incomplete, chưa check-in thì absent
+    if auto_closed and attendance.status in ('not_started', 'checked_in', 'on_break'):
+        attendance.status = 'incomplete' if attendance.check_in else 'absent'
+    return changed
+
+
+def _event_order(event):
+    # Cùng thời điểm thì áp theo thứ tự tự nhiên của một ngày làm việc
+    return event.timestamp, PUNCH_TYPES.index(event.type), event.id or 0
+
+
+def project_days(keys, refold=False):
+    """
+    Chiếu event của các (employee_id, date) vào Attendance trong một transaction.
+    Trả về {(employee_id, date): (attendance, events)}.
+    """
+    keys = set(keys)
+    if not keys:
+        return {}
+    employee_ids = {employee_id for employee_id, _ in keys}
+    days = {day for _, day in keys}
+    projected = {}
+
+    with transaction.atomic(), AttendanceMonthlySummary.batch_refresh():
+        # Khóa event của các ngày này để hai projector không chiếu cùng một ngày song song
+        events = {}
+        queryset = AttendanceEvent.objects.select_for_update().filter(employee_id__in=employee_ids, date__in=days)
+        for event in queryset:
+            key = (event.employee_id, event.date)
+            if key in keys:
+                events.setdefault(key, []).append(event)
+
+        rows = {
+            (attendance.employee_id, attendance.date): attendance
+            for attendance in Attendance.objects.select_for_update().select_related('employee__user').filter(
+                employee_id__in=employee_ids, date__in=days,
+            )
+            if (attendance.employee_id, attendance.date) in keys
+        }
+        missing = {employee_id for employee_id, day in events if (employee_id, day) not in rows}
+        employees = Employee.objects.select_related('user').in_bulk(missing) if missing else {}
+        leaves = LeaveDay.approved_on(keys)
+
+        changed_rows, changed_events = [], []
+        for key, day_events in events.items():
+            if not refold and not any(event.status == 'pending' for event in day_events):
+                continue
+            day_events.sort(key=_event_order)
+            attendance = rows.get(key)
+            if attendance is None:
+                attendance = Attendance(
+                    employee=employees[key[0]],
+                    date=key[1],
+                    break_duration=timedelta(hours=0),
+                    overtime_hours=timedelta(hours=0),
+                )
+            changed_events.extend(fold_day(attendance, day_events, leaves.get(key), refold))
+            # Không tạo dòng Attendance chỉ từ các punch bị từ chối
+            if attendance.pk or attendance.check_in:
+                changed_rows.append(attendance)
+            projected[key] = (attendance, day_events)
+
+        write_attendance_rows(changed_rows)
+        if changed_events:
+            AttendanceEvent.objects.bulk_update(changed_events, ['status', 'error'])
+
+    return projected
+
+
+def write_attendance_rows(rows):
+    """Ghi các Attendance đã đổi: upsert dòng mới theo (employee, date), bulk_update dòng cũ"""
+    now = timezone.now()
+    created, updated = [], []
+    for attendance in rows:
+        attendance.compute_derived_fields()
+        attendance.updated_at = now
+        (updated if attendance.pk else created).append(attendance)
+
+    if created:
+        # MySQL (ON DUPLICATE KEY UPDATE) tự dùng unique (employee, date), không nhận unique_fields
+        target = {'unique_fields': ['employee', 'date']} if connection.features.supports_update_conflicts_with_target else {}
+        Attendance.objects.bulk_create(created, update_conflicts=True, update_fields=WRITE_FIELDS, **target)
+        if any(attendance.pk is None for attendance in created):
+            ids = {
+                (employee_id, day): pk
+                for employee_id, day, pk in Attendance.objects.filter(
+                    employee_id__in={attendance.employee_id for attendance in created},
+                    date__in={attendance.date for attendance in created},
+                ).values_list('employee_id', 'date', 'id')
+            }
+            for attendance in created:
+                attendance.pk = ids.get((attendance.employee_id, attendance.date))
+    if updated:
+        Attendance.objects.bulk_update(updated, WRITE_FIELDS)
+
+    for attendance in created:
+        attendance.after_write(created=True)
+    for attendance in updated:
+        attendance.after_write()
+
+
+def record_punch(employee, punch_type, moment, location='', source='web'):
+    """
+    Ghi một punch (một INSERT). Trả về (event, attendance); attendance là None nếu
+    việc chiếu được giao cho thread nền / worker.
+    """
+    moment = to_vietnam_time(moment)
+    event = AttendanceEvent.objects.create(
+        employee=employee,
+        date=moment.date(),
+        timestamp=moment,
+        type=punch_type,
+        location=location or '',
+        source=source,
+    )
+    if projection_mode() != 'sync':
+        schedule_projection()
+        return event, None
+
+    attendance, events = project_days({(employee.id, event.date)})[(employee.id, event.date)]
+    return next(projected for projected in events if projected.pk == event.pk), attendance
+
+
+def schedule_projection():
+    """Ở chế độ 'background', chiếu các event đang chờ sau khi transaction hiện tại commit"""
+    if projection_mode() == 'background':
+        transaction.on_commit(lambda: _background.submit(_project_in_background))
+
+
+def _project_in_background():
+    try:
+        while project_pending():
+            pass
+    finally:
+        connections.close_all()
+
+
+def project_pending(batch_size=PROJECTION_BATCH_SIZE):
+    """Chiếu một lô event đang chờ (theo thứ tự ghi). Trả về số ngày đã chiếu"""
+    keys = set(
+        AttendanceEvent.objects.filter(status='pending').order_by('id').values_list('employee_id', 'date')[:batch_size]
+    )
+    return len(project_days(keys))
+
+
+def rebuild(start=None, end=None, employee_ids=None, batch_size=PROJECTION_BATCH_SIZE):
+    """Gấp lại từ đầu mọi ngày có event trong [start, end]. Trả về số ngày đã chiếu lại"""
+    queryset = AttendanceEvent.objects.all()
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    if employee_ids:
+        queryset = queryset.filter(employee_id__in=employee_ids)
+    keys = list(queryset.order_by('date', 'employee_id').values_list('employee_id', 'date').distinct())
+
+    for offset in range(0, len(keys), batch_size):
+        project_days(keys[offset:offset + batch_size], refold=True)
+    return len(keys)
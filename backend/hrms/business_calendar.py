@@ -0,0 +1,105 @@
+"""
+Business calendar
+=================
+
+Lịch ngày làm việc dùng chung cho chấm công, nghỉ phép và tính lương.
+Ngày làm việc = Thứ Hai..Thứ Sáu và không nằm trong bảng Holiday.
+
+Mỗi năm được tính sẵn một lần thành:
+- bitmap: số nguyên, bit i bật nếu ngày thứ i của năm (0 = 1/1) là ngày làm việc
+- prefix: prefix[i] = số ngày làm việc trong i ngày đầu năm
+
+nên đếm số ngày làm việc giữa hai ngày bất kỳ là O(1) mỗi năm đi qua, không cần
+duyệt từng ngày. Bộ nhớ tạm được xóa khi Holiday thay đổi (signal) và tự hết hạn
+sau YEAR_CACHE_SECONDS để các process khác cũng thấy ngày lễ mới.
+"""
+
+import time
+from datetime import date, timedelta
+from threading import Lock
+
+YEAR_CACHE_SECONDS = 300
+
+_years = {}
+_years_lock = Lock()
+
+
+def _build_year(year):
+    from .models import Holiday
+    holidays = set(Holiday.objects.filter(date__year=year).values_list('date', flat=True))
+    first_day = date(year, 1, 1)
+    size = (date(year + 1, 1, 1) - first_day).days
+    bitmap = 0
+    prefix = [0] * (size + 1)
+    for i in range(size):
+        day = first_day + timedelta(days=i)
+        working = day.weekday() < 5 and day not in holidays
+        if working:
+            bitmap |= 1 << i
+        prefix[i + 1] = prefix[i] + working
+    return bitmap, prefix
+
+
+def year_calendar(year):
+    """(bitmap, prefix) của năm, tính sẵn và giữ trong bộ nhớ"""
+    now = time.monotonic()
+    with _years_lock:
+        cached = _years.get(year)
+    if cached is not None and now - cached[0] < YEAR_CACHE_SECONDS:
+        return cached[1]
+    built = _build_year(year)
+    with _years_lock:
+        _years[year] = (now, built)
+    return built
+
+
+def clear_cache():
+    """Bỏ các năm đã tính sẵn (gọi khi bảng Holiday thay đổi)"""
+    with _years_lock:
+        _years.clear()
+
+
+def _day_index(day):
+    return day.toordinal() - date(day.year, 1, 1).toordinal()
+
+
+def is_working_day(day):
+    bitmap, _ = year_calendar(day.year)
+    return bool(bitmap >> _day_index(day) & 1)
+
+
+def count_working_days(start, end):
+    """Số ngày làm việc trong [start, end] (tính cả hai đầu); 0 nếu start > end"""
+    if start > end:
+        return 0
+    total = 0
+    for year in range(start.year, end.year + 1):
+        _, prefix = year_calendar(year)
+        first = _day_index(start) if year == start.year else 0
+        last = _day_index(end) if year == end.year else len(prefix) - 2
+        total += prefix[last + 1] - prefix[first]
+    return total
+
+
+def count_working_days_until(start, end, today=None):
+    """Số ngày làm việc trong [start, end] nhưng không tính các ngày sau hôm nay"""
+    today = today or date.today()
+    return count_working_days(start, min(end, today))
+
+
+def working_days(start, end):
+    """Danh sách ngày làm việc trong [start, end], lấy từ các bit đang bật của bitmap"""
+    days = []
+    for year in range(start.year, end.year + 1):
+        bitmap, prefix = year_calendar(year)
+        first = _day_index(start) if year == start.year else 0
+        last = _day_index(end) if year == end.year else len(prefix) - 2
+        if first > last:
+            continue
+        bits = bitmap >> first & ((1 << (last - first + 1)) - 1)
+        base = date(year, 1, 1).toordinal() + first
+        while bits:
+            low = bits & -bits
+            days.append(date.fromordinal(base + low.bit_length() - 1))
+            bits ^= low
+    return days
@@ -2,18 +2,23 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from django.core.cache import cache
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework_simplejwt.tokens import RefreshToken
 from datetime import date, timedelta, time, datetime
 from decimal import Decimal
+from io import BytesIO, StringIO
 
 from hrms.models import (
-    Employee, Department, Position, Attendance, 
-    LeaveRequest, LeaveType, Performance
+    Employee, Department, Position, Attendance, AttendanceEvent, AttendanceMonthlySummary,
+    LeaveAccrualRun, LeaveBalance, LeaveDay, LeaveLedgerEntry, LeaveRequest, LeaveType, LeavePenalty, Performance, Holiday
 )
+from hrms import attendance_projection, business_calendar, leave_accrual, leave_calendar
+from hrms.serializers import AttendanceListRenderer, AttendanceSerializer
 from payroll.models import SalaryRecord
 from payroll.services import PayrollService
+from payroll.batch import BatchPayrollService
 
 
 class ModelIntegrityTest(TestCase):
@@ -424,6 +429,196 @@ class LeaveAttendanceIntegrationTest(TestCase):
         self.assertEqual(attendance.status, 'not_started')
         self.assertIsNone(attendance.leave_request)
 
+    def test_bulk_respond_checks_balance_in_request_order(self):
+        """Duyệt hàng loạt: trừ ngày phép theo thứ tự gửi đơn, đơn vượt số dư / không còn pending báo lỗi"""
+        requests = [
+            LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type, start_date=start,
+                                        end_date=start + timedelta(days=4), reason="Vacation", status='pending')
+            for start in (date(2025, 3, 3), date(2025, 3, 10), date(2025, 3, 17))
+        ]
+        closed = LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type,
+                                             start_date=date(2025, 3, 24), end_date=date(2025, 3, 24),
+                                             reason="Vacation", status='rejected')
+
+        ids = [request.id for request in requests] + [closed.id, 999999]
+        results = LeaveRequest.bulk_respond(ids, 'approved', self.manager)
+
+        self.assertEqual([result['status'] for result in results],
+                         ['approved', 'approved', 'failed', 'failed', 'not_found'])
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.annual_leave_remaining, 2)
+        self.assertEqual(Attendance.objects.filter(employee=self.employee, status='on_leave').count(), 10)
+        self.assertEqual(LeaveRequest.objects.get(pk=requests[2].pk).status, 'pending')
+
+        results = LeaveRequest.bulk_respond([requests[2].id], 'rejected', self.manager, comments='Coverage')
+        self.assertEqual(results, [{'id': requests[2].id, 'status': 'rejected'}])
+        self.assertEqual(LeaveRequest.objects.get(pk=requests[2].pk).approved_by, self.manager)
+
+    def test_overlapping_leave_requests_are_rejected(self):
+        """Đơn còn hiệu lực không được trùng ngày; LeaveDay trả lời "đang nghỉ ngày X" theo unique index"""
+        def leave(start, end):
+            return LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type, start_date=start,
+                                               end_date=end, reason="Trip", status='pending')
+
+        first = leave(date(2025, 3, 3), date(2025, 3, 5))
+        with self.assertRaises(ValidationError):
+            leave(date(2025, 3, 5), date(2025, 3, 6))
+
+        first.status = 'rejected'
+        first.save()
+        self.assertFalse(LeaveDay.objects.filter(leave_request=first).exists())
+
+        second = leave(date(2025, 3, 5), date(2025, 3, 6))
+        self.assertEqual(LeaveDay.approved_on([(self.employee.id, date(2025, 3, 5))]), {})
+        LeaveRequest.bulk_respond([second.id], 'approved', self.manager)
+        self.assertEqual(LeaveDay.approved_on([(self.employee.id, date(2025, 3, 5))]),
+                         {(self.employee.id, date(2025, 3, 5)): second})
+        self.assertEqual(LeaveDay.objects.filter(leave_request=second, status='approved').count(), 2)
+
+    def test_team_calendar_expands_requests_per_day(self):
+        """Lịch nghỉ phòng ban: mỗi ngày liệt kê nhân viên nghỉ và loại phép, cache theo phiên bản"""
+        cache.clear()
+        leave_request = LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type,
+                                                    start_date=date(2025, 2, 27), end_date=date(2025, 3, 3),
+                                                    reason="Trip", status='pending')
+        calendar = leave_calendar.get_team_calendar(self.department.id, date(2025, 3, 1), date(2025, 3, 31))
+
+        column = [employee['id'] for employee in calendar['employees']].index(self.employee.id)
+        self.assertEqual(calendar['legend'], [{'leave_type': self.leave_type.id, 'leave_type_name': 'Annual Leave',
+                                               'status': 'pending'}])
+        self.assertEqual([day['date'] for day in calendar['days']], ['2025-03-01', '2025-03-02', '2025-03-03'])
+        self.assertEqual(calendar['days'][0]['leaves'], [[column, 0]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            LeaveRequest.bulk_respond([leave_request.id], 'approved', self.manager)
+        updated = leave_calendar.get_team_calendar(self.department.id, date(2025, 3, 1), date(2025, 3, 31))
+        self.assertNotEqual(updated['version'], calendar['version'])
+        self.assertEqual(updated['legend'][0]['status'], 'approved')
+
+        # Manager chỉ xem được lịch nghỉ của phòng ban mình
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.manager_user)
+        url = '/api/leave-requests/team_calendar/?start=2025-03-01&end=2025-03-31'
+        self.assertEqual(client.get(url).status_code, status.HTTP_200_OK)
+        other = Department.objects.create(name="Sales")
+        self.assertEqual(client.get(f'{url}&department={other.id}').status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unpaid_and_monthly_leave_is_approved_before_any_accrual_run(self):
+        """Loại 'none' không kiểm tra số dư; loại cấp theo tháng được ghi trước các kỳ đã qua khi duyệt đơn"""
+        unpaid = LeaveType.objects.create(name="Unpaid Leave", code="UL", accrual_method='none', max_days_per_year=0)
+        sick = LeaveType.objects.create(name="Sick Leave", code="SL", accrual_method='monthly', max_days_per_year=12)
+
+        def approve(leave_type, start, end):
+            leave_request = LeaveRequest.objects.create(employee=self.employee, leave_type=leave_type, start_date=start,
+                                                        end_date=end, reason="Trip", status='pending')
+            leave_request.status = 'approved'
+            leave_request.approved_by = self.manager
+            leave_request.response_date = timezone.now()
+            leave_request.save()
+
+        approve(unpaid, date(2024, 3, 4), date(2024, 3, 8))
+        approve(sick, date(2024, 4, 1), date(2024, 4, 3))
+        balance = LeaveBalance.objects.get(employee=self.employee, leave_type=sick, year=2024)
+        self.assertEqual((balance.accrued, balance.used), (12, 3))
+        self.assertEqual(LeaveBalance.objects.get(employee=self.employee, leave_type=unpaid, year=2024).used, 5)
+
+        # Các kỳ đã ghi khi duyệt đơn không bị cấp lại
+        run = leave_accrual.accrue_leave_type(sick, date(2024, 5, 1))
+        self.assertEqual((run.accrual_entries, run.skipped), (1, 1))
+
+    def test_yearly_opening_matches_accrual_run(self):
+        """Cấp phép mở đầu của loại cấp theo năm tính theo tỷ lệ với nhân viên mới và không vượt max_balance"""
+        yearly = LeaveType.objects.create(name="Study Leave", code="ST", accrual_method='yearly', max_days_per_year=12)
+        (entry,) = leave_accrual.opening_entries(yearly, self.employee.id, date(2024, 7, 1), 2024)
+        self.assertEqual((entry.period, entry.days), ('2024', Decimal('6.03')))
+        self.assertEqual(leave_accrual.opening_entries(yearly, self.employee.id, date(2025, 1, 1), 2024), [])
+
+        yearly.max_balance = Decimal('5')
+        yearly.prorate_new_hires = False
+        (entry,) = leave_accrual.opening_entries(yearly, self.employee.id, date(2024, 7, 1), 2024)
+        self.assertEqual(entry.days, Decimal('5'))
+
+    def test_balances_endpoint_is_limited_to_manager_department(self):
+        """Manager xem số dư của nhân viên trong phòng ban mình, không xem được phòng ban khác"""
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.manager_user)
+        response = client.get(f'/api/leave-requests/balances/?employee={self.employee.id}&year=2025')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['leave_type'] for row in response.data], [self.leave_type.id])
+
+        outsider = Employee.objects.create(
+            user=User.objects.create_user(username="outsider", password="testpass"),
+            employee_id="EMP009",
+            phone_number="+1234567899",
+            address="Sales Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=Department.objects.create(name="Sales"),
+            position=self.position,
+            salary=Decimal('60000.00')
+        )
+        response = client.get(f'/api/leave-requests/balances/?employee={outsider.id}&year=2025')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_accrual_engine_is_idempotent_and_carries_over(self):
+        """Cấp phép theo chính sách: một lần mỗi kỳ, chuyển số dư năm cũ có giới hạn, không vượt max_balance"""
+        self.leave_type.carry_over_max = 5
+        self.leave_type.save()
+        (run,) = leave_accrual.run_accruals(date(2024, 1, 1), [self.leave_type])
+        self.assertEqual((run.employees, run.accrual_entries, run.accrued_days), (2, 2, 24))
+        leave_request = LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type,
+                                                    start_date=date(2024, 3, 4), end_date=date(2024, 3, 6),
+                                                    reason="Trip", status='pending')
+        LeaveRequest.bulk_respond([leave_request.id], 'approved', self.manager)
+        self.assertEqual(leave_accrual.run_accruals(date(2024, 2, 1), [self.leave_type])[0].skipped, 2)
+
+        run = leave_accrual.accrue_leave_type(self.leave_type, date(2025, 1, 1))
+        self.assertEqual((run.carry_over_entries, run.carried_days, run.accrual_entries), (2, 10, 2))
+        balance = LeaveBalance.objects.get(employee=self.employee, leave_type=self.leave_type, year=2025)
+        self.assertEqual(balance.remaining, 17)
+        self.employee.refresh_from_db()
+        self.assertEqual(self.employee.annual_leave_remaining, 17)
+
+        rerun = leave_accrual.accrue_leave_type(self.leave_type, date(2025, 1, 1))
+        self.assertEqual((rerun.accrual_entries, rerun.carry_over_entries), (0, 0))
+        self.assertEqual(LeaveAccrualRun.objects.count(), 4)
+
+        sick = LeaveType.objects.create(name="Sick Leave", code="SL", accrual_method='monthly', max_balance=2)
+        for month in (3, 4, 5):
+            leave_accrual.accrue_leave_type(sick, date(2025, month, 1))
+        self.assertEqual(LeaveBalance.objects.get(employee=self.employee, leave_type=sick, year=2025).remaining, 2)
+
+    def test_leave_ledger_tracks_balance_per_type_and_year(self):
+        """Duyệt ghi usage, từ chối đơn đã duyệt ghi reversal; số dư dựng lại được từ sổ cái"""
+        leave_request = LeaveRequest.objects.create(employee=self.employee, leave_type=self.leave_type,
+                                                    start_date=date(2025, 3, 3), end_date=date(2025, 3, 5),
+                                                    reason="Vacation", status='pending')
+        leave_request.status = 'approved'
+        leave_request.response_date = timezone.now()
+        leave_request.approved_by = self.manager
+        leave_request.save()
+
+        balance = LeaveBalance.objects.get(employee=self.employee, leave_type=self.leave_type, year=2025)
+        self.assertEqual((balance.accrued, balance.used, balance.remaining), (12, 3, 9))
+
+        too_long = LeaveRequest(employee=self.employee, leave_type=self.leave_type, start_date=date(2025, 4, 1),
+                                end_date=date(2025, 4, 14), reason="Long trip", status='approved')
+        with self.assertRaises(ValidationError):
+            too_long.full_clean()
+
+        leave_request.status = 'rejected'
+        leave_request.save()
+        self.assertEqual(LeaveBalance.objects.get(pk=balance.pk).used, 0)
+        self.assertEqual(list(LeaveLedgerEntry.objects.filter(employee=self.employee).values_list('kind', 'days')),
+                         [('accrual', 12), ('usage', -3), ('reversal', 3)])
+
+        LeaveBalance.objects.all().delete()
+        self.assertEqual(LeaveBalance.rebuild(year=2025), 1)
+        rebuilt = LeaveBalance.objects.get(employee=self.employee, leave_type=self.leave_type, year=2025)
+        self.assertEqual((rebuilt.accrued, rebuilt.used), (12, 0))
+
 
 class PayrollIntegrationTest(TestCase):
     """Test payroll system integration with attendance"""
@@ -853,6 +1048,7 @@ class AttendanceAPITest(APITestCase):
         # Authenticate user
         refresh = RefreshToken.for_user(self.user)
         self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        cache.clear()
 
     def test_attendance_check_in(self):
         """Test attendance check-in API"""
@@ -888,6 +1084,201 @@ class AttendanceAPITest(APITestCase):
         self.assertIn('can_check_out', response.data)
         self.assertIn('current_time', response.data)
 
+    def test_current_status_cached_until_punch(self):
+        """current_status is served from cache with ETag and refreshed after check-in"""
+        first = self.client.get('/api/attendance/current_status/')
+        self.assertTrue(first.data['can_check_in'])
+        etag = first['ETag']
+
+        with self.assertNumQueries(2):  # chỉ xác thực user + employee, không query chấm công
+            cached = self.client.get('/api/attendance/current_status/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post('/api/attendance/check_in/')
+        after = self.client.get('/api/attendance/current_status/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(after.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(after['ETag'], etag)
+        self.assertTrue(after.data['can_check_out'])
+
+    def test_punch_batch_is_ordered_and_idempotent(self):
+        """Lô punch từ máy chấm công: sắp theo thời gian, bỏ trùng, khớp state machine"""
+        self.employee.role = 'manager'
+        self.employee.save()
+        day = '2025-03-04'
+        punches = [
+            {'employee': self.employee.id, 'timestamp': f'{day}T17:30:00+07:00', 'type': 'check_out'},
+            {'employee': self.employee.id, 'timestamp': f'{day}T12:00:00+07:00', 'type': 'start_break'},
+            {'employee': self.employee.id, 'timestamp': f'{day}T08:55:00', 'type': 'check_in', 'location': 'Gate A'},
+            {'employee': self.employee.id, 'timestamp': f'{day}T06:00:00Z', 'type': 'end_break'},  # 13:00 giờ VN
+            {'employee': self.employee.id, 'timestamp': f'{day}T08:55:00+07:00', 'type': 'check_in'},
+            {'employee': self.employee.id, 'timestamp': f'{day}T09:00:00', 'type': 'lunch'},
+        ]
+
+        response = self.client.post('/api/attendance/punches/', {'punches': punches}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['applied', 'applied', 'applied', 'applied', 'duplicate', 'rejected'])
+
+        attendance = Attendance.objects.get(employee=self.employee, date=date(2025, 3, 4))
+        self.assertEqual(attendance.status, 'checked_out')
+        self.assertEqual(attendance.check_in, time(8, 55))
+        self.assertEqual(attendance.location, 'Gate A')
+        self.assertEqual(attendance.break_duration, timedelta(hours=1))
+        self.assertEqual(attendance.total_hours, timedelta(hours=7, minutes=35))
+        self.assertFalse(attendance.late_arrival)
+
+        # Gửi lại cả lô (gateway retry) không đổi gì
+        retry = self.client.post('/api/attendance/punches/', punches[:5], format='json')
+        self.assertEqual(retry.data['duplicate'], 5)
+        late = self.client.post('/api/attendance/punches/', [
+            {'employee': self.employee.id, 'timestamp': f'{day}T15:00:00', 'type': 'end_break'},
+        ], format='json')
+        self.assertEqual(late.data['rejected'], 1)
+        attendance.refresh_from_db()
+        self.assertEqual(attendance.total_hours, timedelta(hours=7, minutes=35))
+
+    def test_punch_batch_requires_manager(self):
+        response = self.client.post('/api/attendance/punches/', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stats_served_from_live_counters(self):
+        """Dashboard stats: một truy vấn aggregate, sau đó đọc bộ đếm trong cache"""
+        self.employee.role = 'manager'
+        self.employee.save()
+        today = timezone.localdate()
+        Attendance.objects.create(employee=self.employee, date=today, check_in=time(9, 30),
+                                  check_out=time(17, 30), break_duration=timedelta(hours=1))
+
+        with self.assertNumQueries(3):  # user + employee + một aggregate
+            first = self.client.get('/api/attendance/stats/')
+        self.assertEqual(first.data, {'total_present': 1, 'checked_out': 1, 'late_arrivals': 1,
+                                      'on_break': 0, 'average_hours': 7.0})
+
+        other_user = User.objects.create_user(username="otheruser", password="testpass123")
+        other = Employee.objects.create(
+            user=other_user,
+            employee_id="EMP002",
+            phone_number="+1234567899",
+            address="Test Address",
+            date_of_birth=date(1991, 1, 1),
+            hire_date=date(2023, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('60000.00')
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            attendance = Attendance.objects.create(employee=other, date=today, check_in=time(8, 45), status='checked_in')
+            attendance.status = 'on_break'
+            attendance.save()
+
+        with self.assertNumQueries(2):
+            second = self.client.get('/api/attendance/stats/')
+        self.assertEqual(second.data, {'total_present': 2, 'checked_out': 1, 'late_arrivals': 1,
+                                       'on_break': 1, 'average_hours': 7.0})
+        department = self.client.get('/api/attendance/stats/', {'department': self.department.id})
+        self.assertEqual(department.data, second.data)
+
+    def test_attendance_list_uses_keyset_pagination(self):
+        """List phân trang theo (date, id), mỗi dòng xuất hiện đúng một lần"""
+        for offset in range(5):
+            Attendance.objects.create(employee=self.employee, date=date(2025, 3, 3) + timedelta(days=offset),
+                                      check_in=time(8, 50), status='checked_in')
+
+        seen = []
+        url = '/api/attendance/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(row['date'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [str(date(2025, 3, 7) - timedelta(days=i)) for i in range(5)])
+
+        last_page = self.client.get(response.data['previous'])
+        self.assertEqual([row['date'] for row in last_page.data['results']], ['2025-03-05', '2025-03-04'])
+        self.assertEqual(self.client.get('/api/attendance/?cursor=bad').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_renderer_matches_serializer(self):
+        """AttendanceListRenderer (list / today) cho cùng output với AttendanceSerializer"""
+        self.employee.role = 'manager'
+        self.employee.save()
+        Attendance.objects.create(employee=self.employee, date=date(2025, 3, 3), check_in=time(8, 50),
+                                  status='checked_in', late_arrival=True)
+        Attendance.objects.create(employee=self.employee, date=date(2025, 3, 4), check_in=time(8, 0),
+                                  check_out=time(17, 30), break_duration=timedelta(minutes=45), status='checked_out')
+        Attendance.objects.create(employee=self.employee, date=date(2025, 3, 5), check_in=time(8, 0),
+                                  break_start=time(12, 0), status='on_break')
+        leave_type = LeaveType.objects.create(name="Annual Leave", code="AL", max_days_per_year=12)
+        leave_request = LeaveRequest.objects.create(
+            employee=self.employee, leave_type=leave_type, start_date=date(2025, 3, 6), end_date=date(2025, 3, 7),
+            reason="Test leave", status='pending',
+        )
+        leave_request.status = 'approved'
+        leave_request.approved_by = self.employee
+        leave_request.response_date = timezone.now()
+        leave_request.save()
+
+        queryset = Attendance.objects.filter(employee=self.employee)
+        self.assertEqual(queryset.filter(status='on_leave').count(), 2)
+        expected = [dict(row) for row in AttendanceSerializer(queryset, many=True).data]
+        self.assertEqual(AttendanceListRenderer.render(AttendanceListRenderer.queryset(queryset)), expected)
+
+        response = self.client.get('/api/attendance/')
+        self.assertEqual([dict(row) for row in response.data['results']], expected)
+
+    def test_department_calendar_bitsets(self):
+        """Lịch tháng của phòng ban: bit (d - 1) của mỗi bitset là ngày d, cache theo phiên bản dữ liệu"""
+        self.assertEqual(self.client.get('/api/attendance/calendar/').status_code, status.HTTP_403_FORBIDDEN)
+        self.employee.role = 'manager'
+        self.employee.save()
+        Attendance.objects.create(employee=self.employee, date=date(2025, 3, 3), check_in=time(9, 15),
+                                  check_out=time(17, 0), status='checked_out')
+        Attendance.objects.create(employee=self.employee, date=date(2025, 3, 4), status='absent')
+
+        response = self.client.get('/api/attendance/calendar/?month=2025-03')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['days'], 31)
+        row = response.data['employees'][0]
+        self.assertEqual((row['employee'], row['present'], row['late'], row['absent']),
+                         (self.employee.id, 1 << 2, 1 << 2, 1 << 3))
+        self.assertFalse(response.data['working_days'] & (1 << 1))  # 02/03/2025 là Chủ nhật
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Attendance.objects.create(employee=self.employee, date=date(2025, 3, 5), check_in=time(8, 30),
+                                      status='checked_in')
+        updated = self.client.get(f'/api/attendance/calendar/?month=2025-03&department={self.department.id}')
+        self.assertNotEqual(updated.data['version'], response.data['version'])
+        self.assertEqual(updated.data['employees'][0]['present'], (1 << 2) | (1 << 4))
+        self.assertEqual(self.client.get('/api/attendance/calendar/?month=2025-13').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        other = Department.objects.create(name="Sales")
+        self.assertEqual(self.client.get(f'/api/attendance/calendar/?month=2025-03&department={other.id}').status_code,
+                         status.HTTP_403_FORBIDDEN)
+
+    def test_department_calendar_drops_revoked_leave(self):
+        """Từ chối đơn đã duyệt tăng phiên bản lịch tháng: bit nghỉ phép biến mất ngay, không đợi hết cache"""
+        self.employee.role = 'manager'
+        self.employee.save()
+        leave_type = LeaveType.objects.create(name="Annual Leave", code="AL", max_days_per_year=12)
+        leave_request = LeaveRequest.objects.create(
+            employee=self.employee, leave_type=leave_type, start_date=date(2025, 3, 6), end_date=date(2025, 3, 7),
+            reason="Test leave", status='pending',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            leave_request.status = 'approved'
+            leave_request.approved_by = self.employee
+            leave_request.response_date = timezone.now()
+            leave_request.save()
+        approved = self.client.get('/api/attendance/calendar/?month=2025-03')
+        self.assertEqual(approved.data['employees'][0]['leave'], (1 << 5) | (1 << 6))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            leave_request.status = 'rejected'
+            leave_request.save()
+        rejected = self.client.get('/api/attendance/calendar/?month=2025-03')
+        self.assertNotEqual(rejected.data['version'], approved.data['version'])
+        self.assertEqual(rejected.data['employees'][0]['leave'], 0)
+        self.assertEqual(AttendanceMonthlySummary.objects.get(employee=self.employee, month=date(2025, 3, 1)).on_leave_days, 0)
+
     def test_attendance_with_leave_conflict(self):
         """Test check-in prevention when on leave"""
         # Create leave type and request
@@ -1242,4 +1633,722 @@ class SystemIntegrationTest(TestCase):
         # String representations
         self.assertEqual(str(self.employee), "Bob Developer (EMP001)")
         self.assertEqual(str(self.department), "Engineering")
-        self.assertEqual(str(self.position), "Senior Developer - Engineering")
\ No newline at end of file
+        self.assertEqual(str(self.position), "Senior Developer - Engineering")
+
+class BatchPayrollTest(TestCase):
+    """Test batch payroll engine matches per-employee PayrollService results"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        self.leave_type = LeaveType.objects.create(name="Sick Leave", code="SL")
+        LeavePenalty.objects.create(leave_type=self.leave_type, penalty_percent=Decimal('50.00'))
+
+        self.employees = []
+        for i, hire_date in enumerate([date(2022, 1, 1), self.month + timedelta(days=9)]):
+            user = User.objects.create_user(username=f"batch{i}", password="testpass")
+            self.employees.append(Employee.objects.create(
+                user=user,
+                employee_id=f"BAT00{i}",
+                phone_number=f"+123456789{i}",
+                address="Batch Address",
+                date_of_birth=date(1990, 1, 1),
+                hire_date=hire_date,
+                department=self.department,
+                position=self.position,
+                salary=Decimal('10000000.00')
+            ))
+
+        for employee in self.employees:
+            for offset, check_in in [(10, time(9, 30)), (11, time(8, 55)), (14, time(9, 0))]:
+                Attendance.objects.create(
+                    employee=employee,
+                    date=self.month + timedelta(days=offset),
+                    check_in=check_in,
+                    check_out=time(19, 15),
+                    break_duration=timedelta(minutes=45)
+                )
+            Attendance.objects.create(
+                employee=employee,
+                date=self.month + timedelta(days=15),
+                check_in=time(9, 5),
+                status='incomplete'
+            )
+        LeaveRequest.objects.create(
+            employee=self.employees[0],
+            leave_type=self.leave_type,
+            start_date=self.month + timedelta(days=1),
+            end_date=self.month + timedelta(days=7),
+            reason="Flu",
+            status='pending'
+        )
+        LeaveRequest.objects.filter(employee=self.employees[0]).update(status='approved')
+
+    def test_batch_matches_scalar_service(self):
+        """Batch figures must equal the per-employee service results"""
+        results = BatchPayrollService.compute_month(self.month, department=self.department)
+        self.assertEqual(set(results), {e.id for e in self.employees})
+
+        for employee in self.employees:
+            figures = results[employee.id]
+            late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, self.month)
+            overtime_bonus = PayrollService.calculate_overtime_bonus(employee, self.month)
+            self.assertEqual(figures['late_days'], late_days)
+            self.assertEqual(figures['absent_days'], absent_days)
+            self.assertEqual(figures['working_days'], num_days)
+            self.assertEqual(figures['incomplete_days'], incomplete_days)
+            self.assertEqual(figures['overtime_bonus'], overtime_bonus)
+            self.assertEqual(figures['total_hours_worked'], PayrollService.get_total_hours_worked(employee, self.month))
+
+            expected = PayrollService.salary_record_fields(
+                employee_id=employee.id,
+                base_salary=employee.salary,
+                bonus=overtime_bonus,
+                month=self.month
+            )
+            batch_record = BatchPayrollService.build_salary_record(figures, self.month)
+            batch_record.save()
+            batch_record.refresh_from_db()
+            for field in ['base_salary', 'bonus', 'deductions', 'total_salary', 'total_hours_worked',
+                          'overtime_hours', 'late_days', 'absent_days', 'incomplete_days']:
+                self.assertEqual(getattr(batch_record, field), expected[field], field)
+            # Payslip của batch trùng với payslip của get_salary_record
+            expected_payslip = PayrollService.build_payslip(
+                employee, self.month, SalaryRecord(employee_id=employee.id, month=self.month, **expected), overtime_bonus,
+            )
+            self.assertEqual(batch_record.payslip, expected_payslip)
+
+    def test_query_count_does_not_grow_with_employees(self):
+        """Batch computation runs a constant number of queries"""
+        # Lịch làm việc của năm được tính sẵn một lần, không tính vào số query của batch
+        business_calendar.count_working_days(self.month, self.month)
+        with self.assertNumQueries(4):
+            BatchPayrollService.compute_month(self.month, department=self.department)
+
+    def test_vectorized_salaries_match_batch(self):
+        """Vectorized calculator returns the same net salaries as the scalar path"""
+        from payroll.vectorized import calculate_net_salaries, columns_from_batch
+        results = BatchPayrollService.compute_month(self.month, department=self.department)
+        employee_ids, columns = columns_from_batch(results)
+        net_salaries = calculate_net_salaries(**columns)
+        for employee_id, net_salary in zip(employee_ids, net_salaries):
+            self.assertEqual(int(net_salary), results[employee_id]['total_salary'])
+
+    def test_payroll_context_reuses_attendance_stats(self):
+        """Inside payroll_context the scalar service computes each month's stats once"""
+        from payroll.context import payroll_context
+        employee = self.employees[0]
+        expected = PayrollService.calculate_salary(employee.salary, 0, self.month, employee.id)
+        with payroll_context():
+            stats = PayrollService.get_late_or_absent_days(employee, self.month)
+            PayrollService.get_leave_penalty_percents()
+            PayrollService.get_employee(employee.id)
+            with self.assertNumQueries(0):
+                self.assertEqual(PayrollService.get_late_or_absent_days(employee, self.month), stats)
+                self.assertEqual(PayrollService.calculate_salary(employee.salary, 0, self.month, employee.id), expected)
+
+    def test_run_payroll_command_resumes_completed_shards(self):
+        """run_payroll writes every record once and skips finished shards on rerun"""
+        from django.core.management import call_command
+        from payroll.models import PayrollRunShard
+        month_param = self.month.strftime('%Y-%m')
+
+        call_command('run_payroll', month=month_param, workers=1, shard_size=1, stdout=StringIO())
+        self.assertEqual(SalaryRecord.objects.filter(month=self.month).count(), len(self.employees))
+        self.assertFalse(PayrollRunShard.objects.exclude(status='done').exists())
+
+        SalaryRecord.objects.filter(employee_id=self.employees[0].id).delete()
+        call_command('run_payroll', month=month_param, workers=1, shard_size=1, stdout=StringIO())
+        self.assertFalse(SalaryRecord.objects.filter(employee_id=self.employees[0].id).exists())
+
+        call_command('run_payroll', month=month_param, workers=1, shard_size=1, restart=True, stdout=StringIO())
+        self.assertEqual(SalaryRecord.objects.filter(month=self.month).count(), len(self.employees))
+
+
+class SalaryRecordCacheTest(APITestCase):
+    """Test salary reads reuse the stored record until inputs change"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.user = User.objects.create_user(username="employee", password="testpass")
+        self.employee = Employee.objects.create(
+            user=self.user,
+            employee_id="EMP001",
+            phone_number="+1234567891",
+            address="Employee Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('10000000.00')
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def test_repeated_reads_do_not_recreate_record(self):
+        """Second GET serves the stored record without rewriting it"""
+        first = self.client.get('/api/payroll/my-salary/')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        record = SalaryRecord.objects.get(employee_id=self.employee.id)
+        self.assertTrue(record.input_fingerprint)
+
+        second = self.client.get('/api/payroll/my-salary/')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(SalaryRecord.objects.get(employee_id=self.employee.id).pk, record.pk)
+        self.assertEqual(first.data['payslip'], second.data['payslip'])
+
+        pdf = self.client.get('/api/payroll/payslip/')
+        self.assertEqual(pdf.status_code, status.HTTP_200_OK)
+        self.assertEqual(SalaryRecord.objects.get(employee_id=self.employee.id).pk, record.pk)
+
+    def test_payslip_pdf_is_cached_by_content_hash(self):
+        """PDF downloads reuse the cached file, honour If-None-Match and support async jobs"""
+        import os
+        import tempfile
+        from django.test import override_settings
+        from payroll import pdf
+
+        with tempfile.TemporaryDirectory() as cache_dir, override_settings(PAYSLIP_PDF_CACHE_DIR=cache_dir):
+            first = self.client.get('/api/payroll/payslip/')
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            etag = first['ETag']
+
+            not_modified = self.client.get('/api/payroll/payslip/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+            weak = self.client.get('/api/payroll/payslip/', HTTP_IF_NONE_MATCH=f'"other", W/{etag}')
+            self.assertEqual(weak.status_code, status.HTTP_304_NOT_MODIFIED)
+
+            job = self.client.get('/api/payroll/payslip/?async=1')
+            self.assertEqual(job.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(f'"{job.data["job_id"]}"', etag)
+            self.assertEqual(job.data['status'], 'ready')
+
+            download = self.client.get(job.data['download_url'])
+            self.assertEqual(download.status_code, status.HTTP_200_OK)
+            self.assertEqual(download.content, first.content)
+            self.assertTrue(pdf.is_valid_cache_key(job.data['job_id']))
+
+            # Trạng thái job chưa có file lấy từ marker trong cache dùng chung, không từ bộ nhớ process
+            os.remove(pdf.cache_path(job.data['job_id']))
+            cache.set(pdf.job_cache_key(job.data['job_id']), 'pending')
+            pending = self.client.get(job.data['download_url'])
+            self.assertEqual(pending.status_code, status.HTTP_202_ACCEPTED)
+            self.assertEqual(pending.data['status'], 'pending')
+            cache.set(pdf.job_cache_key(job.data['job_id']), 'failed')
+            self.assertEqual(self.client.get(job.data['download_url']).status_code, 500)
+            cache.delete(pdf.job_cache_key(job.data['job_id']))
+            self.assertEqual(self.client.get(job.data['download_url']).status_code, status.HTTP_404_NOT_FOUND)
+
+            # Job id của nhân viên khác không tải được qua đường dẫn của mình
+            other_user = User.objects.create_user(username="other", password="testpass")
+            other = Employee.objects.create(
+                user=other_user,
+                employee_id="EMP002",
+                phone_number="+1234567892",
+                address="Other Address",
+                date_of_birth=date(1990, 1, 1),
+                hire_date=date(2022, 1, 1),
+                department=self.department,
+                position=self.position,
+                salary=Decimal('10000000.00')
+            )
+            self.client.force_authenticate(user=other_user)
+            stolen = self.client.get(f"/api/payroll/payslip/jobs/{other.id}/{job.data['job_id']}/")
+            self.assertEqual(stolen.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_attendance_change_triggers_recompute(self):
+        """New attendance changes the fingerprint and the record is recomputed in place"""
+        self.client.get('/api/payroll/my-salary/')
+        record = SalaryRecord.objects.get(employee_id=self.employee.id)
+
+        Attendance.objects.create(
+            employee=self.employee,
+            date=date.today(),
+            check_in=time(9, 30),
+            check_out=time(17, 0)
+        )
+        response = self.client.get('/api/payroll/my-salary/')
+        updated = SalaryRecord.objects.get(employee_id=self.employee.id)
+        self.assertEqual(updated.pk, record.pk)
+        self.assertNotEqual(updated.input_fingerprint, record.input_fingerprint)
+        self.assertEqual(response.data['late_days'], 1)
+
+
+class TeamSalarySnapshotTest(APITestCase):
+    """Test TeamSalaryView snapshot mode paginates and sorts SalaryRecord rows"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        employees = []
+        for i, (role, salary) in enumerate([('manager', 30000000), ('employee', 8000000),
+                                            ('employee', 12000000), ('employee', 10000000)]):
+            user = User.objects.create_user(username=f"team{i}", password="testpass")
+            employees.append(Employee.objects.create(
+                user=user,
+                employee_id=f"TEAM00{i}",
+                phone_number=f"+198765432{i}",
+                address="Team Address",
+                date_of_birth=date(1990, 1, 1),
+                hire_date=date(2022, 1, 1),
+                department=self.department,
+                position=self.position,
+                role=role,
+                salary=Decimal(salary)
+            ))
+        self.manager, self.team = employees[0], employees[1:]
+        self.client.force_authenticate(user=self.manager.user)
+
+    def test_snapshot_mode_paginates_sorted_records(self):
+        """Missing snapshots are filled once and pages follow the requested ordering"""
+        url = f"/api/payroll/team-salary/?month={self.month:%Y-%m}&source=snapshot&ordering=-net_salary&page_size=2"
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data['total_employees'], 3)
+        self.assertEqual(SalaryRecord.objects.filter(month=self.month).count(), 3)
+        self.assertIsNotNone(first.data['next'])
+
+        second = self.client.get(first.data['next'])
+        rows = first.data['team_salaries'] + second.data['team_salaries']
+        self.assertEqual([row['employee_code'] for row in rows], ['TEAM002', 'TEAM003', 'TEAM001'])
+        self.assertIsNone(second.data['next'])
+
+        filtered = self.client.get(f"/api/payroll/team-salary/?month={self.month:%Y-%m}&source=snapshot&search=TEAM001")
+        self.assertEqual([row['employee_code'] for row in filtered.data['team_salaries']], ['TEAM001'])
+
+    def test_snapshot_mode_recomputes_only_stale_records(self):
+        """Snapshots whose input fingerprint changed are recomputed in place, the others are served as stored"""
+        url = f"/api/payroll/team-salary/?month={self.month:%Y-%m}&source=snapshot"
+        self.client.get(url)
+        before = {r.employee_id: r for r in SalaryRecord.objects.filter(month=self.month)}
+
+        monday = self.month + timedelta(days=(7 - self.month.weekday()) % 7)
+        Attendance.objects.create(employee=self.team[0], date=monday, check_in=time(9, 30), check_out=time(17, 0))
+        response = self.client.get(url)
+        after = {r.employee_id: r for r in SalaryRecord.objects.filter(month=self.month)}
+
+        # Upsert: id giữ nguyên, chỉ bản ghi cũ được ghi lại
+        self.assertEqual({k: r.pk for k, r in after.items()}, {k: r.pk for k, r in before.items()})
+        self.assertNotEqual(after[self.team[0].id].input_fingerprint, before[self.team[0].id].input_fingerprint)
+        self.assertEqual(after[self.team[0].id].payslip['late_days'], 1)
+        for employee in self.team[1:]:
+            self.assertEqual(after[employee.id].input_fingerprint, before[employee.id].input_fingerprint)
+        rows = {row['employee_id']: row for row in response.data['team_salaries']}
+        self.assertEqual(rows[self.team[0].id]['late_days'], 1)
+
+    def test_snapshot_mode_fills_missing_payslips_in_place(self):
+        """Snapshots stored without a payslip are rewritten in place with one"""
+        url = f"/api/payroll/team-salary/?month={self.month:%Y-%m}&source=snapshot"
+        self.client.get(url)
+        SalaryRecord.objects.filter(month=self.month, employee=self.team[0]).update(payslip={})
+        before = SalaryRecord.objects.get(month=self.month, employee=self.team[0])
+
+        self.client.get(url)
+        after = SalaryRecord.objects.get(month=self.month, employee=self.team[0])
+        self.assertEqual(after.pk, before.pk)
+        self.assertEqual(after.payslip['employee_id'], self.team[0].id)
+        # Payslip của snapshot được get_salary_record dùng lại, không tính lại
+        self.assertEqual(PayrollService.get_salary_record(self.team[0], self.month).pk, after.pk)
+
+    def test_department_payslip_zip_contains_every_employee(self):
+        """Department export streams one cached PDF per active employee"""
+        import tempfile
+        import zipfile
+        from django.test import override_settings
+
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                override_settings(PAYSLIP_PDF_CACHE_DIR=cache_dir, PAYSLIP_EXPORT_WORKERS=1):
+            response = self.client.get(f"/api/payroll/payslip/department/?month={self.month:%Y-%m}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+            archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+            expected = {f"payslip_{emp.id}_{self.month:%Y_%m}.pdf" for emp in [self.manager] + self.team}
+            self.assertEqual(set(archive.namelist()), expected)
+            self.assertIsNone(archive.testzip())
+            # Snapshot của cả phòng ban được ghi (kèm payslip) bằng batch upsert
+            self.assertEqual(SalaryRecord.objects.filter(month=self.month).exclude(payslip={}).count(), 4)
+
+        employee_client = self.client_class()
+        employee_client.force_authenticate(user=self.team[0].user)
+        self.assertEqual(employee_client.get("/api/payroll/payslip/department/").status_code, 403)
+
+class AttendanceMonthlySummaryTest(TestCase):
+    """Test the per-month attendance summary stays in sync with attendance"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.user = User.objects.create_user(username="summary", password="testpass")
+        self.employee = Employee.objects.create(
+            user=self.user,
+            employee_id="EMP001",
+            phone_number="+1234567891",
+            address="Employee Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('10000000.00')
+        )
+        self.month = date(2024, 3, 1)
+
+    def test_summary_tracks_attendance_changes(self):
+        """Saving and deleting attendance keeps the monthly row current"""
+        first = Attendance.objects.create(
+            employee=self.employee,
+            date=date(2024, 3, 4),
+            check_in=time(9, 30),
+            check_out=time(18, 30),
+            break_duration=timedelta(hours=1)
+        )
+        Attendance.objects.create(
+            employee=self.employee,
+            date=date(2024, 3, 5),
+            check_in=time(8, 50),
+            status='incomplete'
+        )
+        summary = AttendanceMonthlySummary.objects.get(employee=self.employee, month=self.month)
+        self.assertEqual(summary.present_days, 2)
+        self.assertEqual(summary.late_days, 1)
+        self.assertEqual(summary.incomplete_days, 1)
+        self.assertEqual(summary.worked_seconds, 8 * 3600)
+        self.assertEqual(summary.overtime_seconds, 0)
+
+        first.delete()
+        summary.refresh_from_db()
+        self.assertEqual(summary.present_days, 1)
+        self.assertEqual(summary.worked_seconds, 0)
+
+    def test_leave_attendance_refreshes_once(self):
+        """Leave materialization updates on-leave counts"""
+        leave_type = LeaveType.objects.create(name="Annual Leave", code="AL")
+        leave_request = LeaveRequest.objects.create(
+            employee=self.employee,
+            leave_type=leave_type,
+            start_date=date(2024, 3, 11),
+            end_date=date(2024, 3, 13),
+            reason="Trip",
+            status='pending'
+        )
+        Attendance.create_leave_attendance(self.employee, leave_request)
+        summary = AttendanceMonthlySummary.objects.get(employee=self.employee, month=self.month)
+        self.assertEqual(summary.on_leave_days, 3)
+
+    def test_leave_materialization_is_bulk(self):
+        """Số query khi duyệt đơn không phụ thuộc độ dài kỳ nghỉ; dòng đã chấm công được giữ nguyên"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        leave_type = LeaveType.objects.create(name="Annual Leave", code="AL")
+        business_calendar.year_calendar(2024)
+
+        def leave(start, end):
+            return LeaveRequest.objects.create(employee=self.employee, leave_type=leave_type, start_date=start,
+                                               end_date=end, reason="Trip", status='pending')
+
+        short, long = leave(date(2024, 3, 18), date(2024, 3, 19)), leave(date(2024, 3, 4), date(2024, 3, 15))
+        # Dòng tổng hợp tháng đã có sẵn: lần ghi đầu không phải INSERT thêm dòng này
+        AttendanceMonthlySummary.refresh_for(self.employee.pk, self.month)
+        with CaptureQueriesContext(connection) as short_queries:
+            Attendance.create_leave_attendance(self.employee, short)
+        with CaptureQueriesContext(connection) as long_queries:
+            Attendance.create_leave_attendance(self.employee, long)
+        self.assertEqual(len(long_queries.captured_queries), len(short_queries.captured_queries))
+
+        Attendance.objects.create(employee=self.employee, date=date(2024, 3, 20), check_in=time(9, 0), status='incomplete')
+        Attendance.objects.create(employee=self.employee, date=date(2024, 3, 21), check_in=time(9, 0), check_out=time(17, 0))
+        rows = Attendance.materialize_leave_requests([leave(date(2024, 3, 20), date(2024, 3, 22))])
+        self.assertEqual({row.date.day: row.status for row in rows}, {20: 'on_leave', 21: 'checked_out', 22: 'on_leave'})
+
+        summary = AttendanceMonthlySummary.objects.get(employee=self.employee, month=self.month)
+        self.assertEqual(summary.on_leave_days, 14)
+
+    def test_close_day_marks_incomplete_and_absent(self):
+        """Đóng ngày: checked_in → incomplete, không có dòng → absent, nghỉ phép / cuối tuần bỏ qua"""
+        def make_employee(code, phone):
+            return Employee.objects.create(
+                user=User.objects.create_user(username=code.lower(), password="testpass"),
+                employee_id=code,
+                phone_number=phone,
+                address="Employee Address",
+                date_of_birth=date(1990, 1, 1),
+                hire_date=date(2022, 1, 1),
+                department=self.department,
+                position=self.position,
+                salary=Decimal('10000000.00')
+            )
+        missing = make_employee("EMP002", "+1234567892")
+        on_leave = make_employee("EMP003", "+1234567893")
+        leave_type = LeaveType.objects.create(name="Annual Leave", code="AL")
+        leave = LeaveRequest.objects.create(employee=on_leave, leave_type=leave_type, start_date=date(2024, 3, 5),
+                                            end_date=date(2024, 3, 5), reason="Trip", status='pending')
+        # Duyệt qua save() để LeaveDay (chỉ mục close_day đọc) được đồng bộ
+        leave.status = 'approved'
+        leave.approved_by = self.employee
+        leave.response_date = timezone.now()
+        leave.save()
+        # Không còn dòng on_leave: chỉ LeaveDay giữ nhân viên nghỉ phép khỏi danh sách absent
+        Attendance.objects.filter(employee=on_leave, date=date(2024, 3, 5)).delete()
+        Attendance.objects.create(employee=self.employee, date=date(2024, 3, 5), check_in=time(8, 50),
+                                  status='checked_in')
+
+        self.assertEqual(Attendance.close_day(date(2024, 3, 5)), (1, 1))
+
+        statuses = dict(Attendance.objects.filter(date=date(2024, 3, 5)).values_list('employee_id', 'status'))
+        self.assertEqual(statuses, {self.employee.id: 'incomplete', missing.id: 'absent'})
+        self.assertEqual(AttendanceMonthlySummary.objects.get(employee=missing, month=self.month).absent_days, 1)
+        self.assertEqual(AttendanceMonthlySummary.objects.get(employee=self.employee, month=self.month).incomplete_days, 1)
+
+        # Cuối tuần: không tạo dòng absent; chạy lại cùng ngày không đổi gì
+        self.assertEqual(Attendance.close_day(date(2024, 3, 9)), (0, 0))
+        self.assertEqual(Attendance.close_day(date(2024, 3, 5)), (0, 0))
+
+    def test_rebuild_matches_incremental_rows(self):
+        """Rebuild produces the same values as incremental maintenance"""
+        Attendance.objects.create(
+            employee=self.employee,
+            date=date(2024, 3, 6),
+            check_in=time(9, 0),
+            check_out=time(17, 0)
+        )
+        before = AttendanceMonthlySummary.objects.values(
+            'employee_id', 'month', 'worked_seconds', 'present_days', 'late_days'
+        ).get()
+        AttendanceMonthlySummary.rebuild(month=self.month)
+        after = AttendanceMonthlySummary.objects.values(
+            'employee_id', 'month', 'worked_seconds', 'present_days', 'late_days'
+        ).get()
+        self.assertEqual(before, after)
+        self.assertEqual(PayrollService.get_total_hours_worked(self.employee, self.month), 8.0)
+
+
+class BusinessCalendarTest(TestCase):
+    """Test holidays are excluded from working-day counts across modules"""
+
+    def setUp(self):
+        business_calendar.clear_cache()
+        self.addCleanup(business_calendar.clear_cache)
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.user = User.objects.create_user(username="calendar", password="testpass")
+        self.employee = Employee.objects.create(
+            user=self.user,
+            employee_id="EMP001",
+            phone_number="+1234567891",
+            address="Employee Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('10000000.00')
+        )
+        self.leave_type = LeaveType.objects.create(name="Annual Leave", code="AL")
+
+    def test_counts_skip_weekends_and_holidays(self):
+        """Counts come from the precomputed bitmap and drop holidays"""
+        self.assertEqual(business_calendar.count_working_days(date(2024, 4, 29), date(2024, 5, 5)), 5)
+        Holiday.objects.create(date=date(2024, 4, 30), name="Reunification Day")
+        Holiday.objects.create(date=date(2024, 5, 1), name="Labour Day")
+        self.assertEqual(business_calendar.count_working_days(date(2024, 4, 29), date(2024, 5, 5)), 3)
+        self.assertEqual(business_calendar.count_working_days(date(2023, 12, 25), date(2024, 1, 7)), 10)
+        self.assertEqual(
+            business_calendar.working_days(date(2024, 4, 29), date(2024, 5, 5)),
+            [date(2024, 4, 29), date(2024, 5, 2), date(2024, 5, 3)]
+        )
+
+    def test_leave_and_payroll_ignore_holidays(self):
+        """Leave length, leave attendance and absences all skip holidays"""
+        Holiday.objects.create(date=date(2024, 4, 30), name="Reunification Day")
+        leave_request = LeaveRequest.objects.create(
+            employee=self.employee,
+            leave_type=self.leave_type,
+            start_date=date(2024, 4, 29),
+            end_date=date(2024, 5, 3),
+            reason="Trip",
+            status='pending'
+        )
+        self.assertEqual(leave_request.days_requested, 4)
+        attendances = Attendance.create_leave_attendance(self.employee, leave_request)
+        self.assertNotIn(date(2024, 4, 30), [a.date for a in attendances])
+
+        # Tháng 4/2024 có 22 ngày Thứ Hai..Thứ Sáu, trừ 1 ngày lễ; nhân viên không đi làm ngày nào
+        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(
+            self.employee, date(2024, 4, 1))
+        self.assertEqual(num_days, 21)
+        self.assertEqual(absent_days, 21)
+        results = BatchPayrollService.compute_month(date(2024, 4, 1), employees=[self.employee])
+        self.assertEqual(results[self.employee.id]['working_days'], 21)
+        self.assertEqual(results[self.employee.id]['absent_days'], 21)
+
+
+class RecordingBroker:
+    """Broker thay thế cho test: ghi lại các sự kiện được publish"""
+    published = []
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def publish(self, channel, event):
+        self.published.append((channel, event))
+
+
+class LiveAttendanceEventsTest(TestCase):
+    """Test attendance changes are pushed to employee and department channels"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.user = User.objects.create_user(username="live", password="testpass", first_name="Live", last_name="User")
+        self.employee = Employee.objects.create(
+            user=self.user,
+            employee_id="EMP001",
+            phone_number="+1234567891",
+            address="Employee Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('10000000.00')
+        )
+        RecordingBroker.published = []
+
+    def test_attendance_save_publishes_after_commit(self):
+        """Check-in is published once the transaction commits"""
+        from django.test import override_settings
+        with override_settings(ATTENDANCE_EVENT_BROKER='hrms.comprehensive_tests.RecordingBroker'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Attendance.objects.create(employee=self.employee, date=date.today(), check_in=time(8, 50),
+                                          status='checked_in')
+                self.assertEqual(RecordingBroker.published, [])
+
+        channels = [channel for channel, _ in RecordingBroker.published]
+        self.assertEqual(channels, [f"employee:{self.employee.id}", f"department:{self.department.id}"])
+        event = RecordingBroker.published[0][1]
+        self.assertEqual(event['status'], 'checked_in')
+        self.assertEqual(event['employee_name'], "Live User")
+        self.assertTrue(event['can_check_out'])
+
+    def test_in_process_broker_delivers_to_subscribers(self):
+        """Subscribers only receive events for their channels"""
+        import asyncio
+        from hrms.live_events import InProcessBroker
+
+        async def scenario():
+            broker = InProcessBroker()
+            manager_feed = broker.subscribe(['department:1'])
+            other_feed = broker.subscribe(['department:2'])
+            broker.publish('department:1', {'type': 'attendance', 'employee_id': 7})
+            received = await manager_feed.get(timeout=1)
+            missed = await other_feed.get(timeout=0.01)
+            manager_feed.close()
+            other_feed.close()
+            return received, missed, broker._subscribers
+
+        received, missed, subscribers = asyncio.run(scenario())
+        self.assertEqual(received['employee_id'], 7)
+        self.assertIsNone(missed)
+        self.assertEqual(dict(subscribers), {})
+
+
+class AttendanceEventProjectionTest(TestCase):
+    """Test punches are appended to the event log and folded into Attendance"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name="Engineering")
+        self.position = Position.objects.create(
+            title="Developer",
+            department=self.department,
+            salary_min=50000,
+            salary_max=80000
+        )
+        self.user = User.objects.create_user(username="puncher", password="testpass")
+        self.employee = Employee.objects.create(
+            user=self.user,
+            employee_id="EMP001",
+            phone_number="+1234567892",
+            address="Employee Address",
+            date_of_birth=date(1990, 1, 1),
+            hire_date=date(2022, 1, 1),
+            department=self.department,
+            position=self.position,
+            salary=Decimal('10000000.00')
+        )
+        self.day = date(2025, 3, 4)
+
+    def punch(self, punch_type, hour, minute):
+        moment = datetime.combine(self.day, time(hour, minute))
+        return attendance_projection.record_punch(self.employee, punch_type, moment)
+
+    def test_worker_projection_refolds_late_events(self):
+        """Punch chỉ là INSERT; event đến trễ làm ngày đó được gấp lại từ đầu"""
+        from django.test import override_settings
+        with override_settings(ATTENDANCE_PROJECTION='worker'):
+            event, attendance = self.punch('check_in', 9, 10)
+            self.assertIsNone(attendance)
+            self.punch('check_out', 17, 0)
+            self.assertFalse(Attendance.objects.filter(employee=self.employee, date=self.day).exists())
+
+            self.assertEqual(attendance_projection.project_pending(), 1)
+            attendance = Attendance.objects.get(employee=self.employee, date=self.day)
+            self.assertEqual(attendance.status, 'checked_out')
+            self.assertEqual(attendance.total_hours, timedelta(hours=7, minutes=50))
+            self.assertTrue(attendance.late_arrival)
+
+            # Break gửi trễ từ máy chấm công, cũ hơn check-out đã chiếu
+            self.punch('start_break', 12, 0)
+            self.punch('end_break', 12, 30)
+            self.punch('end_break', 13, 0)
+            attendance_projection.project_pending()
+
+        attendance.refresh_from_db()
+        self.assertEqual(attendance.break_duration, timedelta(minutes=30))
+        self.assertEqual(attendance.total_hours, timedelta(hours=7, minutes=20))
+        self.assertEqual(
+            list(AttendanceEvent.objects.values_list('type', 'status')),
+            [('check_in', 'applied'), ('start_break', 'applied'), ('end_break', 'applied'),
+             ('end_break', 'rejected'), ('check_out', 'applied')],
+        )
+
+        # Rebuild chiếu lại chính xác từ nhật ký
+        Attendance.objects.filter(pk=attendance.pk).update(total_hours=timedelta(0), status='incomplete')
+        self.assertEqual(attendance_projection.rebuild(start=self.day, end=self.day), 1)
+        attendance.refresh_from_db()
+        self.assertEqual(attendance.status, 'checked_out')
+        self.assertEqual(attendance.total_hours, timedelta(hours=7, minutes=20))
+
+    def test_rejected_punch_does_not_create_attendance(self):
+        event, attendance = self.punch('check_out', 17, 0)
+        self.assertEqual(event.status, 'rejected')
+        self.assertEqual(event.error, attendance_projection.NO_RECORD_ERROR)
+        self.assertFalse(Attendance.objects.filter(employee=self.employee).exists())
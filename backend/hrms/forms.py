@@ -5,7 +5,8 @@ from .models import LeaveRequest
 class LeaveTypeForm(forms.ModelForm):
     class Meta:
         model = LeaveType
-        fields = ['name', 'code', 'description', 'max_days_per_year', 'is_paid']
+        fields = ['name', 'code', 'description', 'max_days_per_year', 'is_paid',
+                  'accrual_method', 'max_balance', 'carry_over_max', 'prorate_new_hires']
 
 class LeaveRequestForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,223 @@
+"""
+Leave accrual engine
+====================
+
+Lệnh `manage.py run_leave_accruals` (chạy đầu mỗi tháng) ghi cấp phép vào sổ cái ngày phép
+cho toàn bộ nhân viên active theo chính sách của từng LeaveType:
+
+- accrual_method 'yearly': max_days_per_year một lần cho cả năm (kỳ '2025')
+- accrual_method 'monthly': max_days_per_year / 12 mỗi tháng (kỳ '2025-03')
+- prorate_new_hires: nhân viên vào làm giữa kỳ được cấp theo tỷ lệ số ngày còn lại của kỳ
+- max_balance: không cấp vượt số dư tối đa của năm
+- carry_over_max: lần chạy đầu tiên của năm chuyển tối đa chừng ấy ngày còn lại của năm trước
+  (kỳ '2025-CO')
+
+Khi số dư của một (nhân viên, loại nghỉ, năm) được tạo trước lần chạy đầu tiên (duyệt đơn),
+LeaveBalance.lock ghi trước các kỳ lẽ ra đã được cấp tới nay (opening_entries), cùng mã kỳ
+nên lần chạy sau bỏ qua.
+
+Mỗi (nhân viên, loại nghỉ, kỳ) chỉ được cấp một lần: lần chạy khóa các dòng số dư của loại nghỉ
+trong năm trước khi đọc sổ cái, nhân viên đã có bút toán của kỳ bị bỏ qua, nên chạy lại hay chạy
+song song (kể cả với duyệt đơn) đều an toàn; unique constraint của sổ cái là chốt chặn cuối.
+Bút toán được ghi bằng bulk_create; số dư được cộng bằng UPDATE ... accrued = accrued + x
+cho từng nhóm nhân viên cùng số ngày (không đọc-sửa-ghi từng dòng). Mỗi lần chạy lưu một
+LeaveAccrualRun ghi lại số bút toán và số ngày đã cấp.
+"""
+
+import calendar
+import time
+from collections import defaultdict
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.db.models import Exists, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Employee, LeaveAccrualRun, LeaveBalance, LeaveLedgerEntry, LeaveType
+
+WRITE_CHUNK = 1000
+CENT = Decimal('0.01')
+
+
+def accrual_window(leave_type, period):
+    """(kỳ trong sổ cái, ngày đầu kỳ, ngày cuối kỳ, số ngày cấp cả kỳ) của kỳ chứa `period`, hoặc None"""
+    year = period.year
+    if leave_type.accrual_method == 'yearly':
+        return str(year), date(year, 1, 1), date(year, 12, 31), Decimal(leave_type.max_days_per_year)
+    if leave_type.accrual_method == 'monthly':
+        first = period.replace(day=1)
+        last = first.replace(day=calendar.monthrange(year, first.month)[1])
+        return f"{first:%Y-%m}", first, last, Decimal(leave_type.max_days_per_year) / 12
+    return None
+
+
+def prorated(amount, hire_date, start, end, prorate=True):
+    """Số ngày cấp trong kỳ cho nhân viên vào làm ngày hire_date"""
+    if prorate and hire_date > start:
+        amount = amount * ((end - hire_date).days + 1) / ((end - start).days + 1)
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def opening_entries(leave_type, employee_id, hire_date, year, today=None):
+    """
+    Bút toán cấp phép cho (nhân viên, loại nghỉ, năm) chưa có cấp phép nào, tính như run_leave_accruals
+    (accrual_window, prorated theo hire_date, giới hạn max_balance):
+    - yearly: kỳ cả năm ('2025')
+    - monthly: các kỳ tháng tới tháng hiện tại (cả năm với năm đã qua)
+    - none: không cấp
+    """
+    if leave_type.accrual_method == 'yearly':
+        periods = [date(year, 1, 1)]
+    elif leave_type.accrual_method == 'monthly':
+        today = today or timezone.localdate()
+        last_month = 12 if year < today.year else today.month if year == today.year else 0
+        periods = [date(year, month, 1) for month in range(1, last_month + 1)]
+    else:
+        return []
+
+    entries, total = [], Decimal(0)
+    for period in periods:
+        accrual_period, start, end, amount = accrual_window(leave_type, period)
+        if hire_date > end:
+            continue
+        days = prorated(amount, hire_date, start, end, leave_type.prorate_new_hires)
+        if leave_type.max_balance is not None:
+            days = min(days, max(leave_type.max_balance - total, 0))
+        if days <= 0:
+            continue
+        entries.append(LeaveLedgerEntry(
+            employee_id=employee_id, leave_type=leave_type, year=year, kind='accrual',
+            period=accrual_period, days=days, note=f'{leave_type.get_accrual_method_display()} accrual',
+        ))
+        total += days
+    return entries
+
+
+def _balances(leave_type, year, lock=False):
+    """{employee_id: (accrued, used)} của một loại nghỉ trong năm (một query; lock: SELECT ... FOR UPDATE)"""
+    queryset = LeaveBalance.objects.filter(leave_type=leave_type, year=year)
+    if lock:
+        queryset = queryset.select_for_update().order_by('employee_id')
+    return {
+        employee_id: (accrued, used)
+        for employee_id, accrued, used in queryset.values_list('employee_id', 'accrued', 'used')
+    }
+
+
+def _add_to_balances(leave_type, year, amounts, existing):
+    """Cộng {employee_id: số ngày} vào số dư: tạo dòng còn thiếu, rồi một UPDATE cho mỗi nhóm cùng số ngày"""
+    LeaveBalance.objects.bulk_create([
+        LeaveBalance(employee_id=employee_id, leave_type=leave_type, year=year)
+        for employee_id in amounts if employee_id not in existing
+    ], batch_size=WRITE_CHUNK, ignore_conflicts=True)
+
+    by_days = defaultdict(list)
+    for employee_id, days in amounts.items():
+        by_days[days].append(employee_id)
+    now = timezone.now()
+    for days, employee_ids in by_days.items():
+        for offset in range(0, len(employee_ids), WRITE_CHUNK):
+            LeaveBalance.objects.filter(
+                leave_type=leave_type, year=year, employee_id__in=employee_ids[offset:offset + WRITE_CHUNK],
+            ).update(accrued=F('accrued') + days, updated_at=now)
+
+
+def _sync_annual_leave_remaining(leave_type, year):
+    """Employee.annual_leave_remaining (trường cũ hiển thị trên UI) = số dư phép năm của năm, một UPDATE"""
+    balances = LeaveBalance.objects.filter(employee_id=OuterRef('pk'), leave_type=leave_type, year=year)
+    Employee.objects.filter(Exists(balances)).update(annual_leave_remaining=Subquery(
+        balances.annotate(remaining=Cast(F('accrued') - F('used'), IntegerField())).values('remaining')[:1]
+    ))
+
+
+def accrue_leave_type(leave_type, period, dry_run=False):
+    """Cấp phép một loại nghỉ cho kỳ chứa `period`; trả về LeaveAccrualRun (không lưu khi dry_run)"""
+    started = time.perf_counter()
+    period = period.replace(day=1)
+    accrual_period, start, end, amount = accrual_window(leave_type, period)
+    year = period.year
+    employees = list(Employee.objects.filter(status='active', hire_date__lte=end).order_by('id').values_list(
+        'id', 'hire_date',
+    ))
+    run = LeaveAccrualRun(period=period, leave_type=leave_type, accrual_period=accrual_period,
+                          employees=len(employees))
+
+    with transaction.atomic():
+        posted = LeaveLedgerEntry.objects.filter(
+            leave_type=leave_type, kind='accrual', period__in=[accrual_period, f"{year}-CO"],
+        )
+        if not dry_run:
+            # Khóa số dư của loại nghỉ trong năm trước khi đọc sổ cái (dòng còn thiếu được tạo trước để
+            # cũng bị khóa): lần chạy song song và LeaveBalance.lock (duyệt đơn) chờ lần chạy này commit,
+            # nên không ai ghi cùng kỳ giữa lúc đọc `posted` và lúc bulk_create
+            existing = set(LeaveBalance.objects.filter(leave_type=leave_type, year=year).values_list(
+                'employee_id', flat=True,
+            ))
+            LeaveBalance.objects.bulk_create([
+                LeaveBalance(employee_id=employee_id, leave_type=leave_type, year=year)
+                for employee_id, _ in employees if employee_id not in existing
+            ], batch_size=WRITE_CHUNK, ignore_conflicts=True)
+            # Đọc có khóa: thấy cả cấp phép vừa commit bởi transaction đã giữ dòng số dư trước
+            posted = posted.select_for_update()
+        balances = _balances(leave_type, year, lock=not dry_run)
+        posted = set(posted.values_list('employee_id', 'period'))
+        entries, amounts = [], defaultdict(Decimal)
+
+        if leave_type.carry_over_max > 0:
+            carry_period = f"{year}-CO"
+            previous = _balances(leave_type, year - 1)
+            for employee_id, _ in employees:
+                if (employee_id, carry_period) in posted or employee_id not in previous:
+                    continue
+                accrued, used = previous[employee_id]
+                days = min(accrued - used, leave_type.carry_over_max)
+                if days <= 0:
+                    continue
+                entries.append(LeaveLedgerEntry(
+                    employee_id=employee_id, leave_type=leave_type, year=year, kind='accrual',
+                    period=carry_period, days=days, note=f'Carried over from {year - 1}',
+                ))
+                amounts[employee_id] += days
+                run.carry_over_entries += 1
+                run.carried_days += days
+
+        for employee_id, hire_date in employees:
+            if (employee_id, accrual_period) in posted:
+                run.skipped += 1
+                continue
+            days = prorated(amount, hire_date, start, end, leave_type.prorate_new_hires)
+            if leave_type.max_balance is not None:
+                accrued, used = balances.get(employee_id, (0, 0))
+                days = min(days, max(leave_type.max_balance - (accrued - used) - amounts[employee_id], 0))
+            if days <= 0:
+                continue
+            entries.append(LeaveLedgerEntry(
+                employee_id=employee_id, leave_type=leave_type, year=year, kind='accrual',
+                period=accrual_period, days=days, note=f'{leave_type.get_accrual_method_display()} accrual',
+            ))
+            amounts[employee_id] += days
+            run.accrual_entries += 1
+            run.accrued_days += days
+
+        if not dry_run:
+            LeaveLedgerEntry.objects.bulk_create(entries, batch_size=WRITE_CHUNK)
+            _add_to_balances(leave_type, year, amounts, balances.keys())
+            if leave_type.code == 'AL':  # Annual Leave
+                _sync_annual_leave_remaining(leave_type, year)
+            run.duration_ms = int((time.perf_counter() - started) * 1000)
+            run.save()
+
+    run.duration_ms = int((time.perf_counter() - started) * 1000)
+    return run
+
+
+def run_accruals(period, leave_types=None, dry_run=False):
+    """Cấp phép mọi loại nghỉ có chính sách (hoặc các loại được chỉ định) cho kỳ chứa `period`"""
+    if leave_types is None:
+        leave_types = LeaveType.objects.exclude(accrual_method='none').order_by('id')
+    return [
+        accrue_leave_type(leave_type, period, dry_run=dry_run)
+        for leave_type in leave_types if leave_type.accrual_method != 'none'
+    ]
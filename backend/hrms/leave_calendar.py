@@ -0,0 +1,136 @@
+"""
+Team leave calendar
+===================
+
+GET /api/leave-requests/team_calendar/?department=<id>&start=2025-01-01&end=2025-03-31
+
+Lịch nghỉ của cả phòng ban để manager xếp người trực: với mỗi ngày trong khoảng, ai nghỉ
+loại phép nào (đơn đã duyệt hoặc đang chờ duyệt).
+
+- Một truy vấn khoảng lấy các đơn pending / approved của phòng ban giao với [start, end]
+- Các đơn được trải ra ma trận ngày x nhân viên bằng NumPy (np.repeat, không lặp từng ngày);
+  ô chứa mã (loại phép, trạng thái), đơn đã duyệt ghi đè đơn đang chờ
+- Kết quả cache theo (phòng ban, khoảng ngày, phiên bản); mỗi lần đơn nghỉ đổi trạng thái /
+  bị xóa tăng phiên bản của phòng ban sau khi transaction commit
+"""
+
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+CALENDAR_CACHE_SECONDS = 600
+VERSION_CACHE_SECONDS = 60 * 60 * 24 * 7
+MAX_RANGE_DAYS = 366
+STATUSES = ('pending', 'approved')  # thứ tự ghi vào ma trận: approved ghi sau, thắng khi trùng
+
+
+def _version_key(department_id):
+    return f"leave-calendar-version:{department_id}"
+
+
+def data_version(department_id):
+    """Phiên bản dữ liệu nghỉ phép của phòng ban; khởi tạo bằng thời điểm hiện tại nếu chưa có"""
+    key = _version_key(department_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), VERSION_CACHE_SECONDS)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_versions(department_ids):
+    """Tăng phiên bản của các phòng ban sau khi transaction commit"""
+    keys = [_version_key(department_id) for department_id in set(department_ids) if department_id]
+
+    def apply():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Chưa có phiên bản: lần đọc sau khởi tạo phiên bản mới, khác mọi phiên bản cũ
+                pass
+
+    if keys:
+        transaction.on_commit(apply)
+
+
+def build_team_calendar(department_id, start, end):
+    """Lịch nghỉ theo ngày của phòng ban trong [start, end]"""
+    from .models import Employee, LeaveRequest, LeaveType
+
+    employees = list(Employee.objects.filter(department_id=department_id).order_by('employee_id').values(
+        'id', 'employee_id', 'user__first_name', 'user__last_name',
+    ))
+    column = {employee['id']: index for index, employee in enumerate(employees)}
+    requests = list(LeaveRequest.objects.filter(
+        employee__department_id=department_id,
+        status__in=STATUSES,
+        start_date__lte=end,
+        end_date__gte=start,
+    ).order_by('id').values_list('employee_id', 'leave_type_id', 'status', 'start_date', 'end_date'))
+
+    # Mã ô = 1 + chỉ số (loại phép, trạng thái) trong legend; 0 = không nghỉ
+    legend = sorted({(leave_type_id, status) for _, leave_type_id, status, _, _ in requests},
+                    key=lambda item: (item[0], STATUSES.index(item[1])))
+    codes = {item: index + 1 for index, item in enumerate(legend)}
+
+    days = (end - start).days + 1
+    matrix = np.zeros((days, len(employees)), dtype=np.int32)
+    for status in STATUSES:
+        selected = [request for request in requests if request[2] == status and request[0] in column]
+        if not selected:
+            continue
+        first = np.array([max((request[3] - start).days, 0) for request in selected], dtype=np.int64)
+        last = np.array([min((request[4] - start).days, days - 1) for request in selected], dtype=np.int64)
+        lengths = last - first + 1
+        # Chỉ số hàng của mọi ngày nghỉ: first lặp lại theo độ dài + offset 0..length-1 trong từng đơn
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        rows = np.repeat(first, lengths) + offsets
+        columns = np.repeat(np.array([column[request[0]] for request in selected], dtype=np.int64), lengths)
+        values = np.repeat(np.array([codes[(request[1], status)] for request in selected], dtype=np.int32), lengths)
+        matrix[rows, columns] = values
+
+    calendar = []
+    day_rows, day_columns = np.nonzero(matrix)
+    boundaries = np.searchsorted(day_rows, np.arange(days + 1))
+    for offset in range(days):
+        cells = range(boundaries[offset], boundaries[offset + 1])
+        if not cells:
+            continue
+        calendar.append({
+            'date': (start + timedelta(days=offset)).isoformat(),
+            # [chỉ số nhân viên trong 'employees', chỉ số trong 'legend']
+            'leaves': [[int(day_columns[cell]), int(matrix[offset, day_columns[cell]]) - 1] for cell in cells],
+        })
+
+    leave_type_names = dict(LeaveType.objects.filter(id__in={item[0] for item in legend}).values_list('id', 'name'))
+    return {
+        'department': department_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'employees': [
+            {'id': employee['id'], 'employee_id': employee['employee_id'],
+             'name': f"{employee['user__first_name']} {employee['user__last_name']}"}
+            for employee in employees
+        ],
+        'legend': [
+            {'leave_type': leave_type_id, 'leave_type_name': leave_type_names.get(leave_type_id), 'status': status}
+            for leave_type_id, status in legend
+        ],
+        'days': calendar,
+    }
+
+
+def get_team_calendar(department_id, start, end):
+    """build_team_calendar qua cache theo (phòng ban, khoảng ngày, phiên bản dữ liệu)"""
+    version = data_version(department_id)
+    key = f"leave-calendar:{department_id}:{start.isoformat()}:{end.isoformat()}:{version}"
+    payload = cache.get(key)
+    if payload is None:
+        payload = build_team_calendar(department_id, start, end)
+        payload['version'] = version
+        cache.set(key, payload, CALENDAR_CACHE_SECONDS)
+    return payload
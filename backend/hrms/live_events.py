@@ -0,0 +1,141 @@
+"""
+Live attendance events
+======================
+
+Pub/sub cho luồng sự kiện chấm công (SSE tại /api/attendance/events/):
+
+- kênh employee:<id>: trạng thái của chính nhân viên
+- kênh department:<id>: check-in / break / check-out của cả phòng ban (cho manager)
+
+Broker mặc định (InProcessBroker) chỉ phát trong process hiện tại, đủ cho một
+process ASGI. Khi chạy nhiều process, trỏ ATTENDANCE_EVENT_BROKER tới một class
+có cùng interface (subscribe(channels) -> Subscription, publish(channel, event)).
+"""
+
+import asyncio
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+def employee_channel(employee_id):
+    return f"employee:{employee_id}"
+
+
+def department_channel(department_id):
+    return f"department:{department_id}"
+
+
+class Subscription:
+    """Hàng đợi sự kiện của một client, gắn với event loop đang phục vụ request"""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = list(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, event):
+        """Gọi được từ bất kỳ thread nào (view sync chạy trong thread pool)"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        # Client đọc chậm: bỏ sự kiện cũ nhất thay vì làm đầy bộ nhớ
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """Sự kiện tiếp theo, hoặc None nếu hết timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = Lock()
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+
+_brokers = {}
+_brokers_lock = Lock()
+
+
+def get_broker():
+    """Broker theo settings.ATTENDANCE_EVENT_BROKER (mỗi class một instance)"""
+    path = getattr(settings, 'ATTENDANCE_EVENT_BROKER', 'hrms.live_events.InProcessBroker')
+    with _brokers_lock:
+        if path not in _brokers:
+            _brokers[path] = import_string(path)()
+        return _brokers[path]
+
+
+def attendance_event(attendance):
+    """Delta gửi cho client khi một dòng Attendance thay đổi"""
+    employee = attendance.employee
+    return {
+        'type': 'attendance',
+        'employee_id': attendance.employee_id,
+        'employee_name': f"{employee.user.first_name} {employee.user.last_name}",
+        'department_id': employee.department_id,
+        'date': attendance.date.isoformat(),
+        'status': attendance.status,
+        'check_in': attendance.check_in.isoformat() if attendance.check_in else None,
+        'check_out': attendance.check_out.isoformat() if attendance.check_out else None,
+        'break_start': attendance.break_start.isoformat() if attendance.break_start else None,
+        'break_end': attendance.break_end.isoformat() if attendance.break_end else None,
+        'late_arrival': attendance.late_arrival,
+        'can_check_in': attendance.can_check_in(),
+        'can_check_out': attendance.can_check_out(),
+        'can_start_break': attendance.can_start_break(),
+        'can_end_break': attendance.can_end_break(),
+    }
+
+
+def publish_attendance(attendance):
+    """Phát sự kiện sau khi transaction commit (client không thấy dữ liệu chưa commit)"""
+    event = attendance_event(attendance)
+
+    def send():
+        broker = get_broker()
+        broker.publish(employee_channel(event['employee_id']), event)
+        if event['department_id']:
+            broker.publish(department_channel(event['department_id']), event)
+
+    transaction.on_commit(send)
+
+
+def publish_status_changed(employee_id):
+    """Báo client tải lại current_status (VD: đơn nghỉ phép đổi trạng thái)"""
+    event = {'type': 'status_changed', 'employee_id': employee_id}
+    transaction.on_commit(lambda: get_broker().publish(employee_channel(employee_id), event))
@@ -0,0 +1,132 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+from hrms.models import Attendance, Department, Employee, Position
+from hrms.views import AttendanceViewSet
+
+BENCH_PREFIX = 'BENCH'
+BENCH_DEPARTMENT = 'Benchmark (synthetic)'
+INSERT_BATCH = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark GET /api/attendance/ cursor pagination while the attendance table grows '
+        '(synthetic employees BENCH*, removed afterwards unless --keep)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='10000,100000,1000000,10000000',
+                            help='Comma separated table sizes to measure at')
+        parser.add_argument('--employees', type=int, default=2000, help='Synthetic employees (rows per day)')
+        parser.add_argument('--pages', type=int, default=20, help='Pages to follow through next links per size')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic rows after the run')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        manager = self.setup_employees(options['employees'])
+        employee_ids = list(Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).order_by('id').values_list('id', flat=True))
+
+        self.stdout.write(f"{'rows':>12} {'first page ms':>14} {'p50 next ms':>12} {'p95 next ms':>12} {'deep page ms':>13}")
+        inserted = 0
+        try:
+            for size in sizes:
+                inserted = self.grow(employee_ids, inserted, size)
+                first, following, deep = self.measure(manager, options['pages'], options['page_size'])
+                following.sort()
+                p95 = following[min(len(following) - 1, int(len(following) * 0.95))] if following else 0
+                self.stdout.write(
+                    f"{inserted:>12} {first:>14.2f} {statistics.median(following) if following else 0:>12.2f} "
+                    f"{p95:>12.2f} {deep:>13.2f}"
+                )
+        finally:
+            if not options['keep']:
+                self.cleanup()
+
+    def setup_employees(self, count):
+        department, _ = Department.objects.get_or_create(name=BENCH_DEPARTMENT)
+        position, _ = Position.objects.get_or_create(
+            title='Benchmark', department=department, defaults={'salary_min': 0, 'salary_max': 0},
+        )
+        existing = Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).count()
+        for i in range(existing, count):
+            user = User.objects.create_user(username=f'bench{i:06d}', password=None)
+            Employee.objects.create(
+                user=user,
+                employee_id=f'{BENCH_PREFIX}{i:06d}',
+                phone_number=f'+84{i:09d}',
+                address='Benchmark',
+                date_of_birth=date(1990, 1, 1),
+                hire_date=date(2000, 1, 1),
+                department=department,
+                position=position,
+                salary=0,
+                role='manager' if i == 0 else 'employee',
+            )
+        return User.objects.get(username='bench000000')
+
+    def grow(self, employee_ids, inserted, size):
+        """Thêm dòng Attendance tới khi bảng có `size` dòng benchmark: mỗi ngày một dòng / nhân viên, lùi dần về quá khứ"""
+        today = date.today()
+        per_day = len(employee_ids)
+        rows = []
+        for n in range(inserted, size):
+            day = today - timedelta(days=n // per_day)
+            rows.append(Attendance(
+                employee_id=employee_ids[n % per_day],
+                date=day,
+                status='checked_out',
+                late_arrival=n % 7 == 0,
+            ))
+            if len(rows) == INSERT_BATCH:
+                Attendance.objects.bulk_create(rows)
+                rows = []
+        if rows:
+            Attendance.objects.bulk_create(rows)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(f'ANALYZE TABLE {Attendance._meta.db_table}')
+        return size
+
+    def request_page(self, manager, url):
+        view = AttendanceViewSet.as_view({'get': 'list'})
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=manager)
+        started = time.perf_counter()
+        response = view(request)
+        response.render()
+        return (time.perf_counter() - started) * 1000, response.data
+
+    def measure(self, manager, pages, page_size):
+        first, data = self.request_page(manager, f'/api/attendance/?page_size={page_size}')
+        following = []
+        for _ in range(pages):
+            if not data.get('next'):
+                break
+            elapsed, data = self.request_page(manager, data['next'])
+            following.append(elapsed)
+
+        # Trang sâu: bắt đầu từ một ngày cũ nhất có dữ liệu (như người dùng kéo tới cuối danh sách)
+        oldest = Attendance.objects.filter(employee__employee_id__startswith=BENCH_PREFIX).order_by('date', 'id').first()
+        deep = 0
+        if oldest:
+            deep, _ = self.request_page(manager, f'/api/attendance/?page_size={page_size}&date_to={oldest.date + timedelta(days=1)}')
+        return first, following, deep
+
+    def cleanup(self):
+        employee_ids = list(Employee.objects.filter(employee_id__startswith=BENCH_PREFIX).values_list('id', flat=True))
+        # Xóa thẳng bằng SQL: xóa qua ORM sẽ phát signal cho từng dòng
+        with connection.cursor() as cursor:
+            for offset in range(0, len(employee_ids), 500):
+                chunk = employee_ids[offset:offset + 500]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {Attendance._meta.db_table} WHERE employee_id IN ({placeholders})', chunk)
+        # Xóa phòng ban kéo theo position, nhân viên và user benchmark
+        Department.objects.filter(name=BENCH_DEPARTMENT).delete()
+        self.stdout.write(self.style.SUCCESS('Removed benchmark data'))
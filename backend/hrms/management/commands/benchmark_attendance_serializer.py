@@ -0,0 +1,87 @@
+import statistics
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from hrms.models import Attendance, Department, Employee, LeaveRequest, LeaveType
+from hrms.serializers import AttendanceListRenderer, AttendanceSerializer
+
+STATUSES = ('not_started', 'checked_in', 'on_break', 'checked_out', 'incomplete', 'absent', 'on_leave')
+
+
+class Command(BaseCommand):
+    help = (
+        'Micro-benchmark: serialize a synthetic "today" list with AttendanceSerializer vs '
+        'AttendanceListRenderer (in memory, no database writes)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        instances, rows = self.build(options['rows'])
+
+        expected = [dict(row) for row in AttendanceSerializer(instances, many=True).data]
+        if AttendanceListRenderer.render(rows) != expected:
+            raise CommandError('AttendanceListRenderer output differs from AttendanceSerializer')
+
+        serializer_ms = self.measure(lambda: AttendanceSerializer(instances, many=True).data, options['repeat'])
+        renderer_ms = self.measure(lambda: AttendanceListRenderer.render(rows), options['repeat'])
+        self.stdout.write(f"{'rows':>8} {'serializer ms':>14} {'renderer ms':>12} {'speedup':>8}")
+        self.stdout.write(
+            f"{len(rows):>8} {serializer_ms:>14.2f} {renderer_ms:>12.2f} "
+            f"{serializer_ms / renderer_ms if renderer_ms else 0:>7.1f}x"
+        )
+
+    def measure(self, render, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def build(self, count):
+        """Các dòng Attendance chưa lưu (kèm quan hệ đã nạp sẵn như select_related) và dict values() tương ứng"""
+        today = date.today()
+        department = Department(id=1, name='Benchmark (synthetic)')
+        leave_type = LeaveType(id=1, name='Annual Leave', code='AL')
+        now = timezone.now()
+        instances, rows = [], []
+        for i in range(count):
+            status = STATUSES[i % len(STATUSES)]
+            user = User(id=i + 1, username=f'bench{i:06d}', first_name='Bench', last_name=f'{i:06d}')
+            employee = Employee(id=i + 1, user=user, department=department, employee_id=f'BENCH{i:06d}')
+            leave_request = None
+            if status == 'on_leave':
+                leave_request = LeaveRequest(id=i + 1, employee=employee, leave_type=leave_type,
+                                             start_date=today, end_date=today, status='approved')
+            check_in = dt_time(8, i % 60) if status in ('checked_in', 'on_break', 'checked_out', 'incomplete') else None
+            check_out = dt_time(17, i % 60) if status == 'checked_out' else None
+            total_hours = (datetime.combine(today, check_out) - datetime.combine(today, check_in)) if check_out else None
+            attendance = Attendance(
+                id=i + 1, employee=employee, date=today, check_in=check_in, check_out=check_out,
+                break_duration=timedelta(minutes=30) if check_out else timedelta(0), total_hours=total_hours,
+                status=status, location='Gate A', late_arrival=check_in is not None and check_in > dt_time(8, 30),
+                break_start=dt_time(12, 0) if status == 'on_break' else None, leave_request=leave_request,
+                expected_start=dt_time(8, 30), expected_end=dt_time(17, 30), created_at=now, updated_at=now,
+            )
+            instances.append(attendance)
+            rows.append({
+                'id': attendance.id, 'employee_id': employee.id, 'employee_name': f'{user.first_name} {user.last_name}',
+                'department_name': department.name, 'date': today, 'check_in': check_in, 'check_out': check_out,
+                'break_duration': attendance.break_duration, 'total_hours': total_hours, 'notes': attendance.notes,
+                'status': status, 'location': attendance.location, 'late_arrival': attendance.late_arrival,
+                'early_departure': False, 'overtime_hours': None, 'break_start': attendance.break_start,
+                'break_end': None, 'expected_start': attendance.expected_start,
+                'expected_end': attendance.expected_end, 'leave_request_id': leave_request and leave_request.id,
+                'leave_status': leave_request and leave_request.status,
+                'leave_start_date': leave_request and leave_request.start_date,
+                'leave_end_date': leave_request and leave_request.end_date,
+                'leave_type_name': leave_type.name if leave_request else None,
+                'created_at': now, 'updated_at': now,
+            })
+        return instances, rows
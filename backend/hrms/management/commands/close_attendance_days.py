@@ -0,0 +1,36 @@
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from hrms.models import Attendance
+
+
+class Command(BaseCommand):
+    help = (
+        'Close past attendance days: unfinished rows become incomplete and employees without a row '
+        'on a working day get an absent row. Schedule nightly, e.g. cron "15 0 * * * manage.py close_attendance_days"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=str, help='Day to close (YYYY-MM-DD). Defaults to yesterday')
+        parser.add_argument('--days', type=int, default=1, help='Number of days to close, ending at --date')
+
+    def handle(self, *args, **options):
+        today = date.today()
+        if options.get('date'):
+            try:
+                last_day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid date format. Use YYYY-MM-DD.'))
+                return
+        else:
+            last_day = today - timedelta(days=1)
+
+        if last_day >= today:
+            self.stdout.write(self.style.ERROR('Only past days can be closed.'))
+            return
+
+        for offset in range(options['days'] - 1, -1, -1):
+            day = last_day - timedelta(days=offset)
+            closed, absent = Attendance.close_day(day)
+            self.stdout.write(f'{day}: {closed} incomplete, {absent} absent')
+        self.stdout.write(self.style.SUCCESS('Attendance days closed'))
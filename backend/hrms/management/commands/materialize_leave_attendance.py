@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from hrms.models import Attendance, LeaveRequest
+
+CHUNK_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Create on_leave attendance rows for approved leave requests (after imports / backfills)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=str, help='Only leave ending on or after this day (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=str, help='Only leave starting on or before this day (YYYY-MM-DD)')
+        parser.add_argument('--id', type=int, action='append', dest='employee_ids', help='Employee ID (repeatable)')
+
+    def handle(self, *args, **options):
+        leave_requests = LeaveRequest.objects.filter(status='approved').select_related('employee__user', 'leave_type')
+        try:
+            if options.get('date_from'):
+                leave_requests = leave_requests.filter(end_date__gte=datetime.strptime(options['date_from'], '%Y-%m-%d').date())
+            if options.get('date_to'):
+                leave_requests = leave_requests.filter(start_date__lte=datetime.strptime(options['date_to'], '%Y-%m-%d').date())
+        except ValueError:
+            self.stdout.write(self.style.ERROR('Invalid date format. Use YYYY-MM-DD.'))
+            return
+        if options.get('employee_ids'):
+            leave_requests = leave_requests.filter(employee_id__in=options['employee_ids'])
+
+        # Theo ngày bắt đầu để mỗi lô chỉ đọc một khoảng ngày hẹp
+        leave_requests = list(leave_requests.order_by('start_date', 'id'))
+        rows = 0
+        for offset in range(0, len(leave_requests), CHUNK_SIZE):
+            with transaction.atomic():
+                rows += len(Attendance.materialize_leave_requests(leave_requests[offset:offset + CHUNK_SIZE]))
+        self.stdout.write(self.style.SUCCESS(f'Materialized {len(leave_requests)} leave requests ({rows} leave days)'))
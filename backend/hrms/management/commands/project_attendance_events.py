@@ -0,0 +1,42 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from hrms import attendance_projection
+
+
+class Command(BaseCommand):
+    help = 'Project pending AttendanceEvent punches into Attendance rows (or rebuild them from the event log)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=attendance_projection.PROJECTION_BATCH_SIZE,
+                            help='Number of pending events per batch')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events (worker mode)')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when no events are pending')
+        parser.add_argument('--rebuild', action='store_true', help='Re-fold every day with events from scratch')
+        parser.add_argument('--from', dest='date_from', type=str, help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=str, help='Last day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--id', type=int, action='append', dest='employee_ids', help='Employee ID to rebuild (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            try:
+                start = datetime.strptime(options['date_from'], '%Y-%m-%d').date() if options.get('date_from') else None
+                end = datetime.strptime(options['date_to'], '%Y-%m-%d').date() if options.get('date_to') else None
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid date format. Use YYYY-MM-DD.'))
+                return
+            count = attendance_projection.rebuild(start, end, options.get('employee_ids'), options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} attendance days from the event log'))
+            return
+
+        total = 0
+        while True:
+            projected = attendance_projection.project_pending(options['batch_size'])
+            total += projected
+            if projected:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Projected {total} attendance days'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from hrms.models import AttendanceMonthlySummary
+from datetime import datetime
+
+
+class Command(BaseCommand):
+    help = 'Rebuild AttendanceMonthlySummary rows from raw attendance records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', type=str, help='Month to rebuild (YYYY-MM). Rebuilds every month if omitted')
+        parser.add_argument('--id', type=int, action='append', dest='employee_ids', help='Employee ID to rebuild (repeatable)')
+
+    def handle(self, *args, **options):
+        month = None
+        if options.get('month'):
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid month format. Use YYYY-MM.'))
+                return
+
+        scope = month.strftime('%Y-%m') if month else 'all months'
+        self.stdout.write(f'Rebuilding attendance summaries for {scope}...')
+        count = AttendanceMonthlySummary.rebuild(month=month, employee_ids=options.get('employee_ids'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} summary rows'))
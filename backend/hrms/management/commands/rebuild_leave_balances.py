@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from hrms.models import LeaveBalance
+
+
+class Command(BaseCommand):
+    help = 'Rebuild LeaveBalance rows from the leave ledger (optionally posting usage for approved requests first)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Year to rebuild. Rebuilds every year if omitted')
+        parser.add_argument('--id', type=int, action='append', dest='employee_ids', help='Employee ID to rebuild (repeatable)')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Post usage entries for approved leave requests that have none yet')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            count = LeaveBalance.backfill_approved(year=options.get('year'))
+            self.stdout.write(f'Posted usage for {count} approved leave requests')
+
+        scope = options['year'] or 'all years'
+        self.stdout.write(f'Rebuilding leave balances for {scope}...')
+        count = LeaveBalance.rebuild(year=options.get('year'), employee_ids=options.get('employee_ids'))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} balance rows'))
@@ -0,0 +1,46 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand
+from hrms.leave_accrual import run_accruals
+from hrms.models import LeaveType
+
+
+class Command(BaseCommand):
+    help = (
+        'Post leave accruals (and year-start carry-over) for every active employee according to each '
+        'LeaveType policy. Idempotent per period; schedule monthly, e.g. cron "30 0 1 * * manage.py run_leave_accruals"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', type=str, help='Month to accrue for (YYYY-MM). Defaults to the current month')
+        parser.add_argument('--type', action='append', dest='codes', help='LeaveType code to accrue (repeatable)')
+        parser.add_argument('--dry-run', action='store_true', help='Compute and report without writing anything')
+
+    def handle(self, *args, **options):
+        period = date.today().replace(day=1)
+        if options.get('period'):
+            try:
+                period = datetime.strptime(options['period'], '%Y-%m').date()
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid period format. Use YYYY-MM.'))
+                return
+
+        leave_types = None
+        if options.get('codes'):
+            leave_types = list(LeaveType.objects.filter(code__in=options['codes']))
+            unknown = set(options['codes']) - {leave_type.code for leave_type in leave_types}
+            if unknown:
+                self.stdout.write(self.style.ERROR(f"Unknown leave type code(s): {', '.join(sorted(unknown))}"))
+                return
+
+        runs = run_accruals(period, leave_types, dry_run=options['dry_run'])
+        self.stdout.write(f"{'type':<12} {'period':<8} {'employees':>9} {'accruals':>9} {'days':>10} "
+                          f"{'carried':>8} {'c. days':>9} {'skipped':>8} {'ms':>7}")
+        for run in runs:
+            self.stdout.write(
+                f"{run.leave_type.code or run.leave_type.name:<12} {run.accrual_period:<8} {run.employees:>9} "
+                f"{run.accrual_entries:>9} {run.accrued_days:>10} {run.carry_over_entries:>8} "
+                f"{run.carried_days:>9} {run.skipped:>8} {run.duration_ms:>7}"
+            )
+        message = 'Dry run, nothing posted' if options['dry_run'] else 'Leave accruals posted'
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from hrms.models import Employee
+from payroll.batch import BatchPayrollService, month_bounds
+from payroll.models import PayrollRunShard
+
+
+def _init_worker():
+    """Mỗi process con dùng kết nối DB riêng"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _run_shard(shard_id, month, start_id, end_id):
+    shard = PayrollRunShard.objects.get(pk=shard_id)
+    shard.status = 'running'
+    shard.started_at = timezone.now()
+    shard.error = ''
+    shard.save(update_fields=['status', 'started_at', 'error'])
+    try:
+        count = BatchPayrollService.run_shard(month, start_id, end_id)
+    except Exception as e:
+        PayrollRunShard.objects.filter(pk=shard_id).update(status='failed', error=str(e), finished_at=timezone.now())
+        raise
+    PayrollRunShard.objects.filter(pk=shard_id).update(status='done', record_count=count, finished_at=timezone.now())
+    return count
+
+
+class Command(BaseCommand):
+    help = 'Run month-end payroll for all active employees in parallel id-range shards (resumable)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', type=str, help='Payroll month (YYYY-MM). Defaults to the current month')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+        parser.add_argument('--shard-size', type=int, default=500, help='Width of each employee id range')
+        parser.add_argument('--restart', action='store_true', help='Ignore saved progress and recompute every shard')
+
+    def handle(self, *args, **options):
+        if options.get('month'):
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m').date()
+            except ValueError:
+                self.stdout.write(self.style.ERROR('Invalid month format. Use YYYY-MM.'))
+                return
+        else:
+            month = date.today().replace(day=1)
+        month, _ = month_bounds(month)
+        shard_size = max(options['shard_size'], 1)
+
+        employees = Employee.objects.filter(status='active')
+        shard_starts = sorted({emp_id // shard_size * shard_size for emp_id in employees.values_list('id', flat=True)})
+        if not shard_starts:
+            self.stdout.write(self.style.WARNING('No active employees found'))
+            return
+
+        if options['restart']:
+            PayrollRunShard.objects.filter(month=month).delete()
+
+        pending = []
+        for start_id in shard_starts:
+            shard, _ = PayrollRunShard.objects.get_or_create(month=month, start_id=start_id, end_id=start_id + shard_size)
+            if shard.status != 'done':
+                pending.append(shard)
+
+        skipped = len(shard_starts) - len(pending)
+        self.stdout.write(f'Payroll {month:%Y-%m}: {len(shard_starts)} shards, {skipped} already done, {len(pending)} to run')
+
+        failed = 0
+        total = 0
+        jobs = [(shard.pk, month, shard.start_id, shard.end_id) for shard in pending]
+        if options['workers'] <= 1:
+            for job in jobs:
+                try:
+                    total += _run_shard(*job)
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'  Shard [{job[2]}, {job[3]}) failed: {e}'))
+        else:
+            # Không chia sẻ kết nối DB của process cha cho các process con
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as executor:
+                futures = {executor.submit(_run_shard, *job): job for job in jobs}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        count = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(f'  Shard [{job[2]}, {job[3]}) failed: {e}'))
+                        continue
+                    total += count
+                    self.stdout.write(f'  Shard [{job[2]}, {job[3]}) done: {count} records')
+
+        if failed:
+            self.stdout.write(self.style.ERROR(f'{failed} shard(s) failed; rerun the command to resume'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Payroll completed: {total} salary records written'))
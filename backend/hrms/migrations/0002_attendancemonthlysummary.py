@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceMonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('worked_seconds', models.BigIntegerField(default=0)),
+                ('overtime_seconds', models.BigIntegerField(default=0)),
+                ('present_days', models.IntegerField(default=0)),
+                ('late_days', models.IntegerField(default=0)),
+                ('early_departure_days', models.IntegerField(default=0)),
+                ('incomplete_days', models.IntegerField(default=0)),
+                ('on_leave_days', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='hrms.employee')),
+            ],
+            options={
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0003_holiday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('timestamp', models.DateTimeField()),
+                ('type', models.CharField(choices=[('check_in', 'Check In'), ('start_break', 'Start Break'), ('end_break', 'End Break'), ('check_out', 'Check Out')], max_length=20)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('source', models.CharField(default='web', max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('applied', 'Applied'), ('rejected', 'Rejected')], default='pending', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_events', to='hrms.employee')),
+            ],
+            options={
+                'ordering': ['timestamp', 'id'],
+                'indexes': [models.Index(fields=['employee', 'date'], name='hrms_attend_employe_34bcd5_idx'), models.Index(fields=['status', 'id'], name='hrms_attend_status_48f19b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'timestamp', 'type'), name='unique_attendance_event')],
+            },
+        ),
+    ]
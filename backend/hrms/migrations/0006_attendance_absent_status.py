@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0005_attendance_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendance',
+            name='status',
+            field=models.CharField(choices=[('not_started', 'Not Started'), ('checked_in', 'Checked In'), ('on_break', 'On Break'), ('checked_out', 'Checked Out'), ('incomplete', 'Incomplete'), ('on_leave', 'On Leave'), ('absent', 'Absent')], default='not_started', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='attendancemonthlysummary',
+            name='absent_days',
+            field=models.IntegerField(default=0),
+        ),
+    ]
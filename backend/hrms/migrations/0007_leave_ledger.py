@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0006_attendance_absent_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('accrued', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('used', models.DecimalField(decimal_places=2, default=0, max_digits=7)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_balances', to='hrms.employee')),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hrms.leavetype')),
+            ],
+            options={
+                'ordering': ['-year', 'leave_type_id'],
+                'unique_together': {('employee', 'leave_type', 'year')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaveLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('kind', models.CharField(choices=[('accrual', 'Accrual'), ('usage', 'Usage'), ('reversal', 'Reversal'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('days', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('period', models.CharField(blank=True, max_length=7, null=True)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_ledger', to='hrms.employee')),
+                ('leave_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='hrms.leaverequest')),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hrms.leavetype')),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+                'indexes': [models.Index(fields=['employee', 'leave_type', 'year'], name='leave_ledger_balance_idx')],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'leave_type', 'kind', 'period'), name='unique_leave_accrual_period')],
+            },
+        ),
+    ]
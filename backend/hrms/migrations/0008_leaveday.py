@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:05
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def expand_leave_requests(apps, schema_editor):
+    """
+    Dựng chỉ mục ngày nghỉ cho các đơn đang chờ / đã duyệt. Đơn trùng ngày cũ: đơn đã duyệt giữ ngày
+    trước (close_day / current_status đọc LeaveDay approved), sau đó tới đơn tạo trước.
+    """
+    LeaveRequest = apps.get_model('hrms', 'LeaveRequest')
+    LeaveDay = apps.get_model('hrms', 'LeaveDay')
+    rows = []
+    # 'approved' < 'pending': đơn đã duyệt được ghi trước mọi đơn đang chờ
+    queryset = LeaveRequest.objects.filter(status__in=['pending', 'approved']).order_by('status', 'id')
+    for leave_request in queryset.iterator():
+        for offset in range((leave_request.end_date - leave_request.start_date).days + 1):
+            rows.append(LeaveDay(
+                employee_id=leave_request.employee_id,
+                day=leave_request.start_date + timedelta(days=offset),
+                leave_request_id=leave_request.id,
+                status=leave_request.status,
+            ))
+        if len(rows) >= 5000:
+            LeaveDay.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    LeaveDay.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0007_leave_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaveDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_days', to='hrms.employee')),
+                ('leave_request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leave_days', to='hrms.leaverequest')),
+            ],
+            options={
+                'ordering': ['employee', 'day'],
+                'unique_together': {('employee', 'day')},
+            },
+        ),
+        migrations.RunPython(expand_leave_requests, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hrms', '0008_leaveday'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leavetype',
+            name='accrual_method',
+            field=models.CharField(choices=[('yearly', 'Yearly'), ('monthly', 'Monthly'), ('none', 'None')], default='yearly', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='leavetype',
+            name='carry_over_max',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Số ngày còn lại tối đa được chuyển sang năm sau', max_digits=6),
+        ),
+        migrations.AddField(
+            model_name='leavetype',
+            name='max_balance',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Số dư tối đa trong năm (bỏ trống: không giới hạn)', max_digits=6, null=True),
+        ),
+        migrations.AddField(
+            model_name='leavetype',
+            name='prorate_new_hires',
+            field=models.BooleanField(default=True, help_text='Cấp theo tỷ lệ thời gian làm việc trong kỳ đầu'),
+        ),
+        migrations.CreateModel(
+            name='LeaveAccrualRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month the run was for')),
+                ('accrual_period', models.CharField(help_text="Kỳ cấp phép trong sổ cái ('2025' hoặc '2025-03')", max_length=7)),
+                ('employees', models.IntegerField(default=0, help_text='Nhân viên được xét')),
+                ('accrual_entries', models.IntegerField(default=0)),
+                ('accrued_days', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('carry_over_entries', models.IntegerField(default=0)),
+                ('carried_days', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('skipped', models.IntegerField(default=0, help_text='Nhân viên đã được cấp trong kỳ (chạy lại)')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('leave_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hrms.leavetype')),
+            ],
+            options={
+                'ordering': ['-started_at', '-id'],
+            },
+        ),
+    ]
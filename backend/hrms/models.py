@@ -3,9 +3,16 @@ from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
 from django.utils.text import slugify
-from django.db.models.signals import pre_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
-from datetime import time, timedelta
+from django.db.models import Sum, Count, Q
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, time, timedelta
+from . import attendance_calendar, attendance_counters, business_calendar, leave_calendar, live_events, status_cache
+
+# (employee_id, month) đang chờ cập nhật AttendanceMonthlySummary khi gom nhiều thay đổi
+_pending_summary_refresh = ContextVar('pending_summary_refresh', default=None)
 
 
 class Department(models.Model):
@@ -69,7 +76,10 @@ class Attendance(models.Model):
         ('checked_out', 'Checked Out'),
         ('incomplete', 'Incomplete'),
         ('on_leave', 'On Leave'),
+        ('absent', 'Absent'),
     ]
+    # Trạng thái do job đóng ngày (close_day) gán; punch đến trễ sẽ gấp lại cả ngày
+    AUTO_CLOSED_STATUSES = ('incomplete', 'absent')
     
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE) # nhan vien
     date = models.DateField() # ngay cham cong
@@ -104,10 +114,16 @@ class Attendance(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
-        unique_together = ('employee', 'date') # ensure one record per employee per day
-        ordering = ['-date', '-created_at'] # latest records first
+        unique_together = ('employee', 'date') # ensure one record per employee per day (cũng là index (employee, date))
+        ordering = ['-date', '-id'] # latest records first (khớp index, dùng cho cursor pagination)
+        indexes = [
+            models.Index(fields=['date', 'id'], name='attendance_date_id_idx'),
+            models.Index(fields=['date', 'status'], name='attendance_date_status_idx'),
+            models.Index(fields=['date', 'late_arrival'], name='attendance_date_late_idx'),
+        ]
     
-    def save(self, *args, **kwargs):
+    def compute_derived_fields(self):
+        """Tính total_hours, overtime, về sớm, đi muộn (dùng chung cho save() và ghi hàng loạt)"""
         # Auto-calculate total hours if both check_in and check_out exist
         if self.check_in and self.check_out:
             from datetime import datetime, timedelta
@@ -131,8 +147,31 @@ class Attendance(models.Model):
         # Check for late arrival when check_in is set
         if self.check_in and self.check_in > self.expected_start:
             self.late_arrival = True
-            
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Nhớ phần đóng góp vào bộ đếm dashboard để lần ghi sau chỉ cộng chênh lệch
+        if {'status', 'late_arrival', 'total_hours'} <= set(field_names):
+            instance._counted = attendance_counters.contribution(instance)
+        return instance
+    
+    def save(self, *args, **kwargs):
+        created = self._state.adding
+        self.compute_derived_fields()
         super().save(*args, **kwargs)
+        self.after_write(created=created)
+    
+    def after_write(self, created=False):
+        """Cập nhật bảng tổng hợp tháng, cache trạng thái, bộ đếm dashboard, lịch phòng ban và phát sự kiện sau khi ghi"""
+        AttendanceMonthlySummary.schedule_refresh(self.employee_id, self.date)
+        status_cache.invalidate(self.employee_id, self.date)
+        current = attendance_counters.contribution(self)
+        previous = (0,) * len(current) if created else getattr(self, '_counted', None)
+        attendance_counters.record_change(self.date, self.employee.department_id, previous, current)
+        attendance_calendar.bump_version(self.employee.department_id, self.date)
+        self._counted = current
+        live_events.publish_attendance(self)
     
     def is_late(self):
         """Check if employee arrived late"""
@@ -199,35 +238,143 @@ class Attendance(models.Model):
     @classmethod
     def create_leave_attendance(cls, employee, leave_request):
         """Create attendance records for approved leave days"""
+        leave_request.employee = employee
+        return cls.materialize_leave_requests([leave_request])
+    
+    @classmethod
+    def materialize_leave_requests(cls, leave_requests):
+        """
+        Tạo / cập nhật dòng on_leave cho các ngày làm việc của nhiều đơn nghỉ phép cùng lúc
+        (duyệt đơn, import, backfill): một SELECT các dòng sẵn có trong khoảng ngày, một
+        bulk_create cho ngày chưa có dòng và một bulk_update cho dòng not_started / incomplete / absent.
+        Trả về các dòng Attendance của những ngày nghỉ (kể cả dòng đã có chấm công, giữ nguyên).
+        """
         from datetime import timedelta
-        attendances = []
-        current_date = leave_request.start_date
+        targets = {}
+        for leave_request in leave_requests:
+            # Only create for working days (Monday to Friday, excluding holidays)
+            for current_date in business_calendar.working_days(leave_request.start_date, leave_request.end_date):
+                targets.setdefault((leave_request.employee_id, current_date), leave_request)
+        if not targets:
+            return []
         
-        while current_date <= leave_request.end_date:
-            # Only create for working days (Monday to Friday)
-            if current_date.weekday() < 5:  # 0-4 are Monday to Friday
-                attendance, created = cls.objects.get_or_create(
-                    employee=employee,
-                    date=current_date,
-                    defaults={
-                        'status': 'on_leave',
-                        'leave_request': leave_request,
-                        'notes': f'On {leave_request.leave_type.name} leave',
-                        'break_duration': timedelta(hours=0),
-                        'total_hours': None,
-                        'overtime_hours': None
-                    }
+        existing = {
+            (attendance.employee_id, attendance.date): attendance
+            for attendance in cls.objects.filter(
+                employee_id__in={employee_id for employee_id, _ in targets},
+                date__gte=min(day for _, day in targets),
+                date__lte=max(day for _, day in targets),
+            )
+        }
+        attendances, created, updated = [], [], []
+        for key, leave_request in targets.items():
+            notes = f'On {leave_request.leave_type.name} leave'
+            attendance = existing.get(key)
+            if attendance is None:
+                attendance = cls(
+                    employee=leave_request.employee,
+                    date=key[1],
+                    status='on_leave',
+                    leave_request=leave_request,
+                    notes=notes,
+                    break_duration=timedelta(hours=0),
+                    total_hours=None,
+                    overtime_hours=None
                 )
-                if not created and attendance.status in ['not_started', 'incomplete']:
-                    # Update existing record to leave status
-                    attendance.status = 'on_leave'
-                    attendance.leave_request = leave_request
-                    attendance.notes = f'On {leave_request.leave_type.name} leave'
-                    attendance.save()
-                attendances.append(attendance)
-            current_date += timedelta(days=1)
+                created.append(attendance)
+            elif attendance.status in ['not_started', 'incomplete', 'absent']:
+                # Update existing record to leave status
+                attendance.employee = leave_request.employee
+                attendance.status = 'on_leave'
+                attendance.leave_request = leave_request
+                attendance.notes = notes
+                attendance.compute_derived_fields()
+                updated.append(attendance)
+            attendances.append(attendance)
+        
+        with AttendanceMonthlySummary.batch_refresh():
+            cls.objects.bulk_create(created, batch_size=1000)
+            if updated:
+                from django.utils import timezone
+                now = timezone.now()
+                for attendance in updated:
+                    attendance.updated_at = now
+                cls.objects.bulk_update(updated, [
+                    'status', 'leave_request', 'notes', 'total_hours', 'overtime_hours',
+                    'late_arrival', 'early_departure', 'updated_at',
+                ], batch_size=1000)
+            for attendance in created:
+                attendance.after_write(created=True)
+            for attendance in updated:
+                attendance.after_write()
         
         return attendances
+
+    @classmethod
+    def release_leave_requests(cls, leave_requests):
+        """
+        Trả các dòng on_leave của đơn bị từ chối / hủy về not_started bằng một UPDATE, rồi cập nhật
+        bảng tổng hợp, bộ đếm dashboard, lịch phòng ban và phát sự kiện như một lần save().
+        Trả về các dòng đã trả lại.
+        """
+        from django.utils import timezone
+        released = list(cls.objects.filter(leave_request__in=leave_requests, status='on_leave').select_related('employee'))
+        if not released:
+            return []
+
+        now = timezone.now()
+        with AttendanceMonthlySummary.batch_refresh():
+            cls.objects.filter(pk__in=[attendance.pk for attendance in released]).update(
+                status='not_started',
+                leave_request=None,
+                notes='',
+                updated_at=now
+            )
+            for attendance in released:
+                attendance._counted = attendance_counters.contribution(attendance)
+                attendance.status = 'not_started'
+                attendance.leave_request = None
+                attendance.notes = ''
+                attendance.updated_at = now
+                attendance.after_write()
+        return released
+    
+    @classmethod
+    def close_day(cls, day):
+        """
+        Đóng sổ chấm công một ngày đã qua bằng vài câu lệnh theo tập hợp:
+        - dòng còn checked_in / on_break → incomplete (một UPDATE)
+        - nhân viên active không có dòng nào, không nghỉ phép được duyệt → dòng absent
+          (một SELECT + bulk INSERT), chỉ với ngày làm việc
+        Trả về (số dòng incomplete, số dòng absent).
+        """
+        from django.db import transaction
+        from django.db.models import Exists, OuterRef
+        from django.utils import timezone
+
+        with transaction.atomic():
+            dangling = cls.objects.filter(date=day, status__in=['checked_in', 'on_break'])
+            touched = set(dangling.values_list('employee_id', flat=True))
+            closed = dangling.update(status='incomplete', updated_at=timezone.now())
+
+            absent_ids = []
+            if business_calendar.is_working_day(day):
+                absent_ids = list(Employee.objects.filter(status='active', hire_date__lte=day).exclude(
+                    Exists(cls.objects.filter(employee=OuterRef('pk'), date=day))
+                ).exclude(
+                    Exists(LeaveDay.objects.filter(employee=OuterRef('pk'), day=day, status='approved'))
+                ).values_list('id', flat=True))
+                cls.objects.bulk_create([
+                    cls(employee_id=employee_id, date=day, status='absent', break_duration=timedelta(hours=0))
+                    for employee_id in absent_ids
+                ], batch_size=1000, ignore_conflicts=True)
+            touched.update(absent_ids)
+
+            if touched:
+                AttendanceMonthlySummary.rebuild(month=day, employee_ids=touched)
+                status_cache.invalidate_many(touched, day)
+                attendance_calendar.bump_versions(touched, day)
+        return closed, len(absent_ids)
     
     def __str__(self):
         return f"{self.employee.user.get_full_name()} - {self.date} ({self.get_status_display()})"
@@ -250,6 +397,204 @@ class Attendance(models.Model):
         except Exception as e:
             return "0h 0m"
 
+class AttendanceEvent(models.Model):
+    """
+    Nhật ký punch chỉ ghi thêm (check-in, break, check-out). Attendance là bản chiếu của
+    nhật ký này (xem hrms/attendance_projection.py); nội dung punch không bao giờ bị sửa,
+    projector chỉ ghi lại kết quả áp dụng (applied / rejected).
+    """
+    TYPE_CHOICES = [
+        ('check_in', 'Check In'),
+        ('start_break', 'Start Break'),
+        ('end_break', 'End Break'),
+        ('check_out', 'Check Out'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('applied', 'Applied'),
+        ('rejected', 'Rejected'),
+    ]
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_events')
+    date = models.DateField()  # ngày làm việc theo giờ Việt Nam
+    timestamp = models.DateTimeField()
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    location = models.CharField(max_length=255, blank=True)
+    source = models.CharField(max_length=20, default='web')  # web / device
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['timestamp', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'timestamp', 'type'], name='unique_attendance_event'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'date']),
+            models.Index(fields=['status', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.employee} - {self.type} @ {self.timestamp}"
+
+class AttendanceMonthlySummary(models.Model):
+    """
+    Tổng hợp chấm công theo tháng cho từng nhân viên.
+    Được cập nhật mỗi khi Attendance thay đổi để payroll/dashboard chỉ cần đọc 1 dòng.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_summaries')
+    month = models.DateField(help_text='First day of the month')
+    worked_seconds = models.BigIntegerField(default=0)
+    overtime_seconds = models.BigIntegerField(default=0)
+    present_days = models.IntegerField(default=0)
+    late_days = models.IntegerField(default=0)
+    early_departure_days = models.IntegerField(default=0)
+    incomplete_days = models.IntegerField(default=0)
+    on_leave_days = models.IntegerField(default=0)
+    absent_days = models.IntegerField(default=0)  # dòng absent do job đóng ngày tạo
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('employee', 'month')
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.month:%Y-%m}"
+
+    @property
+    def worked_hours(self):
+        return round(self.worked_seconds / 3600, 2)
+
+    @property
+    def overtime_hours(self):
+        return self.overtime_seconds / 3600
+
+    @staticmethod
+    def month_range(day):
+        """Return (first day of month, first day of next month) for a date"""
+        start = day.replace(day=1)
+        if start.month == 12:
+            return start, date(start.year + 1, 1, 1)
+        return start, date(start.year, start.month + 1, 1)
+
+    @staticmethod
+    def aggregates():
+        """Các biểu thức tổng hợp dùng chung cho refresh và rebuild"""
+        return {
+            'worked': Sum('total_hours'),
+            'overtime': Sum('overtime_hours'),
+            'present': Count('id', filter=Q(check_in__isnull=False)),
+            'late': Count('id', filter=Q(late_arrival=True)),
+            'early': Count('id', filter=Q(early_departure=True)),
+            'incomplete': Count('id', filter=Q(status='incomplete')),
+            'on_leave': Count('id', filter=Q(status='on_leave')),
+            'absent': Count('id', filter=Q(status='absent')),
+        }
+
+    @staticmethod
+    def values_from_aggregates(row):
+        return {
+            'worked_seconds': int(row['worked'].total_seconds()) if row['worked'] else 0,
+            'overtime_seconds': int(row['overtime'].total_seconds()) if row['overtime'] else 0,
+            'present_days': row['present'],
+            'late_days': row['late'],
+            'early_departure_days': row['early'],
+            'incomplete_days': row['incomplete'],
+            'on_leave_days': row['on_leave'],
+            'absent_days': row['absent'],
+        }
+
+    @classmethod
+    def refresh_for(cls, employee_id, day):
+        """Tính lại dòng tổng hợp của một nhân viên trong tháng chứa `day`"""
+        start, end = cls.month_range(day)
+        row = Attendance.objects.filter(
+            employee_id=employee_id,
+            date__gte=start,
+            date__lt=end
+        ).aggregate(**cls.aggregates())
+        summary, _ = cls.objects.update_or_create(
+            employee_id=employee_id,
+            month=start,
+            defaults=cls.values_from_aggregates(row)
+        )
+        return summary
+
+    @classmethod
+    def for_month(cls, employee, month):
+        """Lấy dòng tổng hợp, tự tạo nếu chưa có (dữ liệu cũ trước khi có bảng này)"""
+        summary = cls.objects.filter(employee=employee, month=month.replace(day=1)).first()
+        if summary is None:
+            summary = cls.refresh_for(employee.pk, month)
+        return summary
+
+    @classmethod
+    def schedule_refresh(cls, employee_id, day):
+        """Cập nhật ngay, hoặc gom lại nếu đang ở trong batch_refresh()"""
+        pending = _pending_summary_refresh.get()
+        if pending is not None:
+            pending.add((employee_id, day.replace(day=1)))
+        else:
+            cls.refresh_for(employee_id, day)
+
+    @classmethod
+    @contextmanager
+    def batch_refresh(cls):
+        """Gom các thay đổi Attendance và chỉ tính lại mỗi (employee, month) một lần khi kết thúc"""
+        if _pending_summary_refresh.get() is not None:
+            yield
+            return
+        pending = set()
+        token = _pending_summary_refresh.set(pending)
+        try:
+            yield
+        finally:
+            _pending_summary_refresh.reset(token)
+        for employee_id, month in pending:
+            cls.refresh_for(employee_id, month)
+
+    @classmethod
+    def rebuild(cls, month=None, employee_ids=None):
+        """Xây lại bảng tổng hợp bằng một query GROUP BY (cho một tháng hoặc toàn bộ)"""
+        from django.db import transaction
+        from django.db.models.functions import TruncMonth
+
+        attendances = Attendance.objects.all()
+        summaries = cls.objects.all()
+        if month is not None:
+            start, end = cls.month_range(month)
+            attendances = attendances.filter(date__gte=start, date__lt=end)
+            summaries = summaries.filter(month=start)
+        if employee_ids is not None:
+            attendances = attendances.filter(employee_id__in=employee_ids)
+            summaries = summaries.filter(employee_id__in=employee_ids)
+
+        rows = attendances.annotate(summary_month=TruncMonth('date')).values(
+            'employee_id', 'summary_month'
+        ).annotate(**cls.aggregates()).order_by()
+
+        objs = [
+            cls(employee_id=row['employee_id'], month=row['summary_month'], **cls.values_from_aggregates(row))
+            for row in rows
+        ]
+        with transaction.atomic():
+            summaries.delete()
+            cls.objects.bulk_create(objs, batch_size=1000)
+        return len(objs)
+
+
+@receiver(post_delete, sender=Attendance)
+def refresh_summary_on_attendance_delete(sender, instance, **kwargs):
+    AttendanceMonthlySummary.schedule_refresh(instance.employee_id, instance.date)
+    status_cache.invalidate(instance.employee_id, instance.date)
+    try:
+        department_id = instance.employee.department_id
+    except Employee.DoesNotExist:  # xóa dây chuyền cùng nhân viên
+        department_id = None
+    counted = getattr(instance, '_counted', None)
+    attendance_counters.record_change(instance.date, department_id, counted, (0,) * len(attendance_counters.COUNTERS))
+    attendance_calendar.bump_version(department_id, instance.date)
+
 class LeaveType(models.Model):
     name = models.CharField(max_length=50, unique=True)
     code = models.CharField(max_length=10, unique=True, blank=True, null=True)
@@ -257,10 +602,33 @@ class LeaveType(models.Model):
     description = models.TextField(blank=True)
     max_days_per_year = models.IntegerField(default=12)
     is_paid = models.BooleanField(default=True)
+
+    # Chính sách cấp phép (lệnh run_leave_accruals, xem hrms/leave_accrual.py)
+    ACCRUAL_CHOICES = [
+        ('yearly', 'Yearly'),    # cấp max_days_per_year một lần mỗi năm
+        ('monthly', 'Monthly'),  # cấp max_days_per_year / 12 mỗi tháng
+        ('none', 'None'),        # không tự cấp (chỉ điều chỉnh tay)
+    ]
+    accrual_method = models.CharField(max_length=10, choices=ACCRUAL_CHOICES, default='yearly')
+    max_balance = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True,
+                                      help_text='Số dư tối đa trong năm (bỏ trống: không giới hạn)')
+    carry_over_max = models.DecimalField(max_digits=6, decimal_places=2, default=0,
+                                         help_text='Số ngày còn lại tối đa được chuyển sang năm sau')
+    prorate_new_hires = models.BooleanField(default=True, help_text='Cấp theo tỷ lệ thời gian làm việc trong kỳ đầu')
     
     def __str__(self):
         return self.name
 
+    @property
+    def tracks_balance(self):
+        """Loại nghỉ 'none' (vd. nghỉ không lương) không bị giới hạn bởi số dư khi duyệt"""
+        return self.accrual_method != 'none'
+
+    def opening_days(self, employee, year):
+        """Số ngày cấp khi số dư của năm được tạo mà chưa có cấp phép nào"""
+        from .leave_accrual import opening_entries
+        return sum((entry.days for entry in opening_entries(self, employee.pk, employee.hire_date, year)), 0)
+
 class LeavePenalty(models.Model):
     leave_type = models.ForeignKey('LeaveType', on_delete=models.CASCADE, related_name='penalties')
     penalty_percent = models.DecimalField(max_digits=5, decimal_places=2, help_text='Phần trăm phạt lương khi nghỉ loại này (VD: 50.00 cho 50%)')
@@ -273,6 +641,23 @@ def generate_code(sender, instance, **kwargs):
         if not instance.code:
             instance.code = slugify(instance.name)[:10].upper()
 
+class Holiday(models.Model):
+    """Ngày nghỉ lễ: không tính là ngày làm việc (không tính vắng, không trừ ngày phép)"""
+    date = models.DateField(unique=True)
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.name} ({self.date})"
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def clear_business_calendar(sender, instance, **kwargs):
+    business_calendar.clear_cache()
+
 class LeaveRequest(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -297,57 +682,484 @@ class LeaveRequest(models.Model):
         if self.start_date > self.end_date:
             raise ValidationError("Ngày bắt đầu phải trước hoặc bằng ngày kết thúc.")
 
-        # Tính số ngày nghỉ không bao gồm Thứ Bảy và Chủ Nhật
+        # Hai đơn đang chờ / đã duyệt của cùng nhân viên không được trùng ngày (range scan trên LeaveDay)
+        if self.status in LeaveDay.ACTIVE_STATUSES and LeaveDay.overlaps(self):
+            raise ValidationError("Đơn nghỉ bị trùng với một đơn khác đang chờ duyệt hoặc đã duyệt.")
+
+        # Tính số ngày nghỉ không bao gồm Thứ Bảy, Chủ Nhật và ngày lễ
         if not self.days_requested:
-            current_day = self.start_date
-            total_days = 0
-            while current_day <= self.end_date:
-                if current_day.weekday() < 5:  # 0 = Thứ Hai, ..., 4 = Thứ Sáu
-                    total_days += 1
-                current_day += timedelta(days=1)
-            self.days_requested = total_days
-
-        if self.status == 'approved' and self.days_requested > self.employee.annual_leave_remaining:
+            self.days_requested = business_calendar.count_working_days(self.start_date, self.end_date)
+
+        # Số dư theo loại nghỉ và năm: một lần đọc LeaveBalance theo unique index
+        if (self.status == 'approved' and self.leave_type.tracks_balance
+                and self.days_requested > LeaveBalance.available_for(self)):
             raise ValidationError("Không đủ số ngày nghỉ còn lại.")
 
     def save(self, *args, **kwargs):
+        from django.db import IntegrityError, transaction
+
         self.full_clean()
-        
-        # Track if this is a status change to approved
-        was_approved = False
-        if self.pk:
-            old_instance = LeaveRequest.objects.get(pk=self.pk)
-            was_approved = old_instance.status != 'approved' and self.status == 'approved'
-        else:
-            was_approved = self.status == 'approved'
-        
-        if self.status == 'approved' and self.response_date and self.approved_by:
-            if self.leave_type.code == 'AL':  # Annual Leave
-                self.employee.annual_leave_remaining -= self.days_requested
-                self.employee.save()
-            
-            # Create attendance records for approved leave days
+
+        # Một transaction cho cả lần lưu: khóa đơn và dòng số dư, kiểm tra lại số dư,
+        # ghi đơn, LeaveDay và sổ cái cùng nhau (giống bulk_respond)
+        with transaction.atomic():
+            # Track if this is a status change to approved
+            was_approved = False
+            was_revoked = False
+            if self.pk:
+                old_instance = LeaveRequest.objects.select_for_update().get(pk=self.pk)
+                was_approved = old_instance.status != 'approved' and self.status == 'approved'
+                was_revoked = old_instance.status == 'approved' and self.status != 'approved'
+            else:
+                was_approved = self.status == 'approved'
+
+            # clean() đọc số dư không khóa: kiểm tra lại khi đã giữ dòng LeaveBalance,
+            # để hai lần duyệt song song không cùng vượt số dư
+            if was_approved and self.leave_type.tracks_balance:
+                LeaveBalance.lock([LeaveBalance.key_for(self)])
+                if self.days_requested > LeaveBalance.available_for(self):
+                    raise ValidationError("Không đủ số ngày nghỉ còn lại.")
+
+            if self.status == 'approved' and self.response_date and self.approved_by:
+                if self.leave_type.code == 'AL':  # Annual Leave
+                    self.employee.annual_leave_remaining -= self.days_requested
+                    self.employee.save()
+
+                # Create attendance records for approved leave days
+                if was_approved:
+                    Attendance.create_leave_attendance(self.employee, self)
+
+            # If leave was rejected or cancelled, remove leave status from attendance
+            elif self.status in ['rejected', 'cancelled'] and self.pk:
+                Attendance.release_leave_requests([self])
+
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                    LeaveDay.sync([self])
+            except IntegrityError:
+                # Đơn trùng ngày được tạo song song, lọt qua kiểm tra trong clean()
+                raise ValidationError("Đơn nghỉ bị trùng với một đơn khác đang chờ duyệt hoặc đã duyệt.")
+            # Sổ cái ngày phép: trừ khi duyệt, hoàn lại khi đơn đã duyệt bị từ chối / hủy
             if was_approved:
-                Attendance.create_leave_attendance(self.employee, self)
-        
-        # If leave was rejected or cancelled, remove leave status from attendance
-        elif self.status in ['rejected', 'cancelled'] and self.pk:
-            Attendance.objects.filter(
-                employee=self.employee,
-                leave_request=self,
-                status='on_leave'
-            ).update(
-                status='not_started',
-                leave_request=None,
-                notes=''
+                LeaveBalance.charge_requests([self])
+            elif was_revoked:
+                LeaveBalance.reverse_requests([self])
+        # Trạng thái nghỉ phép hiển thị ở current_status
+        status_cache.invalidate_range(self.employee_id, self.start_date, self.end_date)
+        leave_calendar.bump_versions([self.employee.department_id])
+        live_events.publish_status_changed(self.employee_id)
+
+    @classmethod
+    def bulk_respond(cls, ids, status, approved_by, comments=''):
+        """
+        Duyệt / từ chối nhiều đơn đang chờ trong một transaction:
+        - SELECT ... FOR UPDATE các đơn, nhân viên và dòng LeaveBalance liên quan; số dư được
+          kiểm tra theo thứ tự gửi đơn và trừ dần như khi duyệt từng đơn
+        - một bulk_update trạng thái đơn, một bulk_update annual_leave_remaining
+        - ghi sổ cái ngày phép và materialize_leave_requests cho các đơn được duyệt
+        Chỉ đơn 'pending' được xử lý. Trả về kết quả theo đúng thứ tự ids:
+        {'id', 'status': 'approved' | 'rejected' | 'failed' | 'not_found', 'error'?}
+        """
+        from django.db import transaction
+        from django.utils import timezone
+
+        now = timezone.now()
+        results = {}
+        with transaction.atomic():
+            requests = list(cls.objects.select_for_update().select_related('employee', 'leave_type').filter(
+                id__in=set(ids),
+            ).order_by('request_date', 'id'))
+            annual = dict(Employee.objects.select_for_update().filter(
+                id__in={leave_request.employee_id for leave_request in requests},
+            ).values_list('id', 'annual_leave_remaining'))
+            available = {}
+            if status == 'approved':
+                available = {key: balance.remaining for key, balance in LeaveBalance.lock(
+                    LeaveBalance.key_for(leave_request) for leave_request in requests
+                    if leave_request.status == 'pending'
+                ).items()}
+
+            decided, used = [], set()
+            for leave_request in requests:
+                if leave_request.status != 'pending':
+                    results[leave_request.id] = {'id': leave_request.id, 'status': 'failed',
+                                                 'error': f'Leave request is already {leave_request.status}'}
+                    continue
+                if not leave_request.days_requested:
+                    leave_request.days_requested = business_calendar.count_working_days(
+                        leave_request.start_date, leave_request.end_date,
+                    )
+                if status == 'approved':
+                    key = LeaveBalance.key_for(leave_request)
+                    if leave_request.leave_type.tracks_balance and leave_request.days_requested > available[key]:
+                        results[leave_request.id] = {'id': leave_request.id, 'status': 'failed',
+                                                     'error': 'Không đủ số ngày nghỉ còn lại.'}
+                        continue
+                    available[key] -= leave_request.days_requested
+                    if leave_request.leave_type.code == 'AL':  # Annual Leave
+                        annual[leave_request.employee_id] -= leave_request.days_requested
+                        used.add(leave_request.employee_id)
+                leave_request.status = status
+                leave_request.response_date = now
+                leave_request.approved_by = approved_by
+                if comments:
+                    leave_request.comments = comments
+                decided.append(leave_request)
+                results[leave_request.id] = {'id': leave_request.id, 'status': status}
+
+            cls.objects.bulk_update(decided, ['status', 'response_date', 'approved_by', 'days_requested', 'comments'],
+                                    batch_size=1000)
+            LeaveDay.sync(decided)
+            Employee.objects.bulk_update(
+                [Employee(id=employee_id, annual_leave_remaining=annual[employee_id]) for employee_id in used],
+                ['annual_leave_remaining'], batch_size=1000,
             )
-        
-        super().save(*args, **kwargs)
+            for leave_request in decided:
+                leave_request.employee.annual_leave_remaining = annual[leave_request.employee_id]
+            if status == 'approved':
+                LeaveBalance.charge_requests(decided)
+                Attendance.materialize_leave_requests(decided)
+
+            for leave_request in decided:
+                status_cache.invalidate_range(leave_request.employee_id, leave_request.start_date, leave_request.end_date)
+            leave_calendar.bump_versions(leave_request.employee.department_id for leave_request in decided)
+            for employee_id in {leave_request.employee_id for leave_request in decided}:
+                live_events.publish_status_changed(employee_id)
+
+        return [results.get(pk, {'id': pk, 'status': 'not_found', 'error': 'Leave request not found'}) for pk in ids]
 
     def __str__(self):
         return f"{self.employee} - {self.leave_type.name} ({self.status})"
 
 
+@receiver(post_delete, sender=LeaveRequest)
+def refresh_leave_calendar_on_delete(sender, instance, **kwargs):
+    try:
+        leave_calendar.bump_versions([instance.employee.department_id])
+    except Employee.DoesNotExist:  # xóa dây chuyền cùng nhân viên
+        pass
+
+
+class LeaveDay(models.Model):
+    """
+    Chỉ mục ngày nghỉ: mỗi ngày trong khoảng của một đơn đang chờ / đã duyệt là một dòng.
+    Unique (employee, day) khiến hai đơn còn hiệu lực không thể trùng nhau, và "nhân viên có
+    nghỉ ngày X không" là một lần đọc theo unique index thay vì quét khoảng trên LeaveRequest.
+    Đồng bộ với đơn trong LeaveRequest.save / bulk_respond (LeaveDay.sync).
+    """
+    ACTIVE_STATUSES = ('pending', 'approved')
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='leave_days')
+    day = models.DateField()
+    leave_request = models.ForeignKey(LeaveRequest, on_delete=models.CASCADE, related_name='leave_days')
+    status = models.CharField(max_length=20, choices=LeaveRequest.STATUS_CHOICES)
+
+    class Meta:
+        unique_together = ('employee', 'day')
+        ordering = ['employee', 'day']
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.day} ({self.status})"
+
+    @staticmethod
+    def expand(leave_request):
+        days = (leave_request.end_date - leave_request.start_date).days + 1
+        return [leave_request.start_date + timedelta(days=offset) for offset in range(days)]
+
+    @classmethod
+    def overlaps(cls, leave_request):
+        """Có đơn còn hiệu lực khác của nhân viên giao với khoảng ngày của đơn này không"""
+        queryset = cls.objects.filter(
+            employee_id=leave_request.employee_id,
+            day__gte=leave_request.start_date,
+            day__lte=leave_request.end_date,
+        )
+        if leave_request.pk:
+            queryset = queryset.exclude(leave_request_id=leave_request.pk)
+        return queryset.exists()
+
+    @classmethod
+    def sync(cls, leave_requests):
+        """Ghi lại các ngày của đơn: đơn pending / approved có đủ ngày, đơn khác không còn dòng nào"""
+        cls.objects.filter(leave_request_id__in=[leave_request.pk for leave_request in leave_requests]).delete()
+        cls.objects.bulk_create([
+            cls(employee_id=leave_request.employee_id, day=day, leave_request_id=leave_request.pk,
+                status=leave_request.status)
+            for leave_request in leave_requests if leave_request.status in cls.ACTIVE_STATUSES
+            for day in cls.expand(leave_request)
+        ], batch_size=1000)
+
+    @classmethod
+    def approved_on(cls, keys):
+        """{(employee_id, ngày): LeaveRequest đã duyệt (kèm leave_type)} cho các khóa đang nghỉ"""
+        keys = set(keys)
+        if not keys:
+            return {}
+        leave_days = cls.objects.select_related('leave_request__leave_type').filter(
+            employee_id__in={employee_id for employee_id, _ in keys},
+            day__in={day for _, day in keys},
+            status='approved',
+        )
+        return {
+            (leave_day.employee_id, leave_day.day): leave_day.leave_request
+            for leave_day in leave_days if (leave_day.employee_id, leave_day.day) in keys
+        }
+
+
+class LeaveLedgerEntry(models.Model):
+    """
+    Sổ cái ngày phép chỉ ghi thêm theo (nhân viên, loại nghỉ, năm): cấp phép (accrual, số dương),
+    sử dụng khi đơn được duyệt (usage, số âm), hoàn lại khi đơn đã duyệt bị từ chối / hủy
+    (reversal, số dương) và điều chỉnh tay (adjustment). LeaveBalance là số dư tính sẵn từ sổ cái.
+    """
+    KIND_CHOICES = [
+        ('accrual', 'Accrual'),
+        ('usage', 'Usage'),
+        ('reversal', 'Reversal'),
+        ('adjustment', 'Adjustment'),
+    ]
+    ACCRUAL_KINDS = ('accrual', 'adjustment')
+    USAGE_KINDS = ('usage', 'reversal')
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='leave_ledger')
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    days = models.DecimalField(max_digits=6, decimal_places=2)
+    # Kỳ cấp phép ('2025' hoặc '2025-03'); NULL với bút toán khác nên unique chỉ chặn cấp trùng kỳ
+    period = models.CharField(max_length=7, null=True, blank=True)
+    leave_request = models.ForeignKey(LeaveRequest, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='ledger_entries')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['employee', 'leave_type', 'kind', 'period'], name='unique_leave_accrual_period'),
+        ]
+        indexes = [
+            models.Index(fields=['employee', 'leave_type', 'year'], name='leave_ledger_balance_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.leave_type_id} {self.year}: {self.kind} {self.days}"
+
+
+class LeaveBalance(models.Model):
+    """
+    Số dư ngày phép tính sẵn cho mỗi (nhân viên, loại nghỉ, năm), cập nhật trong cùng transaction
+    với bút toán sổ cái (LeaveBalance.post) và dựng lại được từ sổ cái (LeaveBalance.rebuild).
+    Lần đầu chạm tới một (nhân viên, loại nghỉ, năm) chưa có cấp phép nào, các kỳ lẽ ra đã được cấp
+    được ghi trước (kỳ cả năm với loại cấp theo năm, từng tháng tới nay với loại cấp theo tháng), tính
+    như run_leave_accruals: theo tỷ lệ với nhân viên mới, không vượt max_balance (leave_accrual.opening_entries).
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='leave_balances')
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE)
+    year = models.PositiveSmallIntegerField()
+    accrued = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    used = models.DecimalField(max_digits=7, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('employee', 'leave_type', 'year')
+        ordering = ['-year', 'leave_type_id']
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.leave_type_id} {self.year}: {self.remaining}"
+
+    @property
+    def remaining(self):
+        return self.accrued - self.used
+
+    @property
+    def key(self):
+        return (self.employee_id, self.leave_type_id, self.year)
+
+    def apply(self, entry):
+        if entry.kind in LeaveLedgerEntry.USAGE_KINDS:
+            self.used -= entry.days
+        else:
+            self.accrued += entry.days
+
+    @staticmethod
+    def key_for(leave_request):
+        """Đơn nghỉ được tính vào năm của ngày bắt đầu"""
+        return (leave_request.employee_id, leave_request.leave_type_id, leave_request.start_date.year)
+
+    @staticmethod
+    def _filter_keys(queryset, keys):
+        return queryset.filter(
+            employee_id__in={key[0] for key in keys},
+            leave_type_id__in={key[1] for key in keys},
+            year__in={key[2] for key in keys},
+        )
+
+    @classmethod
+    def available_for(cls, leave_request):
+        """Số ngày còn được duyệt cho đơn (cộng lại phần chính đơn này đã trừ, nếu có)"""
+        employee_id, leave_type_id, year = cls.key_for(leave_request)
+        balance = cls.objects.filter(employee_id=employee_id, leave_type_id=leave_type_id, year=year).first()
+        available = balance.remaining if balance else leave_request.leave_type.opening_days(leave_request.employee, year)
+        if leave_request.pk:
+            charged = LeaveLedgerEntry.objects.filter(leave_request_id=leave_request.pk).aggregate(total=Sum('days'))['total']
+            available -= charged or 0
+        return available
+
+    @classmethod
+    def lock(cls, keys):
+        """
+        SELECT ... FOR UPDATE các dòng số dư (phải gọi trong transaction). Dòng chưa có được tạo,
+        kèm bút toán cấp phép cả năm nếu sổ cái chưa có cấp phép nào cho khóa đó.
+        """
+        keys = set(keys)
+        if not keys:
+            return {}
+        balances = {
+            balance.key: balance for balance in cls._filter_keys(cls.objects.select_for_update(), keys)
+            if balance.key in keys
+        }
+        missing = keys - balances.keys()
+        if not missing:
+            return balances
+
+        cls.objects.bulk_create([cls(employee_id=e, leave_type_id=t, year=y) for e, t, y in missing],
+                                batch_size=1000, ignore_conflicts=True)
+        for balance in cls._filter_keys(cls.objects.select_for_update(), missing):
+            if balance.key in missing:
+                balances[balance.key] = balance
+        # Đọc có khóa: thấy cả cấp phép vừa commit bởi transaction khác đã giữ dòng số dư trước
+        opened = set(cls._filter_keys(LeaveLedgerEntry.objects.select_for_update(), missing).filter(
+            kind='accrual',
+        ).values_list('employee_id', 'leave_type_id', 'year'))
+        from .leave_accrual import opening_entries
+        leave_types = LeaveType.objects.in_bulk({key[1] for key in missing})
+        hire_dates = dict(Employee.objects.filter(id__in={key[0] for key in missing}).values_list('id', 'hire_date'))
+        openings = [
+            entry
+            for e, t, y in missing if (e, t, y) not in opened
+            for entry in opening_entries(leave_types[t], e, hire_dates[e], y)
+        ]
+        LeaveLedgerEntry.objects.bulk_create(openings, batch_size=1000)
+        for entry in openings:
+            balances[(entry.employee_id, entry.leave_type_id, entry.year)].apply(entry)
+        cls.objects.bulk_update([balances[key] for key in missing], ['accrued', 'used', 'updated_at'], batch_size=1000)
+        return balances
+
+    @classmethod
+    def post(cls, entries):
+        """Ghi các bút toán và cộng vào số dư trong cùng một transaction; trả về {khóa: LeaveBalance}"""
+        from django.db import transaction
+        from django.utils import timezone
+
+        if not entries:
+            return {}
+        with transaction.atomic():
+            balances = cls.lock((entry.employee_id, entry.leave_type_id, entry.year) for entry in entries)
+            LeaveLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+            now = timezone.now()
+            touched = {}
+            for entry in entries:
+                balance = balances[(entry.employee_id, entry.leave_type_id, entry.year)]
+                balance.apply(entry)
+                balance.updated_at = now
+                touched[balance.key] = balance
+            cls.objects.bulk_update(touched.values(), ['accrued', 'used', 'updated_at'], batch_size=1000)
+        return balances
+
+    @classmethod
+    def charge_requests(cls, leave_requests):
+        """Bút toán usage cho các đơn vừa được duyệt"""
+        return cls.post([
+            LeaveLedgerEntry(
+                employee_id=leave_request.employee_id, leave_type_id=leave_request.leave_type_id,
+                year=cls.key_for(leave_request)[2], kind='usage', days=-leave_request.days_requested,
+                leave_request=leave_request, note=f'Leave request #{leave_request.pk}',
+            )
+            for leave_request in leave_requests if leave_request.days_requested
+        ])
+
+    @classmethod
+    def reverse_requests(cls, leave_requests):
+        """Bút toán reversal hoàn lại phần còn đang trừ của các đơn (một query GROUP BY theo đơn)"""
+        charged = LeaveLedgerEntry.objects.filter(
+            leave_request_id__in=[leave_request.pk for leave_request in leave_requests],
+            kind__in=LeaveLedgerEntry.USAGE_KINDS,
+        ).values('leave_request_id', 'employee_id', 'leave_type_id', 'year').annotate(net=Sum('days')).order_by()
+        return cls.post([
+            LeaveLedgerEntry(
+                employee_id=row['employee_id'], leave_type_id=row['leave_type_id'], year=row['year'],
+                kind='reversal', days=-row['net'], leave_request_id=row['leave_request_id'],
+                note=f"Leave request #{row['leave_request_id']} revoked",
+            )
+            for row in charged if row['net'] < 0
+        ])
+
+    @classmethod
+    def rebuild(cls, year=None, employee_ids=None):
+        """Dựng lại bảng số dư từ sổ cái bằng một query GROUP BY (một năm hoặc toàn bộ)"""
+        from django.db import transaction
+
+        entries = LeaveLedgerEntry.objects.all()
+        balances = cls.objects.all()
+        if year is not None:
+            entries = entries.filter(year=year)
+            balances = balances.filter(year=year)
+        if employee_ids is not None:
+            entries = entries.filter(employee_id__in=employee_ids)
+            balances = balances.filter(employee_id__in=employee_ids)
+
+        rows = entries.values('employee_id', 'leave_type_id', 'year').annotate(
+            accrued=Sum('days', filter=Q(kind__in=LeaveLedgerEntry.ACCRUAL_KINDS)),
+            used=Sum('days', filter=Q(kind__in=LeaveLedgerEntry.USAGE_KINDS)),
+        ).order_by()
+        objs = [
+            cls(employee_id=row['employee_id'], leave_type_id=row['leave_type_id'], year=row['year'],
+                accrued=row['accrued'] or 0, used=-(row['used'] or 0))
+            for row in rows
+        ]
+        with transaction.atomic():
+            balances.delete()
+            cls.objects.bulk_create(objs, batch_size=1000)
+        return len(objs)
+
+    @classmethod
+    def backfill_approved(cls, year=None):
+        """Ghi usage cho các đơn đã duyệt từ trước khi có sổ cái (chưa có bút toán nào)"""
+        from django.db.models import Exists, OuterRef
+
+        leave_requests = LeaveRequest.objects.filter(status='approved').exclude(
+            Exists(LeaveLedgerEntry.objects.filter(leave_request=OuterRef('pk')))
+        )
+        if year is not None:
+            leave_requests = leave_requests.filter(start_date__year=year)
+        leave_requests = list(leave_requests)
+        cls.charge_requests(leave_requests)
+        return len(leave_requests)
+
+
+class LeaveAccrualRun(models.Model):
+    """Một lần chạy run_leave_accruals cho một kỳ: số bút toán và số ngày đã ghi vào sổ cái"""
+    period = models.DateField(help_text='First day of the month the run was for')
+    leave_type = models.ForeignKey(LeaveType, on_delete=models.CASCADE)
+    accrual_period = models.CharField(max_length=7, help_text="Kỳ cấp phép trong sổ cái ('2025' hoặc '2025-03')")
+    employees = models.IntegerField(default=0, help_text='Nhân viên được xét')
+    accrual_entries = models.IntegerField(default=0)
+    accrued_days = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    carry_over_entries = models.IntegerField(default=0)
+    carried_days = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    skipped = models.IntegerField(default=0, help_text='Nhân viên đã được cấp trong kỳ (chạy lại)')
+    started_at = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-started_at', '-id']
+
+    def __str__(self):
+        return f"{self.leave_type_id} {self.accrual_period}: {self.accrual_entries} entries"
+
+
 class Performance(models.Model):
     RATING_CHOICES = [
         (1, 'Poor'),
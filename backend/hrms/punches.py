@@ -0,0 +1,111 @@
+"""
+Punch ingestion
+===============
+
+POST /api/attendance/punches/ nhận một mảng lần chấm công từ máy chấm công / gateway:
+
+    [{"employee": 12, "timestamp": "2025-03-03T08:57:12+07:00", "type": "check_in", "location": "Gate A"}, ...]
+
+Cả lô được ghi vào nhật ký AttendanceEvent bằng một bulk INSERT trong một transaction,
+rồi chiếu vào Attendance (xem hrms/attendance_projection.py) theo cùng state machine
+với các action check_in / start_break / end_break / check_out.
+
+- Event được sắp theo thời gian khi chiếu nên thứ tự gửi lên không quan trọng; punch đến
+  trễ làm ngày đó được gấp lại từ đầu
+- Punch trùng (cùng nhân viên, loại và thời điểm) trả về 'duplicate', không ghi thêm
+- Timestamp không có múi giờ được hiểu là giờ Việt Nam
+- Khi ATTENDANCE_PROJECTION khác 'sync', punch hợp lệ trả về 'accepted' và được chiếu sau
+"""
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from . import attendance_projection as projection
+from .models import AttendanceEvent, Employee
+
+MAX_BATCH_SIZE = 5000
+
+
+def parse_punch(item, default_location=''):
+    """(employee_id, datetime giờ VN, type, location) hoặc raise ValueError"""
+    if not isinstance(item, dict):
+        raise ValueError('Punch must be an object')
+    try:
+        employee_id = int(item.get('employee'))
+    except (TypeError, ValueError):
+        raise ValueError('employee must be an employee id')
+    punch_type = item.get('type')
+    if punch_type not in projection.PUNCH_TYPES:
+        raise ValueError(f"type must be one of {', '.join(projection.PUNCH_TYPES)}")
+    timestamp = item.get('timestamp')
+    moment = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if moment is None:
+        raise ValueError('timestamp must be an ISO 8601 datetime')
+    location = str(item.get('location') or default_location)[:255]
+    return employee_id, projection.to_vietnam_time(moment), punch_type, location
+
+
+def ingest_punches(items, default_location='', source='device'):
+    """
+    Ghi và chiếu một lô punch. Trả về danh sách kết quả theo đúng thứ tự đầu vào:
+    {'index', 'status': 'applied' | 'accepted' | 'duplicate' | 'rejected', 'error'?, 'attendance_status'?}
+    """
+    results = [None] * len(items)
+    events = {}
+    for index, item in enumerate(items):
+        try:
+            employee_id, moment, punch_type, location = parse_punch(item, default_location)
+        except ValueError as exc:
+            results[index] = {'index': index, 'status': 'rejected', 'error': str(exc)}
+            continue
+        key = (employee_id, moment, punch_type)
+        if key in events:
+            results[index] = {'index': index, 'status': 'duplicate'}
+            continue
+        events[key] = (index, AttendanceEvent(
+            employee_id=employee_id, date=moment.date(), timestamp=moment,
+            type=punch_type, location=location, source=source,
+        ))
+
+    if not events:
+        return results
+
+    known = set(Employee.objects.filter(id__in={key[0] for key in events}).values_list('id', flat=True))
+    for key, (index, _) in list(events.items()):
+        if key[0] not in known:
+            results[index] = {'index': index, 'status': 'rejected', 'error': 'Employee not found'}
+            del events[key]
+
+    with transaction.atomic():
+        existing = set(AttendanceEvent.objects.filter(
+            employee_id__in={key[0] for key in events},
+            date__in={event.date for _, event in events.values()},
+        ).values_list('employee_id', 'timestamp', 'type'))
+        new_events = []
+        for key, (index, event) in events.items():
+            if key in existing:
+                results[index] = {'index': index, 'status': 'duplicate'}
+            else:
+                new_events.append(event)
+        # ignore_conflicts: punch trùng do hai gateway gửi song song
+        AttendanceEvent.objects.bulk_create(new_events, ignore_conflicts=True)
+
+        if projection.projection_mode() != 'sync':
+            projection.schedule_projection()
+            for event in new_events:
+                index = events[(event.employee_id, event.timestamp, event.type)][0]
+                results[index] = {'index': index, 'status': 'accepted'}
+            return results
+
+        days = {(event.employee_id, event.date) for event in new_events}
+        for attendance, day_events in projection.project_days(days).values():
+            for event in day_events:
+                entry = events.get((event.employee_id, event.timestamp, event.type))
+                if entry is None or results[entry[0]] is not None:
+                    continue
+                index = entry[0]
+                results[index] = {'index': index, 'status': event.status, 'attendance_status': attendance.status}
+                if event.error:
+                    results[index]['error'] = event.error
+
+    return results
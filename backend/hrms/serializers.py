@@ -2,8 +2,10 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.utils import timezone
-from .models import Employee, Department, Position, Attendance, LeaveRequest, LeaveType, Performance
+from .models import Employee, Department, Position, Attendance, LeaveBalance, LeaveRequest, LeaveType, Performance
 from django.core.exceptions import ValidationError
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Concat
 from django.utils import timezone
 
 # --- SignUp Serializer ---
@@ -240,6 +242,114 @@ class AttendanceSerializer(serializers.ModelSerializer):
         """Check if attendance is for a leave day"""
         return obj.is_on_leave()
 
+def _duration_hms(value):
+    """Định dạng HH:MM:00 giống các get_*_hours của AttendanceSerializer"""
+    total_seconds = int(value.total_seconds())
+    return f"{total_seconds // 3600:02d}:{(total_seconds % 3600) // 60:02d}:00"
+
+
+def _datetime_iso(value):
+    """Giống DateTimeField của DRF: đổi sang múi giờ hiện tại, '+00:00' thành 'Z'"""
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class AttendanceListRenderer:
+    """
+    Renderer nhanh cho các endpoint danh sách (list, today).
+    Cho cùng output với AttendanceSerializer nhưng đọc từ values() đã annotate sẵn tên nhân viên,
+    phòng ban và loại nghỉ phép (một query, không tạo model instance), rồi định dạng từng dict
+    trực tiếp thay vì chạy 13 SerializerMethodField cho mỗi dòng.
+    """
+    VALUES = (
+        'id', 'employee_id', 'employee_name', 'department_name', 'date',
+        'check_in', 'check_out', 'break_duration', 'total_hours', 'notes', 'status', 'location',
+        'late_arrival', 'early_departure', 'overtime_hours', 'break_start', 'break_end',
+        'expected_start', 'expected_end', 'leave_request_id', 'leave_status', 'leave_start_date',
+        'leave_end_date', 'leave_type_name', 'created_at', 'updated_at',
+    )
+    STATUS_LABELS = dict(Attendance.STATUS_CHOICES)
+
+    @classmethod
+    def queryset(cls, queryset):
+        return queryset.annotate(
+            employee_name=Concat('employee__user__first_name', Value(' '), 'employee__user__last_name',
+                                 output_field=CharField()),
+            department_name=F('employee__department__name'),
+            leave_status=F('leave_request__status'),
+            leave_start_date=F('leave_request__start_date'),
+            leave_end_date=F('leave_request__end_date'),
+            leave_type_name=F('leave_request__leave_type__name'),
+        ).values(*cls.VALUES)
+
+    @classmethod
+    def render(cls, rows):
+        return [cls.render_row(row) for row in rows]
+
+    @classmethod
+    def render_row(cls, row):
+        status = row['status']
+        day = row['date']
+        check_in, check_out, break_start = row['check_in'], row['check_out'], row['break_start']
+        break_duration, total_hours, overtime_hours = row['break_duration'], row['total_hours'], row['overtime_hours']
+        leave_type = row['leave_type_name']
+        is_on_leave = bool(
+            row['leave_request_id'] and row['leave_status'] == 'approved'
+            and row['leave_start_date'] <= day <= row['leave_end_date']
+        )
+
+        if status == 'checked_in' and check_in:
+            status_display = f"Checked In at {check_in.strftime('%I:%M %p')}"
+        elif status == 'checked_out' and check_out:
+            status_display = f"Checked Out at {check_out.strftime('%I:%M %p')}"
+        elif status == 'on_break' and break_start:
+            status_display = f"On Break since {break_start.strftime('%I:%M %p')}"
+        elif status == 'on_leave' and row['leave_request_id']:
+            status_display = f"On {leave_type} Leave"
+        else:
+            status_display = cls.STATUS_LABELS.get(status, status)
+
+        if total_hours:
+            worked_seconds = int(total_hours.total_seconds())
+            hours_worked_display = f"{worked_seconds // 3600}h {(worked_seconds % 3600) // 60}m"
+        else:
+            hours_worked_display = "0h 0m"
+
+        return {
+            'id': row['id'],
+            'employee': row['employee_id'],
+            'employee_name': row['employee_name'],
+            'department_name': row['department_name'],
+            'date': day.isoformat(),
+            'check_in': check_in.isoformat() if check_in else None,
+            'check_out': check_out.isoformat() if check_out else None,
+            'break_duration': _duration_hms(break_duration) if break_duration else "00:00:00",
+            'total_hours': _duration_hms(total_hours) if total_hours else None,
+            'notes': row['notes'],
+            'status': status,
+            'status_display': status_display,
+            'location': row['location'],
+            'late_arrival': row['late_arrival'],
+            'early_departure': row['early_departure'],
+            'overtime_hours': _duration_hms(overtime_hours) if overtime_hours else None,
+            'break_start': break_start.isoformat() if break_start else None,
+            'break_end': row['break_end'].isoformat() if row['break_end'] else None,
+            'expected_start': row['expected_start'].isoformat() if row['expected_start'] else None,
+            'expected_end': row['expected_end'].isoformat() if row['expected_end'] else None,
+            'hours_worked_display': hours_worked_display,
+            'can_check_in': status in ('not_started', 'incomplete'),
+            'can_check_out': status in ('checked_in', 'on_break'),
+            'can_start_break': status == 'checked_in',
+            'can_end_break': status == 'on_break',
+            'leave_request': row['leave_request_id'],
+            'leave_type_display': leave_type if is_on_leave else None,
+            'is_on_leave': is_on_leave,
+            'created_at': _datetime_iso(row['created_at']),
+            'updated_at': _datetime_iso(row['updated_at']),
+        }
+
 class LeaveTypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = LeaveType
@@ -284,6 +394,14 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
             return f"{obj.approved_by.user.first_name} {obj.approved_by.user.last_name}"
         return None
 
+class LeaveBalanceSerializer(serializers.ModelSerializer):
+    leave_type_name = serializers.CharField(source='leave_type.name', read_only=True)
+    remaining = serializers.DecimalField(max_digits=7, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = LeaveBalance
+        fields = ['employee', 'leave_type', 'leave_type_name', 'year', 'accrued', 'used', 'remaining']
+
 class PerformanceSerializer(serializers.ModelSerializer):
     employee_name = serializers.SerializerMethodField()
     reviewer_name = serializers.SerializerMethodField()
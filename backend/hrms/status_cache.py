@@ -0,0 +1,63 @@
+"""
+Attendance status cache
+=======================
+
+Frontend gọi AttendanceViewSet.current_status mỗi 30 giây cho mỗi tab đang mở.
+Payload (trừ giờ hiện tại) được cache theo (nhân viên, ngày) trong Django cache,
+kèm ETag để client gửi If-None-Match và nhận 304.
+
+Cache bị xóa khi Attendance của ngày đó được lưu/xóa (check-in, check-out, break,
+ngày nghỉ phép) và khi đơn nghỉ phép của nhân viên thay đổi trạng thái.
+"""
+
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+
+STATUS_CACHE_SECONDS = 600
+
+
+def status_cache_key(employee_id, day):
+    return f"attendance-status:{employee_id}:{day.isoformat()}"
+
+
+def get_status(employee_id, day):
+    """(etag, payload) đã cache, hoặc None"""
+    return cache.get(status_cache_key(employee_id, day))
+
+
+def set_status(employee_id, day, payload):
+    """Lưu payload và trả về ETag (hash nội dung payload)"""
+    etag = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    cache.set(status_cache_key(employee_id, day), (etag, payload), STATUS_CACHE_SECONDS)
+    return etag
+
+
+def invalidate(employee_id, *days):
+    """
+    Xóa cache của các ngày. Xóa ngay và xóa lại sau khi transaction commit để một
+    request đọc song song không cache lại dữ liệu cũ.
+    """
+    keys = [status_cache_key(employee_id, day) for day in days]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_many(employee_ids, day):
+    """Xóa cache một ngày của nhiều nhân viên (job đóng ngày)"""
+    keys = [status_cache_key(employee_id, day) for employee_id in employee_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_range(employee_id, start, end):
+    """Xóa cache trong [start, end]; chỉ hôm qua/hôm nay/ngày mai có thể đang được cache"""
+    today = date.today()
+    first = max(start, today - timedelta(days=1))
+    last = min(end, today + timedelta(days=1))
+    days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+    if days:
+        invalidate(employee_id, *days)
@@ -0,0 +1,78 @@
+"""
+Attendance event stream (Server-Sent Events)
+============================================
+
+GET /api/attendance/events/?token=<JWT access token>
+(EventSource không gửi được header nên token có thể truyền qua query param;
+header Authorization: Bearer ... vẫn được chấp nhận.)
+
+- Employee nhận sự kiện của chính mình (kênh employee:<id>)
+- Manager nhận thêm check-in / break / check-out của cả phòng ban (kênh department:<id>)
+
+View là async và stream vô hạn nên phải chạy dưới ASGI (backend/asgi.py, VD: uvicorn/daphne).
+"""
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .live_events import department_channel, employee_channel, get_broker
+from .models import Employee
+
+KEEPALIVE_SECONDS = 15
+
+
+def _authenticate(request):
+    """User từ JWT access token (header Authorization hoặc ?token=), None nếu không hợp lệ"""
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        raw_token = request.GET.get('token')
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def _format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _event_stream(subscription, hello):
+    try:
+        yield "retry: 5000\n\n"
+        yield _format_event(hello)
+        while True:
+            event = await subscription.get(timeout=KEEPALIVE_SECONDS)
+            # Comment SSE giữ kết nối qua proxy khi không có sự kiện
+            yield ": keepalive\n\n" if event is None else _format_event(event)
+    finally:
+        subscription.close()
+
+
+async def attendance_events(request):
+    user = await sync_to_async(_authenticate)(request)
+    if user is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid'}, status=401)
+
+    employee = await Employee.objects.filter(user=user).afirst()
+    if employee is None:
+        return JsonResponse({'error': 'Employee profile not found'}, status=404)
+
+    channels = [employee_channel(employee.id)]
+    if employee.role == 'manager' and employee.department_id:
+        channels.append(department_channel(employee.department_id))
+
+    subscription = get_broker().subscribe(channels)
+    hello = {'type': 'subscribed', 'employee_id': employee.id, 'channels': channels}
+    response = StreamingHttpResponse(_event_stream(subscription, hello), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
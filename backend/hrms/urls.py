@@ -5,6 +5,7 @@ from .views import (
     AttendanceViewSet, LeaveRequestViewSet, LeaveTypeViewSet,
     PerformanceViewSet, change_password, SignUpView
 )
+from .streams import attendance_events
 
 router = DefaultRouter()
 router.register(r'employees', EmployeeViewSet)
@@ -16,6 +17,8 @@ router.register(r'leave-types', LeaveTypeViewSet)
 router.register(r'performances', PerformanceViewSet)
 
 urlpatterns = [
+    # Đặt trước router để không bị khớp với attendance/<pk>/
+    path('attendance/events/', attendance_events, name='attendance-events'),
     path('', include(router.urls)),
     path('auth/change-password/', change_password, name='change_password'),
 ]
\ No newline at end of file
@@ -12,14 +12,17 @@ from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from django.conf import settings
 import pytz
-from datetime import timedelta
-from .models import Employee, Department, Position, Attendance, LeaveRequest, LeaveType, Performance
+from datetime import date, timedelta
+from .models import Employee, Department, Position, Attendance, LeaveBalance, LeaveDay, LeaveRequest, LeaveType, Performance
+from . import attendance_calendar, attendance_counters, attendance_projection as projection, leave_calendar, punches as punch_ingestion, status_cache
 from .serializers import (
     EmployeeSerializer, DepartmentSerializer, PositionSerializer,
-    AttendanceSerializer, LeaveRequestSerializer, LeaveTypeSerializer,
+    AttendanceSerializer, AttendanceListRenderer, LeaveBalanceSerializer, LeaveRequestSerializer, LeaveTypeSerializer,
     PerformanceSerializer, SignUpSerializer
 )
 from rest_framework.views import APIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.exceptions import NotFound
 from django.contrib.auth import authenticate
 
 from reportlab.pdfgen import canvas
@@ -150,10 +153,87 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             return Response({'error': f'Failed to delete employee: {str(e)}'}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+class AttendanceCursorPagination(CursorPagination):
+    """
+    Keyset pagination theo (date, id).
+    CursorPagination mặc định chỉ lọc theo trường đầu (date) rồi OFFSET trong các dòng cùng
+    ngày; ở đây vị trí là cặp (date, id) nên mỗi trang là một range scan trên index
+    attendance_date_id_idx, không phụ thuộc độ sâu trang hay kích thước bảng.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-date', '-id')
+
+    def _get_position_from_instance(self, instance, ordering):
+        # instance có thể là dict từ values() (AttendanceListRenderer)
+        if isinstance(instance, dict):
+            return f"{instance['date'].isoformat()}|{instance['id']}"
+        return f"{instance.date.isoformat()}|{instance.pk}"
+
+    def _parse_position(self, position):
+        try:
+            day, pk = position.split('|')
+            return date.fromisoformat(day), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by('date', 'id')
+        else:
+            queryset = queryset.order_by('-date', '-id')
+
+        if current_position is not None:
+            day, pk = self._parse_position(current_position)
+            if reverse:
+                queryset = queryset.filter(Q(date__gt=day) | Q(date=day, id__gt=pk))
+            else:
+                queryset = queryset.filter(Q(date__lt=day) | Q(date=day, id__lt=pk))
+
+        # Vị trí luôn duy nhất nên offset chỉ khác 0 với cursor cũ / tự sửa (bị chặn bởi offset_cutoff)
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = (current_position is not None) or (offset > 0)
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+
 class AttendanceViewSet(viewsets.ModelViewSet):
-    queryset = Attendance.objects.select_related('employee__user', 'employee__department').all()
+    queryset = Attendance.objects.select_related(
+        'employee__user', 'employee__department', 'leave_request__leave_type'
+    ).all()
     serializer_class = AttendanceSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AttendanceCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['employee', 'date', 'status']
     
@@ -177,7 +257,15 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         if date_to:
             queryset = queryset.filter(date__lte=date_to)
             
-        return queryset.order_by('-date')
+        return queryset.order_by('-date', '-id')
+    
+    def list(self, request, *args, **kwargs):
+        # Đọc values() đã annotate và định dạng bằng AttendanceListRenderer (cùng output với AttendanceSerializer)
+        rows = AttendanceListRenderer.queryset(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(AttendanceListRenderer.render(page))
+        return Response(AttendanceListRenderer.render(rows))
     
     def get_vietnam_time(self):
         """Get current time in Vietnam timezone"""
@@ -186,92 +274,52 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         vietnam_now = utc_now.astimezone(vietnam_tz)
         return vietnam_now
     
-    @action(detail=False, methods=['post'])
-    def check_in(self, request):
-        # Lấy employee từ user login
-
-# Kiểm tra hôm nay employee có đang trong kỳ nghỉ được duyệt không → cấm check-in
-
-# Tạo hoặc lấy record Attendance của ngày hôm nay
-
-# Kiểm tra các trường hợp:
-
-# Nếu đã check-in → báo lỗi
-
-# Nếu đã check-out → báo lỗi
-
-# Nếu đang on_leave → lỗi
-
-# Nếu incomplete → update lại check_in
-
-# Lưu lại giờ check-in
-
-# Trả về is_late = attendance.is_late()
-
-        """Real-time check-in with current timestamp"""
+    def record_punch(self, request, punch_type):
+        """
+        Ghi punch vào nhật ký AttendanceEvent (xem hrms/attendance_projection.py).
+        Trả về (vietnam_now, attendance, None) hoặc (vietnam_now, None, response lỗi / 202).
+        """
         try:
             employee = request.user.employee
         except Employee.DoesNotExist:
-            return Response({'error': 'Employee profile not found'}, 
-                          status=status.HTTP_404_NOT_FOUND)
+            return None, None, Response({'error': 'Employee profile not found'}, 
+                                        status=status.HTTP_404_NOT_FOUND)
         
         vietnam_now = self.get_vietnam_time()
-        today = vietnam_now.date()
-        current_time = vietnam_now.time()
-        
-        # Check if employee is on approved leave today
-        approved_leave = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__lte=today,
-            end_date__gte=today
-        ).first()
-        
-        if approved_leave:
-            return Response({
-                'error': f'Cannot check in while on {approved_leave.leave_type.name} leave',
-                'leave_type': approved_leave.leave_type.name,
-                'leave_dates': f'{approved_leave.start_date} to {approved_leave.end_date}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Get or create attendance record for today
-        attendance, created = Attendance.objects.get_or_create(
-            employee=employee,
-            date=today,
-            defaults={
-                'check_in': current_time,
-                'status': 'checked_in',
-                'location': self.get_client_ip(request),
-                'break_duration': timedelta(hours=0),
-                'total_hours': None,
-                'overtime_hours': timedelta(hours=0)
-            }
-        )
-        
-        if not created:
-            if attendance.status == 'on_leave':
-                return Response({
-                    'error': 'Cannot check in while on leave',
-                    'leave_type': attendance.get_leave_type_display()
-                }, status=status.HTTP_400_BAD_REQUEST)
-            elif attendance.status == 'checked_in':
-                return Response({'error': 'Already checked in today'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            elif attendance.status == 'checked_out':
-                return Response({'error': 'Already completed attendance for today'}, 
-                              status=status.HTTP_400_BAD_REQUEST)
-            else:
-                # Update existing incomplete record
-                attendance.check_in = current_time
-                attendance.status = 'checked_in'
-                attendance.location = self.get_client_ip(request)
+        event, attendance = projection.record_punch(employee, punch_type, vietnam_now, self.get_client_ip(request))
+        
+        if attendance is None:
+            # Projector chạy nền / worker: punch đã được ghi nhận, trạng thái cập nhật sau
+            return vietnam_now, None, Response({
+                'message': 'Punch recorded',
+                'event_id': event.id,
+                'type': punch_type,
+                'time': vietnam_now.strftime('%I:%M %p'),
+                'vietnam_time': vietnam_now.strftime('%Y-%m-%d %I:%M %p'),
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        if event.status == 'rejected':
+            code = status.HTTP_404_NOT_FOUND if event.error == projection.NO_RECORD_ERROR else status.HTTP_400_BAD_REQUEST
+            return vietnam_now, None, Response({'error': event.error}, status=code)
+        
+        return vietnam_now, attendance, None
+    
+    @action(detail=False, methods=['post'])
+    def check_in(self, request):
+        # Ghi punch check_in vào nhật ký; projector kiểm tra:
+        # Đang trong kỳ nghỉ được duyệt / on_leave → lỗi
+        # Đã check-in / đã check-out → lỗi
+        # Nếu incomplete → update lại check_in
+        # Trả về is_late = attendance.is_late()
+        """Real-time check-in with current timestamp"""
+        vietnam_now, attendance, error = self.record_punch(request, 'check_in')
+        if error:
+            return error
         
-        attendance.save()
         serializer = self.get_serializer(attendance)
-        
         return Response({
             'message': 'Checked in successfully',
-            'time': current_time.strftime('%I:%M %p'),  # 12-hour format
+            'time': vietnam_now.strftime('%I:%M %p'),  # 12-hour format
             'vietnam_time': vietnam_now.strftime('%Y-%m-%d %I:%M %p'),
             'is_late': attendance.is_late(),
             'attendance': serializer.data
@@ -279,60 +327,18 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['post'])
     def check_out(self, request): 
-        # Lấy Attendance của hôm nay
-# Kiểm tra:
-# Chưa check-in → không được checkout
-# Đang on_break → auto kết thúc break và cộng break_duration
-# Ghi giờ check-out
-# Tự tính:
-# total_hours
-# overtime
-# early_departure
-# Trả về data cho frontend.
+        # Chưa check-in → không được checkout
+        # Đang on_break → auto kết thúc break và cộng break_duration
+        # Tự tính total_hours, overtime, early_departure (Attendance.compute_derived_fields)
         """Real-time check-out with calculations"""
-        try:
-            employee = request.user.employee
-        except Employee.DoesNotExist:
-            return Response({'error': 'Employee profile not found'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-
-        vietnam_now = self.get_vietnam_time()
-        today = vietnam_now.date()
-        current_time = vietnam_now.time()
-        
-        try:
-            attendance = Attendance.objects.get(employee=employee, date=today)
-        except Attendance.DoesNotExist:
-            return Response({'error': 'No check-in record found for today'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        
-        if not attendance.can_check_out():
-            return Response({'error': f'Cannot check out. Current status: {attendance.get_status_display()}'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        if attendance.check_out:
-            return Response({'error': 'Already checked out today'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        # End break if currently on break
-        if attendance.status == 'on_break':
-            attendance.break_end = current_time
-            if attendance.break_start:
-                from datetime import datetime, timedelta
-                break_start_dt = datetime.combine(today, attendance.break_start)
-                break_end_dt = datetime.combine(today, current_time)
-                additional_break = break_end_dt - break_start_dt
-                attendance.break_duration += additional_break
-        
-        attendance.check_out = current_time
-        attendance.status = 'checked_out'
-        attendance.save()
+        vietnam_now, attendance, error = self.record_punch(request, 'check_out')
+        if error:
+            return error
         
         serializer = self.get_serializer(attendance)
-        
         return Response({
             'message': 'Checked out successfully',
-            'time': current_time.strftime('%I:%M %p'),  # 12-hour format
+            'time': vietnam_now.strftime('%I:%M %p'),  # 12-hour format
             'vietnam_time': vietnam_now.strftime('%Y-%m-%d %I:%M %p'),
             'total_hours': attendance.hours_worked_display,
             'is_early_departure': attendance.is_early_departure(),
@@ -343,84 +349,57 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def start_break(self, request):
         """Start break period"""
-        # Chỉ cho phép nếu status là checked_in.
-        # Set:
-        # break_start = now
-        # status = on_break
-        try:
-            employee = request.user.employee
-        except Employee.DoesNotExist:
-            return Response({'error': 'Employee profile not found'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        
-        today = timezone.now().date()
-        current_time = timezone.now().time()
-        
-        try:
-            attendance = Attendance.objects.get(employee=employee, date=today)
-        except Attendance.DoesNotExist:
-            return Response({'error': 'No check-in record found for today'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        
-        if not attendance.can_start_break():
-            return Response({'error': f'Cannot start break. Current status: {attendance.get_status_display()}'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        attendance.break_start = current_time
-        attendance.status = 'on_break'
-        attendance.save()
+        # Chỉ cho phép nếu status là checked_in → break_start = now, status = on_break
+        vietnam_now, attendance, error = self.record_punch(request, 'start_break')
+        if error:
+            return error
         
         return Response({
             'message': 'Break started',
-            'time': current_time.strftime('%H:%M')
+            'time': vietnam_now.strftime('%H:%M')
         })
     
     @action(detail=False, methods=['post'])
     def end_break(self, request):
-
-        # Chỉ cho phép nếu status = on_break.
-        # Tính break_duration = end - start
-        # Cộng vào tổng break_duration của ngày
-        # Trả về kết quả.
+        # Chỉ cho phép nếu status = on_break; cộng (end - start) vào break_duration của ngày
         """End break period"""
-        try:
-            employee = request.user.employee
-        except Employee.DoesNotExist:
-            return Response({'error': 'Employee profile not found'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        
-        today = timezone.now().date()
-        current_time = timezone.now().time()
-        
-        try:
-            attendance = Attendance.objects.get(employee=employee, date=today)
-        except Attendance.DoesNotExist:
-            return Response({'error': 'No check-in record found for today'}, 
-                          status=status.HTTP_404_NOT_FOUND)
-        
-        if not attendance.can_end_break():
-            return Response({'error': f'Cannot end break. Current status: {attendance.get_status_display()}'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-        
-        attendance.break_end = current_time
-        attendance.status = 'checked_in'
+        vietnam_now, attendance, error = self.record_punch(request, 'end_break')
+        if error:
+            return error
         
-        # Calculate break duration
+        break_duration = None
         if attendance.break_start:
             from datetime import datetime
-            break_start_dt = datetime.combine(today, attendance.break_start)
-            break_end_dt = datetime.combine(today, current_time)
-            break_duration = break_end_dt - break_start_dt
-            attendance.break_duration += break_duration
-        
-        attendance.save()
+            break_duration = datetime.combine(attendance.date, attendance.break_end) - datetime.combine(attendance.date, attendance.break_start)
         
         return Response({
             'message': 'Break ended',
-            'time': current_time.strftime('%H:%M'),
-            'break_duration': str(break_duration) if 'break_duration' in locals() else None
+            'time': vietnam_now.strftime('%H:%M'),
+            'break_duration': str(break_duration) if break_duration is not None else None
         })
     
+    @action(detail=False, methods=['post'])
+    def punches(self, request):
+        """Nhận một lô punch từ máy chấm công / gateway (xem hrms/punches.py)"""
+        user = request.user
+        if not user.is_staff and (not hasattr(user, 'employee') or user.employee.role != 'manager'):
+            return Response({'error': 'Manager or device access required'}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        items = request.data.get('punches') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of punches'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > punch_ingestion.MAX_BATCH_SIZE:
+            return Response({'error': f'At most {punch_ingestion.MAX_BATCH_SIZE} punches per request'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        results = punch_ingestion.ingest_punches(items, default_location=self.get_client_ip(request))
+        counts = {'applied': 0, 'accepted': 0, 'duplicate': 0, 'rejected': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results})
+    
     @action(detail=False, methods=['get'])
     def current_status(self, request):
         # đang ở trạng thái gì (not_started / checked_in / on_break / checked_out / on_leave)
@@ -440,17 +419,35 @@ class AttendanceViewSet(viewsets.ModelViewSet):
         # Use Vietnam timezone
         vietnam_now = self.get_vietnam_time()
         today = vietnam_now.date()
-        
+
+        # Payload được cache theo (nhân viên, ngày), bị xóa mỗi lần chấm công / đổi đơn nghỉ
+        cached = status_cache.get_status(employee.id, today)
+        if cached is None:
+            payload = self.build_status_payload(employee, today)
+            etag = status_cache.set_status(employee.id, today, payload)
+        else:
+            etag, payload = cached
+
+        if f'"{etag}"' in request.headers.get('If-None-Match', ''):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            # Giờ hiện tại không nằm trong cache
+            if payload.get('status') == 'on_leave':
+                current_time = timezone.now().time().strftime('%I:%M %p')
+            else:
+                current_time = vietnam_now.strftime('%I:%M %p')
+            response = Response({**payload, 'current_time': current_time})
+        response['ETag'] = f'"{etag}"'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def build_status_payload(self, employee, today):
+        """Trạng thái chấm công của nhân viên trong ngày (không gồm giờ hiện tại)"""
         # Check if employee is on approved leave today
-        approved_leave = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__lte=today,
-            end_date__gte=today
-        ).first()
+        approved_leave = LeaveDay.approved_on([(employee.id, today)]).get((employee.id, today))
         
         if approved_leave:
-            return Response({
+            return {
                 'status': 'on_leave',
                 'message': f'You are on {approved_leave.leave_type.name} leave',
                 'leave_type': approved_leave.leave_type.name,
@@ -460,27 +457,27 @@ class AttendanceViewSet(viewsets.ModelViewSet):
                 'can_start_break': False,
                 'can_end_break': False,
                 'attendance': None,
-                'current_time': timezone.now().time().strftime('%I:%M %p')
-            })
+            }
         
         try:
-            attendance = Attendance.objects.get(employee=employee, date=today)
+            attendance = Attendance.objects.select_related(
+                'employee__user', 'employee__department', 'leave_request__leave_type'
+            ).get(employee=employee, date=today)
             serializer = self.get_serializer(attendance)
         except Attendance.DoesNotExist:
             # Create a default record for status checking
             attendance = Attendance(employee=employee, date=today, status='not_started')
             serializer = self.get_serializer(attendance)
         
-        return Response({
-            'attendance': serializer.data,
+        return {
+            'attendance': dict(serializer.data),
             'can_check_in': attendance.can_check_in(),
             'can_check_out': attendance.can_check_out(),
             'can_start_break': attendance.can_start_break(),
             'can_end_break': attendance.can_end_break(),
-            'current_time': vietnam_now.strftime('%I:%M %p'),
             'current_date': today.strftime('%Y-%m-%d'),
             'timezone': 'Asia/Ho_Chi_Minh'
-        })
+        }
     
     @action(detail=False, methods=['get'])
     def today(self, request): # manager xem toàn công ty hôm nay
@@ -490,46 +487,69 @@ class AttendanceViewSet(viewsets.ModelViewSet):
                           status=status.HTTP_403_FORBIDDEN)
         
         today = timezone.now().date()
-        attendance = Attendance.objects.filter(date=today).select_related('employee__user', 'employee__department')
-        serializer = self.get_serializer(attendance, many=True)
-        return Response(serializer.data)
+        rows = AttendanceListRenderer.queryset(Attendance.objects.filter(date=today))
+        return Response(AttendanceListRenderer.render(rows))
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Get attendance statistics"""
-        today = timezone.now().date()
+        """Get attendance statistics (?department=<id> để xem một phòng ban)"""
+        today = timezone.localdate()
         
         if hasattr(request.user, 'employee') and request.user.employee.role == 'manager':
             # Manager can see all stats
-            queryset = Attendance.objects.filter(date=today)
+            department_id = request.query_params.get('department')
+            if department_id and not department_id.isdigit():
+                return Response({'error': 'department must be a department id'}, 
+                              status=status.HTTP_400_BAD_REQUEST)
+            if attendance_counters.enabled():
+                counters = attendance_counters.get_counters(today, int(department_id) if department_id else None)
+            else:
+                queryset = Attendance.objects.filter(date=today)
+                if department_id:
+                    queryset = queryset.filter(employee__department_id=department_id)
+                counters = attendance_counters.aggregate(queryset)
         else:
             # Employee can only see their own stats
             if hasattr(request.user, 'employee'):
-                queryset = Attendance.objects.filter(date=today, employee=request.user.employee)
+                counters = attendance_counters.aggregate(
+                    Attendance.objects.filter(date=today, employee=request.user.employee)
+                )
             else:
                 return Response({'error': 'Employee profile not found'}, 
                               status=status.HTTP_404_NOT_FOUND)
         
-        total_present = queryset.filter(status__in=['checked_in', 'on_break', 'checked_out']).count()
-        checked_out = queryset.filter(status='checked_out').count()
-        late_arrivals = queryset.filter(late_arrival=True).count()
-        on_break = queryset.filter(status='on_break').count()
-        
-        # Calculate average hours (only for completed attendance)
-        completed_attendance = queryset.filter(status='checked_out', total_hours__isnull=False)
-        avg_hours = 0
-        if completed_attendance.exists():
-            total_seconds = sum(a.total_hours.total_seconds() for a in completed_attendance)
-            avg_hours = total_seconds / completed_attendance.count() / 3600
-        
         return Response({
-            'total_present': total_present,
-            'checked_out': checked_out,
-            'late_arrivals': late_arrivals,
-            'on_break': on_break,
-            'average_hours': round(avg_hours, 1)
+            'total_present': counters['total_present'],
+            'checked_out': counters['checked_out'],
+            'late_arrivals': counters['late_arrivals'],
+            'on_break': counters['on_break'],
+            'average_hours': round(counters['average_hours'], 1)
         })
     
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """Lưới chấm công một tháng của phòng ban dạng bitset (?month=YYYY-MM&department=<id>, managers only)"""
+        if not hasattr(request.user, 'employee') or request.user.employee.role != 'manager':
+            return Response({'error': 'Manager access required'}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        
+        department_id = request.query_params.get('department') or str(request.user.employee.department_id)
+        if not department_id.isdigit():
+            return Response({'error': 'department must be a department id'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        # Manager chỉ xem được lịch chấm công của phòng ban mình
+        if int(department_id) != request.user.employee.department_id:
+            return Response({'error': 'You can only view the calendar of your department'}, 
+                          status=status.HTTP_403_FORBIDDEN)
+        month = request.query_params.get('month')
+        try:
+            month = date.fromisoformat(f"{month}-01") if month else timezone.localdate().replace(day=1)
+        except ValueError:
+            return Response({'error': 'month must be YYYY-MM'}, 
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(attendance_calendar.get_calendar(int(department_id), month))
+    
     def get_client_ip(self, request):
         # Lấy IP client để lưu vào Attendance:
 
@@ -550,11 +570,12 @@ class LeaveTypeViewSet(viewsets.ModelViewSet):
 class LeaveRequestViewSet(viewsets.ModelViewSet):
     queryset = LeaveRequest.objects.select_related('employee', 'leave_type', 'approved_by').all()
     serializer_class = LeaveRequestSerializer
+    max_bulk_size = 1000
 
     def get_permissions(self):
         if self.action == 'create':  # employees request leave
             return [IsAuthenticated(), IsEmployee()]
-        elif self.action in ['approve', 'reject']:  # managers approve/reject
+        elif self.action in ['approve', 'reject', 'bulk_respond']:  # managers approve/reject
             return [IsAuthenticated(), IsManagerOrReadOnly()]
         elif self.action == 'cancel':
             return [IsAuthenticated(), IsEmployee()]
@@ -578,6 +599,81 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
         leave_request.save()
         return Response({'status': 'rejected'})
 
+    @action(detail=False, methods=['post'])
+    def bulk_respond(self, request):
+        """
+        Duyệt / từ chối nhiều đơn đang chờ trong một transaction:
+        {"ids": [1, 2, 3], "status": "approved" | "rejected", "comments": "..."}
+        """
+        ids = request.data.get('ids')
+        decision = request.data.get('status')
+        if decision not in ('approved', 'rejected'):
+            return Response({'error': "status must be 'approved' or 'rejected'"}, status=400)
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+            return Response({'error': 'ids must be a non-empty list of leave request ids'}, status=400)
+        if len(ids) > self.max_bulk_size:
+            return Response({'error': f'At most {self.max_bulk_size} leave requests per call'}, status=400)
+
+        results = LeaveRequest.bulk_respond(ids, decision, request.user.employee, request.data.get('comments') or '')
+        counts = {'approved': 0, 'rejected': 0, 'failed': 0, 'not_found': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({**counts, 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def team_calendar(self, request):
+        """Ai nghỉ loại phép nào theo từng ngày (?department=<id>&start=YYYY-MM-DD&end=YYYY-MM-DD, managers only)"""
+        if not hasattr(request.user, 'employee') or request.user.employee.role != 'manager':
+            return Response({'error': 'Manager access required'}, status=403)
+        
+        department_id = request.query_params.get('department') or str(request.user.employee.department_id)
+        if not department_id.isdigit():
+            return Response({'error': 'department must be a department id'}, status=400)
+        # Manager chỉ xem được lịch nghỉ của phòng ban mình
+        if int(department_id) != request.user.employee.department_id:
+            return Response({'error': 'You can only view the calendar of your department'}, status=403)
+        try:
+            start = date.fromisoformat(request.query_params['start']) if request.query_params.get('start') else timezone.localdate()
+            end = date.fromisoformat(request.query_params['end']) if request.query_params.get('end') else start + timedelta(days=90)
+        except ValueError:
+            return Response({'error': 'start and end must be YYYY-MM-DD'}, status=400)
+        if end < start or (end - start).days >= leave_calendar.MAX_RANGE_DAYS:
+            return Response({'error': f'end must be on or after start and within {leave_calendar.MAX_RANGE_DAYS} days'},
+                            status=400)
+        
+        return Response(leave_calendar.get_team_calendar(int(department_id), start, end))
+
+    @action(detail=False, methods=['get'])
+    def balances(self, request):
+        """Số dư ngày phép theo loại nghỉ trong năm (?year=, manager xem nhân viên khác bằng ?employee=)"""
+        if not hasattr(request.user, 'employee'):
+            return Response({'error': 'Employee profile not found'}, status=404)
+        employee_id = request.user.employee.id
+        if request.query_params.get('employee'):
+            if request.user.employee.role != 'manager':
+                return Response({'error': 'Manager access required'}, status=403)
+            employee_id = request.query_params['employee']
+        year = request.query_params.get('year') or str(timezone.localdate().year)
+        if not str(employee_id).isdigit() or not year.isdigit():
+            return Response({'error': 'employee and year must be numbers'}, status=400)
+        employee_id, year = int(employee_id), int(year)
+        # Manager chỉ xem được số dư của nhân viên trong phòng ban mình
+        employee = Employee.objects.filter(id=employee_id).first()
+        if employee is None or (employee_id != request.user.employee.id
+                                and employee.department_id != request.user.employee.department_id):
+            return Response({'error': 'You can only view balances of employees in your department'}, status=403)
+
+        balances = {
+            balance.leave_type_id: balance
+            for balance in LeaveBalance.objects.filter(employee_id=employee_id, year=year).select_related('leave_type')
+        }
+        # Loại nghỉ chưa dùng tới trong năm: số dư là phần lẽ ra đã được cấp tới nay
+        for leave_type in LeaveType.objects.exclude(id__in=balances.keys()):
+            balances[leave_type.id] = LeaveBalance(employee_id=employee_id, leave_type=leave_type, year=year,
+                                                   accrued=leave_type.opening_days(employee, year))
+        ordered = sorted(balances.values(), key=lambda balance: balance.leave_type.name)
+        return Response(LeaveBalanceSerializer(ordered, many=True).data)
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         leave_request = self.get_object()
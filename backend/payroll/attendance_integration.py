@@ -2,7 +2,7 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from hrms.models import Employee
+from hrms.models import Employee, AttendanceMonthlySummary
 from payroll.services import PayrollService
 from datetime import date
 
@@ -27,6 +27,7 @@ class AttendancePayrollStatsView(APIView):
             # Get overtime and hours
             overtime_bonus = PayrollService.calculate_overtime_bonus(employee, current_month)
             total_hours = PayrollService.get_total_hours_worked(employee, current_month)
+            summary = AttendanceMonthlySummary.for_month(employee, current_month)
             
             # Calculate salary impact
             if employee.salary:
@@ -50,6 +51,10 @@ class AttendancePayrollStatsView(APIView):
                     'absent_days': absent_days,
                     'incomplete_days': incomplete_days,
                     'total_hours_worked': total_hours,
+                    'present_days': summary.present_days,
+                    'on_leave_days': summary.on_leave_days,
+                    'early_departure_days': summary.early_departure_days,
+                    'overtime_hours': round(summary.overtime_hours, 2),
                 },
                 'salary_impact': {
                     'base_salary': float(employee.salary) if employee.salary else 0,
@@ -0,0 +1,442 @@
+"""
+Batch payroll engine
+====================
+
+Tính lương cho nhiều nhân viên trong một tháng (một danh sách, một phòng ban
+hoặc toàn công ty) với số query cố định:
+
+1. Employee (id, salary, hire_date, họ tên)
+2. Attendance của cả tháng
+3. LeaveRequest đã duyệt/bị từ chối bắt đầu trong tháng (kèm tên loại nghỉ cho payslip)
+4. LeavePenalty
+
+Ngày làm việc/ngày lễ lấy từ hrms.business_calendar (tính sẵn theo năm, giữ trong bộ nhớ).
+
+Kết quả giống hệt PayrollService (get_late_or_absent_days, calculate_overtime_bonus,
+get_incomplete_attendance_days, get_total_hours_worked, calculate_salary,
+create_salary_record) nhưng không phải query lại cho từng nhân viên.
+"""
+
+import hashlib
+import json
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Count, Max, QuerySet
+from hrms import business_calendar
+from hrms.models import Attendance, Employee, Holiday, LeaveRequest, LeavePenalty
+from .models import SalaryRecord
+
+PENALTY_PER_DAY = 100000
+HOURLY_OVERTIME_RATE = 50000
+LEAVE_PENALTY_THRESHOLD = 4
+# Các cột được ghi đè khi upsert SalaryRecord
+SALARY_RECORD_FIELDS = [
+    'base_salary', 'bonus', 'deductions', 'total_salary', 'total_hours_worked', 'overtime_hours',
+    'late_days', 'absent_days', 'incomplete_days', 'input_fingerprint', 'payslip',
+]
+
+
+def as_stored(fields):
+    """Làm tròn các trường Decimal của SalaryRecord theo decimal_places, để giá trị trong bộ nhớ trùng với DB"""
+    for name, value in fields.items():
+        field = SalaryRecord._meta.get_field(name)
+        if isinstance(field, models.DecimalField):
+            fields[name] = Decimal(str(value)).quantize(Decimal(1).scaleb(-field.decimal_places), ROUND_HALF_UP)
+    return fields
+
+
+def month_bounds(month):
+    """Return (first day of month, first day of next month)"""
+    start_month = month.replace(day=1)
+    if start_month.month == 12:
+        next_month = date(start_month.year + 1, 1, 1)
+    else:
+        next_month = date(start_month.year, start_month.month + 1, 1)
+    return start_month, next_month
+
+
+class BatchPayrollService:
+    @staticmethod
+    def resolve_employees(employees=None, department=None):
+        """
+        Chuẩn hóa đầu vào thành một queryset Employee:
+        - employees: queryset, danh sách Employee hoặc danh sách id
+        - department: Department hoặc id phòng ban (chỉ nhân viên active)
+        - không truyền gì: toàn bộ nhân viên active của công ty
+        """
+        if employees is None:
+            queryset = Employee.objects.filter(status='active')
+            if department is not None:
+                queryset = queryset.filter(department=department)
+            return queryset
+        if isinstance(employees, QuerySet):
+            return employees
+        ids = [getattr(emp, 'pk', emp) for emp in employees]
+        return Employee.objects.filter(pk__in=ids)
+
+    @staticmethod
+    def compute_month(month, employees=None, department=None, penalty_per_day=PENALTY_PER_DAY,
+                      hourly_overtime_rate=HOURLY_OVERTIME_RATE, extra_bonus=0):
+        """
+        Tính toàn bộ số liệu lương của tháng cho các nhân viên được chọn.
+        Trả về dict {employee_id: figures}.
+        """
+        start_month, next_month = month_bounds(month)
+        queryset = BatchPayrollService.resolve_employees(employees, department)
+        employee_rows = list(queryset.values('id', 'salary', 'hire_date', 'user__first_name', 'user__last_name'))
+        if not employee_rows:
+            return {}
+        employee_ids = queryset.values('pk')
+
+        attendance_by_employee = defaultdict(list)
+        attendance_rows = Attendance.objects.filter(
+            employee__in=employee_ids,
+            date__gte=start_month,
+            date__lt=next_month
+        ).order_by('employee_id', '-date').values_list(
+            'employee_id', 'date', 'check_in', 'expected_start', 'status', 'total_hours', 'overtime_hours'
+        )
+        for row in attendance_rows:
+            attendance_by_employee[row[0]].append(row[1:])
+
+        # Đơn đã duyệt (tính lương + payslip) và bị từ chối (chỉ hiển thị trên payslip) trong một query
+        leaves_by_employee = defaultdict(list)
+        payslip_leaves_by_employee = defaultdict(list)
+        rejected_days_by_employee = defaultdict(int)
+        leave_rows = LeaveRequest.objects.filter(
+            employee__in=employee_ids,
+            status__in=['approved', 'rejected'],
+            start_date__gte=start_month,
+            start_date__lt=next_month
+        ).order_by('pk').values_list('employee_id', 'status', 'leave_type_id', 'start_date', 'end_date',
+                                     'days_requested', 'leave_type__name')
+        for employee_id, status, leave_type_id, start_date, end_date, days_requested, leave_type_name in leave_rows:
+            if status == 'rejected':
+                rejected_days_by_employee[employee_id] += days_requested or 0
+                continue
+            leaves_by_employee[employee_id].append((leave_type_id, start_date, end_date, days_requested))
+            payslip_leaves_by_employee[employee_id].append((leave_type_id, leave_type_name, days_requested))
+
+        # LeavePenalty.objects.filter(leave_type=...).first() => bản ghi có pk nhỏ nhất
+        penalty_percents = {}
+        for leave_type_id, percent in LeavePenalty.objects.order_by('pk').values_list('leave_type_id', 'penalty_percent'):
+            penalty_percents.setdefault(leave_type_id, float(percent))
+
+        today = date.today()
+        results = {}
+        for emp in employee_rows:
+            figures = BatchPayrollService._compute_employee(
+                emp, attendance_by_employee[emp['id']], leaves_by_employee[emp['id']], penalty_percents,
+                start_month, next_month, today, penalty_per_day, hourly_overtime_rate, extra_bonus
+            )
+            # Dữ liệu riêng của payslip (PayrollService.build_payslip)
+            approved_days, leave_penalty, breakdown = BatchPayrollService.payslip_leave_penalty(
+                emp['salary'], payslip_leaves_by_employee[emp['id']], penalty_percents,
+            )
+            figures.update({
+                'employee_name': f"{emp['user__first_name']} {emp['user__last_name']}".strip(),
+                'penalty_per_day': penalty_per_day,
+                'approved_leave_days': approved_days,
+                'rejected_leave_days': rejected_days_by_employee[emp['id']],
+                'payslip_leave_penalty': leave_penalty,
+                'leave_penalty_breakdown': breakdown,
+            })
+            results[emp['id']] = figures
+        return results
+
+    @staticmethod
+    def input_fingerprints(month, employees=None, department=None, penalty_per_day=PENALTY_PER_DAY):
+        """
+        Fingerprint dữ liệu đầu vào của bảng lương tháng cho nhiều nhân viên (5 query),
+        giống hệt PayrollService.compute_input_fingerprint. Trả về dict {employee_id: fingerprint}.
+        """
+        queryset = BatchPayrollService.resolve_employees(employees, department)
+        employee_rows = list(queryset.values('id', 'salary', 'hire_date'))
+        return BatchPayrollService.fingerprint_rows(month, employee_rows, penalty_per_day)
+
+    @staticmethod
+    def fingerprint_rows(month, employee_rows, penalty_per_day=PENALTY_PER_DAY):
+        """Fingerprint cho các dòng {'id', 'salary', 'hire_date'} của nhân viên"""
+        start_month, next_month = month_bounds(month)
+        if not employee_rows:
+            return {}
+        employee_ids = [emp['id'] for emp in employee_rows]
+
+        attendance_state = {
+            row['employee_id']: row
+            for row in Attendance.objects.filter(
+                employee__in=employee_ids,
+                date__gte=start_month,
+                date__lt=next_month
+            ).values('employee_id').annotate(last_updated=Max('updated_at'), rows=Count('id')).order_by()
+        }
+        leave_state = defaultdict(list)
+        for row in LeaveRequest.objects.filter(
+            employee__in=employee_ids,
+            start_date__gte=start_month,
+            start_date__lt=next_month
+        ).order_by('pk').values_list('employee_id', 'pk', 'status', 'leave_type_id', 'start_date', 'end_date',
+                                     'days_requested'):
+            leave_state[row[0]].append(row[1:])
+
+        penalties = list(LeavePenalty.objects.order_by('pk').values_list('leave_type_id', 'penalty_percent'))
+        holidays = list(Holiday.objects.filter(date__gte=start_month, date__lt=next_month).values_list('date', flat=True))
+        # Số ngày vắng chỉ tính tới hôm nay nên tháng hiện tại phải đổi fingerprint mỗi ngày
+        as_of = min(date.today(), next_month - timedelta(days=1))
+
+        fingerprints = {}
+        for emp in employee_rows:
+            attendance = attendance_state.get(emp['id'], {'rows': 0, 'last_updated': None})
+            payload = json.dumps([
+                str(start_month), str(as_of), str(emp['salary']), str(emp['hire_date']), penalty_per_day,
+                attendance['rows'], str(attendance['last_updated']),
+                leave_state[emp['id']], penalties, holidays,
+            ], default=str)
+            fingerprints[emp['id']] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        return fingerprints
+
+    @staticmethod
+    def _compute_employee(emp, attendances, leaves, penalty_percents, start_month, next_month, today,
+                          penalty_per_day, hourly_overtime_rate, extra_bonus):
+        hire_date = emp['hire_date']
+        base_salary = emp['salary']
+
+        # --- get_late_or_absent_days ---
+        if start_month <= hire_date < next_month:
+            calc_start = hire_date
+        else:
+            calc_start = start_month
+
+        attended_dates = set()
+        late_days = 0
+        incomplete_days = 0
+        overtime_total = timedelta(0)
+        worked_total = timedelta(0)
+        for day, check_in, expected_start, status, worked, overtime in attendances:
+            if day >= calc_start and check_in:
+                attended_dates.add(day)
+                if check_in > expected_start:
+                    late_days += 1
+            if status == 'incomplete':
+                incomplete_days += 1
+            if overtime:
+                overtime_total += overtime
+            if worked:
+                worked_total += worked
+        # Cùng cách làm tròn với AttendanceMonthlySummary (số giây nguyên)
+        overtime_seconds = int(overtime_total.total_seconds())
+        worked_seconds = int(worked_total.total_seconds())
+
+        last_day = min(next_month - timedelta(days=1), today)
+        num_days = business_calendar.count_working_days(calc_start, last_day)
+
+        approved_leave_days = set()
+        for _, start_date, end_date, _ in leaves:
+            if start_date >= calc_start and end_date < next_month:
+                for i in range((end_date - start_date).days + 1):
+                    approved_leave_days.add(start_date + timedelta(days=i))
+        covered_days = {
+            d for d in attended_dates | approved_leave_days
+            if calc_start <= d <= last_day and business_calendar.is_working_day(d)
+        }
+        absent_days = num_days - len(covered_days)
+
+        # --- calculate_overtime_bonus / get_total_hours_worked ---
+        overtime_bonus = int(overtime_seconds / 3600 * hourly_overtime_rate)
+        recorded_overtime_bonus = int(overtime_seconds / 3600 * HOURLY_OVERTIME_RATE)
+        total_hours_worked = round(worked_seconds / 3600, 2)
+        bonus = extra_bonus + overtime_bonus
+
+        # --- calculate_salary ---
+        is_new_employee = hire_date >= start_month
+        if is_new_employee and num_days < 28:
+            base_salary_calc = float(base_salary) / 28 * num_days
+        else:
+            base_salary_calc = float(base_salary)
+        deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
+
+        salary_leave_days = [(leave_type_id, days_requested or (end_date - start_date).days + 1)
+                             for leave_type_id, start_date, end_date, days_requested in leaves]
+        salary_leave_penalty = int(BatchPayrollService._leave_penalty(base_salary, salary_leave_days, penalty_percents))
+        total_salary = int(base_salary_calc + bonus - deductions - salary_leave_penalty)
+
+        # --- create_salary_record: chỉ tính đơn nằm trọn trong tháng, số ngày theo lịch ---
+        record_leave_days = [(leave_type_id, (end_date - start_date).days + 1)
+                             for leave_type_id, start_date, end_date, _ in leaves
+                             if end_date < next_month]
+        record_leave_penalty = BatchPayrollService._leave_penalty(base_salary, record_leave_days, penalty_percents)
+
+        return {
+            'employee_id': emp['id'],
+            'base_salary': base_salary,
+            'base_salary_calc': base_salary_calc,
+            'working_days': num_days,
+            'late_days': late_days,
+            'absent_days': absent_days,
+            'incomplete_days': incomplete_days,
+            'is_new_employee': is_new_employee,
+            'overtime_bonus': overtime_bonus,
+            'overtime_seconds': overtime_seconds,
+            'overtime_hours': recorded_overtime_bonus / HOURLY_OVERTIME_RATE,
+            'total_hours_worked': total_hours_worked,
+            'bonus': bonus,
+            'basic_deductions': deductions,
+            'leave_penalty': record_leave_penalty,
+            'deductions': deductions + record_leave_penalty,
+            'total_salary': total_salary,
+            # (số ngày, % phạt) của từng đơn theo thứ tự, dùng cho payroll.vectorized
+            'leave_penalty_items': [(days, penalty_percents.get(leave_type_id, 0))
+                                    for leave_type_id, days in salary_leave_days],
+        }
+
+    @staticmethod
+    def _leave_penalty(base_salary, leave_days, penalty_percents):
+        """Phạt nghỉ phép cho số ngày vượt quá ngưỡng, áp dụng lần lượt theo thứ tự đơn"""
+        total_leave_days = sum(days for _, days in leave_days)
+        penalty_total = 0
+        if total_leave_days > LEAVE_PENALTY_THRESHOLD:
+            penalty_days = total_leave_days - LEAVE_PENALTY_THRESHOLD
+            for leave_type_id, days in leave_days:
+                percent = penalty_percents.get(leave_type_id, 0)
+                if penalty_days > 0:
+                    apply_days = min(days, penalty_days)
+                    daily_salary = float(base_salary) / 28
+                    penalty_total += daily_salary * (percent / 100) * apply_days
+                    penalty_days -= apply_days
+        return penalty_total
+
+    @staticmethod
+    def payslip_leave_penalty(base_salary, approved_leaves, penalty_percents):
+        """
+        Phạt nghỉ phép hiển thị trên payslip: approved_leaves là [(leave_type_id, tên loại nghỉ, days_requested)]
+        theo thứ tự đơn. Trả về (tổng ngày nghỉ được duyệt, tiền phạt, breakdown).
+        """
+        approved_days = sum(days or 0 for _, _, days in approved_leaves)
+        breakdown = []
+        amount = 0
+        if approved_days > LEAVE_PENALTY_THRESHOLD:
+            # Chỉ tính phạt cho số ngày vượt quá ngưỡng
+            penalty_days = approved_days - LEAVE_PENALTY_THRESHOLD
+            for leave_type_id, leave_type_name, days in approved_leaves:
+                if penalty_days <= 0:
+                    break
+                days = days or 0
+                if days > 0:
+                    percent = penalty_percents.get(leave_type_id, 0)
+                    apply_days = min(days, penalty_days)
+                    daily_salary = float(base_salary) / 28
+                    penalty_amount = daily_salary * (percent / 100) * apply_days
+                    amount += penalty_amount
+                    breakdown.append({
+                        "leave_type": leave_type_name,
+                        "days": apply_days,
+                        "penalty_percent": percent,
+                        "penalty_amount": int(penalty_amount)
+                    })
+                    penalty_days -= apply_days
+        return approved_days, amount, breakdown
+
+    @staticmethod
+    def payslip(employee_id, employee_name, record, overtime_bonus, stats, penalty_per_day,
+                approved_days, rejected_days, leave_penalty, breakdown):
+        """Breakdown payslip từ SalaryRecord (giá trị đã lưu) và số liệu tháng; stats = (late, absent, working, incomplete)"""
+        late_days, absent_days, num_days, incomplete_days = stats
+        return {
+            "employee_name": employee_name,
+            "employee_id": employee_id,
+            "month": str(record.month),
+            "base_salary": float(record.base_salary),
+            "overtime_bonus": float(overtime_bonus),
+            "other_bonus": float(record.bonus) - float(overtime_bonus),
+            "gross_salary": float(record.base_salary) + float(record.bonus),
+            "late_days": late_days,
+            "absent_days": absent_days,
+            "incomplete_days": incomplete_days,
+            "working_days": num_days,
+            "late_penalty": late_days * penalty_per_day,
+            "absent_penalty": absent_days * penalty_per_day,
+            "incomplete_penalty": int(incomplete_days * penalty_per_day * 0.5),
+            "leave_penalty": int(leave_penalty) if leave_penalty > 0 else 0,
+            "leave_penalty_breakdown": breakdown,
+            "approved_leave_days": approved_days,
+            "rejected_leave_days": rejected_days,
+            "total_leave_days": approved_days,
+            "leave_penalty_threshold": LEAVE_PENALTY_THRESHOLD,
+            "total_deductions": int(record.deductions),
+            "net_salary": float(record.total_salary),
+        }
+
+    @staticmethod
+    def build_salary_record(figures, month):
+        """Tạo (chưa lưu) SalaryRecord kèm payslip, giống PayrollService.get_salary_record"""
+        record = SalaryRecord(employee_id=figures['employee_id'], month=month, **as_stored({
+            'base_salary': figures['base_salary_calc'],
+            'bonus': figures['bonus'],
+            'deductions': figures['deductions'],
+            'total_salary': figures['total_salary'],
+            'total_hours_worked': figures['total_hours_worked'],
+            'overtime_hours': figures['overtime_hours'],
+            'late_days': figures['late_days'],
+            'absent_days': figures['absent_days'],
+            'incomplete_days': figures['incomplete_days'],
+        }))
+        record.payslip = BatchPayrollService.payslip(
+            figures['employee_id'], figures['employee_name'], record, figures['overtime_bonus'],
+            (figures['late_days'], figures['absent_days'], figures['working_days'], figures['incomplete_days']),
+            figures['penalty_per_day'], figures['approved_leave_days'], figures['rejected_leave_days'],
+            figures['payslip_leave_penalty'], figures['leave_penalty_breakdown'],
+        )
+        return record
+
+    @staticmethod
+    def write_salary_records(month, results, fingerprints=None):
+        """
+        Ghi SalaryRecord (kèm payslip) của tháng hàng loạt bằng upsert theo (employee_id, month):
+        bản ghi đã có được cập nhật tại chỗ, id giữ nguyên giữa các lần chạy.
+        fingerprints ({employee_id: fingerprint}, tính trước compute_month) được lưu kèm để
+        các lần đọc sau biết bản ghi còn đúng hay không.
+        """
+        start_month, _ = month_bounds(month)
+        fingerprints = fingerprints or {}
+        records = []
+        for employee_id, figures in results.items():
+            record = BatchPayrollService.build_salary_record(figures, start_month)
+            record.input_fingerprint = fingerprints.get(employee_id, '')
+            records.append(record)
+        # MySQL: ON DUPLICATE KEY UPDATE theo unique (employee_id, month), không chỉ định được cột
+        unique_fields = ['employee_id', 'month'] if connection.features.supports_update_conflicts_with_target else None
+        with transaction.atomic():
+            SalaryRecord.objects.bulk_create(
+                records, batch_size=1000, update_conflicts=True, unique_fields=unique_fields,
+                update_fields=SALARY_RECORD_FIELDS,
+            )
+        return len(records)
+
+    @staticmethod
+    def refresh_snapshots(month, employees=None, department=None, penalty_per_day=PENALTY_PER_DAY):
+        """
+        Tính lại SalaryRecord của tháng cho các nhân viên chưa có snapshot, snapshot cũ
+        (input_fingerprint khác dữ liệu hiện tại) hoặc chưa có payslip; ghi bằng upsert (cập nhật tại chỗ).
+        Trả về danh sách employee_id đã được tính lại.
+        """
+        start_month, next_month = month_bounds(month)
+        fingerprints = BatchPayrollService.input_fingerprints(month, employees, department, penalty_per_day)
+        fresh = set(SalaryRecord.objects.filter(
+            month__gte=start_month, month__lt=next_month, employee_id__in=list(fingerprints),
+        ).exclude(payslip={}).values_list('employee_id', 'input_fingerprint'))
+        stale = [employee_id for employee_id, fingerprint in fingerprints.items() if (employee_id, fingerprint) not in fresh]
+        if stale:
+            results = BatchPayrollService.compute_month(month, employees=stale, penalty_per_day=penalty_per_day)
+            BatchPayrollService.write_salary_records(month, results, fingerprints)
+        return stale
+
+    @staticmethod
+    def run_shard(month, start_id, end_id):
+        """Tính và ghi lương cho nhân viên active có id trong [start_id, end_id)"""
+        employees = Employee.objects.filter(status='active', id__gte=start_id, id__lt=end_id)
+        fingerprints = BatchPayrollService.input_fingerprints(month, employees=employees)
+        results = BatchPayrollService.compute_month(month, employees=employees)
+        return BatchPayrollService.write_salary_records(month, results, fingerprints)
@@ -0,0 +1,66 @@
+"""
+Payroll computation context
+===========================
+
+Bộ nhớ tạm (memo) cho các phép tính của PayrollService, sống trong một request
+hoặc một lần chạy batch. Khi context đang mở, các kết quả như số ngày đi muộn/vắng,
+đơn nghỉ đã duyệt, bảng LeavePenalty, dòng AttendanceMonthlySummary và Employee
+được tính một lần theo (nhân viên, tháng) rồi dùng lại cho mọi lời gọi sau.
+
+    with payroll_context():
+        record = PayrollService.get_salary_record(employee, month)
+
+Ngoài context, memoized() chỉ gọi thẳng hàm tính nên kết quả không đổi.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_active_context = ContextVar('payroll_computation_context', default=None)
+
+
+class PayrollComputationContext:
+    def __init__(self):
+        self._memo = {}
+
+    def memoize(self, key, compute):
+        """Trả về kết quả đã lưu của key, tính bằng compute() nếu chưa có"""
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def forget(self, *key_prefix):
+        """Xóa các kết quả có key bắt đầu bằng key_prefix (sau khi dữ liệu đầu vào bị ghi)"""
+        size = len(key_prefix)
+        for key in [k for k in self._memo if k[:size] == key_prefix]:
+            del self._memo[key]
+
+
+@contextmanager
+def payroll_context():
+    """Mở context memo; nếu đã có context đang mở thì dùng lại context đó"""
+    context = _active_context.get()
+    if context is not None:
+        yield context
+        return
+    context = PayrollComputationContext()
+    token = _active_context.set(context)
+    try:
+        yield context
+    finally:
+        _active_context.reset(token)
+
+
+def memoized(key, compute):
+    """Dùng kết quả trong context đang mở (nếu có), ngược lại tính trực tiếp"""
+    context = _active_context.get()
+    if context is None:
+        return compute()
+    return context.memoize(key, compute)
+
+
+def forget(*key_prefix):
+    """Xóa kết quả đã lưu trong context đang mở (nếu có)"""
+    context = _active_context.get()
+    if context is not None:
+        context.forget(*key_prefix)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0002_salaryrecord_absent_days_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salaryrecord',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, default='', help_text='Hash of attendance/leave/salary inputs used for this record', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='salaryrecord',
+            name='payslip',
+            field=models.JSONField(blank=True, default=dict, help_text='Cached payslip breakdown'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0003_salaryrecord_payslip_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRunShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('start_id', models.IntegerField(help_text='First employee id in the shard (inclusive)')),
+                ('end_id', models.IntegerField(help_text='Last employee id in the shard (exclusive)')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('record_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['month', 'start_id'],
+                'unique_together': {('month', 'start_id', 'end_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0004_payrollrunshard'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='salaryrecord',
+            index=models.Index(fields=['month', 'employee_id'], name='salary_month_employee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryrecord',
+            index=models.Index(fields=['month', 'total_salary'], name='salary_month_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryrecord',
+            index=models.Index(fields=['month', 'deductions'], name='salary_month_deductions_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salaryrecord',
+            index=models.Index(fields=['month', 'late_days'], name='salary_month_late_days_idx'),
+        ),
+    ]
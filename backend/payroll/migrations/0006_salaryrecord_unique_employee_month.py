@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+def dedupe_salary_records(apps, schema_editor):
+    """Đưa month về ngày đầu tháng và giữ bản ghi mới nhất của mỗi (nhân viên, tháng)"""
+    SalaryRecord = apps.get_model('payroll', 'SalaryRecord')
+    seen = set()
+    duplicates = []
+    for record in SalaryRecord.objects.order_by('-id').only('id', 'employee_id', 'month').iterator():
+        key = (record.employee_id, record.month.year, record.month.month)
+        if key in seen:
+            duplicates.append(record.id)
+            continue
+        seen.add(key)
+        if record.month.day != 1:
+            SalaryRecord.objects.filter(pk=record.pk).update(month=record.month.replace(day=1))
+    for offset in range(0, len(duplicates), 1000):
+        SalaryRecord.objects.filter(pk__in=duplicates[offset:offset + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0005_salaryrecord_snapshot_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_salary_records, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='salaryrecord',
+            constraint=models.UniqueConstraint(fields=('employee_id', 'month'), name='unique_salary_employee_month'),
+        ),
+    ]
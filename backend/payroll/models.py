@@ -13,6 +13,48 @@ class SalaryRecord(models.Model):
     late_days = models.IntegerField(default=0, help_text="Number of late arrival days")
     absent_days = models.IntegerField(default=0, help_text="Number of absent days")
     incomplete_days = models.IntegerField(default=0, help_text="Number of incomplete attendance days")
+    # Payslip cache: chỉ tính lại khi dữ liệu đầu vào (fingerprint) thay đổi
+    input_fingerprint = models.CharField(max_length=64, blank=True, default='', help_text="Hash of attendance/leave/salary inputs used for this record")
+    payslip = models.JSONField(default=dict, blank=True, help_text="Cached payslip breakdown")
+
+    class Meta:
+        # Phục vụ TeamSalaryView (source=snapshot): lọc theo tháng rồi sắp xếp trong SQL
+        indexes = [
+            models.Index(fields=['month', 'employee_id'], name='salary_month_employee_idx'),
+            models.Index(fields=['month', 'total_salary'], name='salary_month_total_idx'),
+            models.Index(fields=['month', 'deductions'], name='salary_month_deductions_idx'),
+            models.Index(fields=['month', 'late_days'], name='salary_month_late_days_idx'),
+        ]
+        # Một bản ghi cho mỗi nhân viên mỗi tháng (month luôn là ngày đầu tháng)
+        constraints = [
+            models.UniqueConstraint(fields=['employee_id', 'month'], name='unique_salary_employee_month'),
+        ]
 
     def __str__(self):
         return f"Salary for employee {self.employee_id} - {self.month}"
+
+
+class PayrollRunShard(models.Model):
+    """Tiến độ của từng shard (khoảng employee id) trong một lần chạy lương tháng"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    month = models.DateField()
+    start_id = models.IntegerField(help_text="First employee id in the shard (inclusive)")
+    end_id = models.IntegerField(help_text="Last employee id in the shard (exclusive)")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    record_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('month', 'start_id', 'end_id')
+        ordering = ['month', 'start_id']
+
+    def __str__(self):
+        return f"Payroll {self.month:%Y-%m} [{self.start_id}, {self.end_id}) - {self.status}"
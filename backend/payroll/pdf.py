@@ -0,0 +1,272 @@
+"""
+Payslip PDF
+===========
+
+Render payslip PDF từ breakdown đã cache trong SalaryRecord.payslip và lưu file
+trên đĩa theo hash nội dung (content-addressed): cùng dữ liệu payslip => cùng file,
+nên tải lại payslip không đổi chỉ tốn một lần đọc file.
+
+Chế độ async: enqueue_payslip_pdf đưa việc render vào thread pool và trả về job id
+(chính là hash nội dung); file được phục vụ khi render xong. Trạng thái job lấy từ
+file cache (ready) và marker trong Django cache (pending/failed), nên mọi worker
+process đều trả lời được job do process khác nhận.
+
+stream_payslip_zip ghép nhiều payslip thành một file ZIP được stream dần về client;
+các PDF chưa có trong cache được render song song trong process pool.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.pdfgen import canvas
+
+# Đổi khi thay đổi layout PDF để các file cũ không còn được dùng
+PAYSLIP_PDF_VERSION = 1
+
+# Marker pending hết hạn sau khoảng này (process render bị tắt giữa chừng => job được nhận lại)
+PAYSLIP_JOB_SECONDS = 600
+
+_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'PAYSLIP_PDF_WORKERS', 2))
+
+
+def job_cache_key(cache_key):
+    return f"payslip-pdf-job:{cache_key}"
+
+
+def payslip_cache_key(payslip):
+    """Hash nội dung payslip (kèm version layout) dùng làm tên file, ETag và job id"""
+    payload = json.dumps([PAYSLIP_PDF_VERSION, payslip], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_path(cache_key):
+    """Đường dẫn file PDF trong thư mục cache, chia thư mục con theo 2 ký tự đầu"""
+    return os.path.join(settings.PAYSLIP_PDF_CACHE_DIR, cache_key[:2], f"{cache_key}.pdf")
+
+
+def is_valid_cache_key(cache_key):
+    return len(cache_key) == 64 and all(c in '0123456789abcdef' for c in cache_key)
+
+
+def render_payslip_pdf(payslip):
+    """Vẽ payslip bằng reportlab, trả về nội dung PDF (bytes)"""
+    late_days = payslip['late_days']
+    absent_days = payslip['absent_days']
+    incomplete_days = payslip['incomplete_days']
+    overtime_bonus = payslip['overtime_bonus']
+    approved_days = payslip['approved_leave_days']
+    rejected_days = payslip['rejected_leave_days']
+    total_leave_days = payslip['total_leave_days']
+    leave_penalty = payslip['leave_penalty']
+    leave_penalty_breakdown = payslip['leave_penalty_breakdown']
+
+    buffer = BytesIO()
+    p = canvas.Canvas(buffer)
+    y = 800
+
+    # Header PDF
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(200, y, "PAYSLIP")
+    y -= 40
+
+    p.setFont("Helvetica", 11)
+    p.drawString(50, y, f"Employee: {payslip['employee_name']} (ID: {payslip['employee_id']})")
+    y -= 20
+    p.drawString(50, y, f"Month: {payslip['month'][:7]}")
+    y -= 30
+
+    # Phần thông tin nghỉ phép
+    if approved_days > 0 or rejected_days > 0:
+        p.setFont("Helvetica-Bold", 12)
+        p.drawString(50, y, "Leave Information")
+        y -= 20
+        p.setFont("Helvetica", 10)
+        if approved_days > 0:
+            p.drawString(70, y, f"Approved Leave: {approved_days} days")
+            y -= 15
+        if rejected_days > 0:
+            p.drawString(70, y, f"Rejected Leave: {rejected_days} days")
+            y -= 15
+        if total_leave_days > 4:
+            p.drawString(70, y, f"Penalty applied for: {total_leave_days - 4} days (over 4 days limit)")
+            y -= 15
+        y -= 10
+
+    # Phần Earnings (Thu nhập)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y, "Earnings")
+    y -= 20
+    p.setFont("Helvetica", 11)
+    p.drawString(70, y, f"Base Salary: {payslip['base_salary']:,.0f} VND")
+    y -= 15
+    p.drawString(70, y, f"Overtime Bonus: {float(overtime_bonus):,.0f} VND")
+    y -= 15
+    other_bonus = payslip['other_bonus']
+    p.drawString(70, y, f"Other Bonus: {other_bonus:,.0f} VND")
+    y -= 20
+
+    # Phần Deductions (Khấu trừ)
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y, "Deductions")
+    y -= 20
+    p.setFont("Helvetica", 11)
+    if late_days > 0:
+        p.drawString(70, y, f"Late Arrival ({late_days} days × 100,000): {payslip['late_penalty']:,.0f} VND")
+        y -= 15
+    if absent_days > 0:
+        p.drawString(70, y, f"Absent ({absent_days} days × 100,000): {payslip['absent_penalty']:,.0f} VND")
+        y -= 15
+    if incomplete_days > 0:
+        p.drawString(70, y, f"Incomplete Attendance ({incomplete_days} days × 50,000): {payslip['incomplete_penalty']:,.0f} VND")
+        y -= 15
+    if leave_penalty > 0:
+        p.drawString(70, y, f"Leave Penalty (over {4} days): {leave_penalty:,.0f} VND")
+        y -= 10
+        if leave_penalty_breakdown:
+            p.setFont("Helvetica", 9)
+            for item in leave_penalty_breakdown:
+                p.drawString(90, y, f"  - {item['leave_type']} ({item['days']} days, {item['penalty_percent']}%): {item['penalty_amount']:,.0f} VND")
+                y -= 12
+            p.setFont("Helvetica", 11)
+        y -= 5
+    y -= 10
+
+    # Tổng khấu trừ và lương thực nhận
+    p.setFont("Helvetica-Bold", 12)
+    p.drawString(50, y, f"Total Deductions: {payslip['total_deductions']:,.0f} VND")
+    y -= 30
+
+    p.setFont("Helvetica-Bold", 13)
+    p.drawString(50, y, f"Net Salary: {payslip['net_salary']:,.0f} VND")
+
+
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def store_payslip_pdf(cache_key, content):
+    """Ghi nội dung PDF vào cache (ghi ra file tạm rồi rename để không ai đọc file dở dang)"""
+    path = cache_path(cache_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def write_payslip_pdf(payslip, cache_key=None):
+    """Render và ghi file cache nếu chưa có, trả về đường dẫn file"""
+    cache_key = cache_key or payslip_cache_key(payslip)
+    path = cache_path(cache_key)
+    if os.path.exists(path):
+        return path
+    return store_payslip_pdf(cache_key, render_payslip_pdf(payslip))
+
+
+def get_payslip_pdf(payslip):
+    """Trả về (cache_key, path) của PDF, render đồng bộ nếu chưa có trong cache"""
+    cache_key = payslip_cache_key(payslip)
+    return cache_key, write_payslip_pdf(payslip, cache_key)
+
+
+def _run_job(payslip, cache_key):
+    """Render trong thread pool; xong thì bỏ marker, lỗi thì đánh dấu failed"""
+    try:
+        write_payslip_pdf(payslip, cache_key)
+    except Exception:
+        cache.set(job_cache_key(cache_key), 'failed', PAYSLIP_JOB_SECONDS)
+        raise
+    cache.delete(job_cache_key(cache_key))
+
+
+def enqueue_payslip_pdf(payslip):
+    """Đưa việc render vào hàng đợi (nếu chưa có file/job đang chạy), trả về job id"""
+    cache_key = payslip_cache_key(payslip)
+    if os.path.exists(cache_path(cache_key)):
+        return cache_key
+    marker = job_cache_key(cache_key)
+    # cache.add chỉ thành công ở một process: các request song song không render trùng
+    if cache.add(marker, 'pending', PAYSLIP_JOB_SECONDS) or cache.get(marker) == 'failed':
+        cache.set(marker, 'pending', PAYSLIP_JOB_SECONDS)
+        _executor.submit(_run_job, payslip, cache_key)
+    return cache_key
+
+
+def job_status(cache_key):
+    """'ready' | 'pending' | 'failed' | None (không có job)"""
+    if os.path.exists(cache_path(cache_key)):
+        return 'ready'
+    return cache.get(job_cache_key(cache_key))
+
+
+class _ZipStream:
+    """File-like chỉ ghi: giữ các byte ZipFile vừa ghi cho tới khi được lấy ra để stream"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_payslip_zip(entries, workers=1):
+    """
+    Generator trả về từng phần của file ZIP chứa các payslip.
+    entries: danh sách (tên file trong ZIP, payslip). PDF đã cache được đọc từ đĩa,
+    phần còn lại render trong process pool và ghi vào ZIP theo thứ tự hoàn thành.
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        to_render = []
+        for filename, payslip in entries:
+            cache_key = payslip_cache_key(payslip)
+            path = cache_path(cache_key)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    archive.writestr(filename, f.read())
+                yield stream.pop()
+            else:
+                to_render.append((filename, cache_key, payslip))
+
+        if workers <= 1 or len(to_render) <= 1:
+            for filename, cache_key, payslip in to_render:
+                content = render_payslip_pdf(payslip)
+                store_payslip_pdf(cache_key, content)
+                archive.writestr(filename, content)
+                yield stream.pop()
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(to_render))) as executor:
+                futures = {
+                    executor.submit(render_payslip_pdf, payslip): (filename, cache_key)
+                    for filename, cache_key, payslip in to_render
+                }
+                for future in as_completed(futures):
+                    filename, cache_key = futures[future]
+                    content = future.result()
+                    store_payslip_pdf(cache_key, content)
+                    archive.writestr(filename, content)
+                    yield stream.pop()
+    yield stream.pop()
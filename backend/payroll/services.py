@@ -1,5 +1,9 @@
 from .models import SalaryRecord
-from hrms.models import Attendance, Employee, LeaveRequest
+from .batch import BatchPayrollService, as_stored, month_bounds
+from .context import payroll_context, memoized, forget
+from hrms.models import Attendance, AttendanceMonthlySummary, Employee, LeaveRequest
+from hrms import business_calendar
+from django.db import transaction
 from django.db.models import Q
 from datetime import time, date, timedelta
 from calendar import monthrange
@@ -21,6 +25,7 @@ class PayrollService:
         employee = Employee.objects.get(pk=employee_id)
         employee.salary = new_salary
         employee.save()
+        forget('employee', employee.pk)
         # Lưu hoặc cập nhật vào bảng SalaryRecord
         # Đảm bảo month luôn là ngày đầu tháng
             # Tính lương cho tháng hiện tại (ngày đầu tháng)
@@ -31,51 +36,91 @@ class PayrollService:
         penalty_per_day = 100000
         bonus = 0
 
-        # Tính lại lương, deductions, bonus cho tháng hiện tại
-        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
-        overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
-        # Apply 50% penalty for incomplete days
-        deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
-        total_salary = PayrollService.calculate_salary(
-            base_salary=new_salary,
-            bonus=bonus + overtime_bonus,
-            month=month,
-            employee_id=employee.id,
-            penalty_per_day=penalty_per_day
-        )
-        record, _ = SalaryRecord.objects.get_or_create(
-            employee_id=employee.id,
-            month=month,
-            defaults={
-                "base_salary": new_salary,
-                "bonus": bonus + overtime_bonus,
-                "deductions": deductions,
-                "total_salary": total_salary,
-                "total_hours_worked": PayrollService.get_total_hours_worked(employee, month),
-                "overtime_hours": overtime_bonus / 50000 if overtime_bonus > 0 else 0,
-                "late_days": late_days,
-                "absent_days": absent_days,
-                "incomplete_days": incomplete_days
-            }
-        )
-        # Luôn cập nhật lại các trường lương
-        record.base_salary = new_salary
-        record.bonus = bonus + overtime_bonus
-        record.deductions = deductions
-        record.total_salary = total_salary
-        record.total_hours_worked = PayrollService.get_total_hours_worked(employee, month)
-        record.overtime_hours = overtime_bonus / 50000 if overtime_bonus > 0 else 0
-        record.late_days = late_days
-        record.absent_days = absent_days
-        record.incomplete_days = incomplete_days
-        record.save()
+        with payroll_context():
+            # Tính lại lương, deductions, bonus cho tháng hiện tại
+            late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
+            overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
+            # Apply 50% penalty for incomplete days
+            deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
+            total_salary = PayrollService.calculate_salary(
+                base_salary=new_salary,
+                bonus=bonus + overtime_bonus,
+                month=month,
+                employee_id=employee.id,
+                penalty_per_day=penalty_per_day
+            )
+            record, _ = SalaryRecord.objects.get_or_create(
+                employee_id=employee.id,
+                month=month,
+                defaults={
+                    "base_salary": new_salary,
+                    "bonus": bonus + overtime_bonus,
+                    "deductions": deductions,
+                    "total_salary": total_salary,
+                    "total_hours_worked": PayrollService.get_total_hours_worked(employee, month),
+                    "overtime_hours": overtime_bonus / 50000 if overtime_bonus > 0 else 0,
+                    "late_days": late_days,
+                    "absent_days": absent_days,
+                    "incomplete_days": incomplete_days
+                }
+            )
+            # Luôn cập nhật lại các trường lương
+            record.base_salary = new_salary
+            record.bonus = bonus + overtime_bonus
+            record.deductions = deductions
+            record.total_salary = total_salary
+            record.total_hours_worked = PayrollService.get_total_hours_worked(employee, month)
+            record.overtime_hours = overtime_bonus / 50000 if overtime_bonus > 0 else 0
+            record.late_days = late_days
+            record.absent_days = absent_days
+            record.incomplete_days = incomplete_days
+            record.save()
         return employee
         
 
+    @staticmethod
+    def get_employee(employee_id):
+        """Employee theo pk, chỉ query một lần trong payroll_context"""
+        return memoized(('employee', int(employee_id)), lambda: Employee.objects.get(pk=employee_id))
+
+    @staticmethod
+    def get_approved_leaves(employee_id, month):
+        """Danh sách đơn nghỉ đã duyệt bắt đầu trong tháng (theo thứ tự pk)"""
+        start_month, next_month = month_bounds(month)
+        return memoized(('approved_leaves', employee_id, start_month), lambda: list(
+            LeaveRequest.objects.filter(
+                employee_id=employee_id,
+                status='approved',
+                start_date__gte=start_month,
+                start_date__lt=next_month
+            ).select_related('leave_type').order_by('pk')
+        ))
+
+    @staticmethod
+    def get_leave_penalty_percents():
+        """{leave_type_id: % phạt}, giống LeavePenalty.objects.filter(leave_type=...).first()"""
+        def load():
+            from hrms.models import LeavePenalty
+            percents = {}
+            for leave_type_id, percent in LeavePenalty.objects.order_by('pk').values_list('leave_type_id', 'penalty_percent'):
+                percents.setdefault(leave_type_id, float(percent))
+            return percents
+        return memoized(('leave_penalty_percents',), load)
+
+    @staticmethod
+    def get_monthly_summary(employee, month):
+        """Dòng AttendanceMonthlySummary của tháng, chỉ đọc một lần trong payroll_context"""
+        return memoized(('monthly_summary', employee.pk, month.replace(day=1)),
+                        lambda: AttendanceMonthlySummary.for_month(employee, month))
+
     @staticmethod
     def get_late_or_absent_days(employee, month):
         """Tính số ngày đi muộn và nghỉ trong tháng"""
+        return memoized(('late_or_absent_days', employee.pk, month.replace(day=1)),
+                        lambda: PayrollService._compute_late_or_absent_days(employee, month))
 
+    @staticmethod
+    def _compute_late_or_absent_days(employee, month):
         start_month = month.replace(day=1)
 
         if month.month == 12:
@@ -106,17 +151,11 @@ class PayrollService:
 
         # print("DEBUG attendances:", list(attendances.values("date", "check_in", "check_out")))
 
-        working_days = [
-            calc_start + timedelta(days=i)
-            for i in range((calc_end - calc_start).days)
-            if (calc_start + timedelta(days=i)).weekday() < 5
-        ]
-        
         # Only consider working days up to today (don't count future days as absent)
+        # Ngày làm việc lấy từ business_calendar (bỏ Thứ Bảy, Chủ Nhật và ngày lễ)
         today = date.today()
-        working_days_up_to_today = [d for d in working_days if d <= today]
-        
-        num_days = len(working_days_up_to_today)
+        last_day = min(calc_end - timedelta(days=1), today)
+        num_days = business_calendar.count_working_days(calc_start, last_day)
         
         """tính số ngày trễ"""
         late_days = sum(
@@ -129,12 +168,10 @@ class PayrollService:
         # Số ngày làm thực tế
         # Lấy các ngày nghỉ phép đã được duyệt
         
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=calc_start,
-            end_date__lt=calc_end
-        )
+        approved_leaves = [
+            lr for lr in PayrollService.get_approved_leaves(employee.pk, month)
+            if lr.start_date >= calc_start and lr.end_date < calc_end
+        ]
         approved_leave_days = set()
         for lr in approved_leaves:
             days = (lr.end_date - lr.start_date).days + 1
@@ -142,7 +179,11 @@ class PayrollService:
                 approved_leave_days.add(lr.start_date + timedelta(days=i))
         # absent_days chỉ tính những ngày không đi làm và không có đơn nghỉ được duyệt
         # Only count working days up to today, not future days
-        absent_days = sum(1 for d in working_days_up_to_today if d not in attended_dates and d not in approved_leave_days)
+        covered_days = {
+            d for d in attended_dates | approved_leave_days
+            if calc_start <= d <= last_day and business_calendar.is_working_day(d)
+        }
+        absent_days = num_days - len(covered_days)
         
         # Add incomplete attendance days as partial penalty
         incomplete_days = PayrollService.get_incomplete_attendance_days(employee, month)
@@ -150,91 +191,29 @@ class PayrollService:
         print(f"DEBUG late_days={late_days}, absent_days={absent_days}, incomplete_days={incomplete_days}, num_days={num_days}")
         print(f"DEBUG approved_leave_days count: {len(approved_leave_days)}")
         print(f"DEBUG attended_dates count: {len(attended_dates)}")
-        print(f"DEBUG working_days_up_to_today count: {len(working_days_up_to_today)}")
+        print(f"DEBUG working_days_up_to_today count: {num_days}")
         print(f"DEBUG today: {today}, calc_start: {calc_start}, calc_end: {calc_end}")
         return late_days, absent_days, num_days, incomplete_days
 
     @staticmethod
     def calculate_overtime_bonus(employee, month, hourly_overtime_rate=50000):
         """Calculate overtime bonus based on attendance overtime_hours"""
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year+1, 1, 1)
-        else:
-            next_month = date(month.year, month.month+1, 1)
-
-        attendances = Attendance.objects.filter(
-            employee=employee,
-            date__gte=start_month,
-            date__lt=next_month,
-            overtime_hours__isnull=False
-        )
-
-        total_overtime_hours = 0
-        for attendance in attendances:
-            if attendance.overtime_hours:
-                # Convert timedelta to hours
-                if hasattr(attendance.overtime_hours, 'total_seconds'):
-                    total_overtime_hours += attendance.overtime_hours.total_seconds() / 3600
-                else:
-                    # Handle string format if needed
-                    try:
-                        h, m, s = str(attendance.overtime_hours).split(':')
-                        total_overtime_hours += int(h) + int(m)/60 + int(s)/3600
-                    except:
-                        pass
-
-        return int(total_overtime_hours * hourly_overtime_rate)
+        summary = PayrollService.get_monthly_summary(employee, month)
+        return int(summary.overtime_seconds / 3600 * hourly_overtime_rate)
 
     @staticmethod
     def get_incomplete_attendance_days(employee, month):
         """Count days with incomplete attendance (checked in but not out)"""
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year+1, 1, 1)
-        else:
-            next_month = date(month.year, month.month+1, 1)
-
-        incomplete_attendances = Attendance.objects.filter(
-            employee=employee,
-            date__gte=start_month,
-            date__lt=next_month,
-            status='incomplete'
-        ).count()
-
-        return incomplete_attendances
+        # Đọc từ bảng tổng hợp thay vì đếm lại từng dòng Attendance
+        summary = PayrollService.get_monthly_summary(employee, month)
+        return summary.incomplete_days
 
     @staticmethod
     def get_total_hours_worked(employee, month):
         """Calculate total hours worked in the month"""
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year+1, 1, 1)
-        else:
-            next_month = date(month.year, month.month+1, 1)
-
-        attendances = Attendance.objects.filter(
-            employee=employee,
-            date__gte=start_month,
-            date__lt=next_month,
-            total_hours__isnull=False
-        )
-
-        total_hours = 0
-        for attendance in attendances:
-            if attendance.total_hours:
-                # Convert timedelta to hours
-                if hasattr(attendance.total_hours, 'total_seconds'):
-                    total_hours += attendance.total_hours.total_seconds() / 3600
-                else:
-                    # Handle string format if needed
-                    try:
-                        h, m, s = str(attendance.total_hours).split(':')
-                        total_hours += int(h) + int(m)/60 + int(s)/3600
-                    except:
-                        pass
-
-        return round(total_hours, 2)
+        # Đọc từ bảng tổng hợp thay vì cộng dồn từng dòng Attendance
+        summary = PayrollService.get_monthly_summary(employee, month)
+        return summary.worked_hours
 
     @staticmethod
     def calculate_base_salary(base_salary, num_days, is_new_employee):
@@ -250,7 +229,7 @@ class PayrollService:
 
     @staticmethod
     def calculate_salary(base_salary, bonus, month, employee_id, penalty_per_day=100000):
-        employee = Employee.objects.get(pk=employee_id)
+        employee = PayrollService.get_employee(employee_id)
         late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
 
         start_month = month.replace(day=1)
@@ -264,14 +243,9 @@ class PayrollService:
         deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
 
             # --- Leave Penalty Logic ---
-        from hrms.models import LeaveRequest, LeavePenalty
         # Lấy các đơn nghỉ được duyệt trong tháng
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=start_month,
-            start_date__lt=(start_month.replace(month=start_month.month+1) if start_month.month < 12 else start_month.replace(year=start_month.year+1, month=1))
-        )
+        approved_leaves = PayrollService.get_approved_leaves(employee.pk, month)
+        penalty_percents = PayrollService.get_leave_penalty_percents()
         # Tổng số ngày nghỉ được duyệt
         total_leave_days = sum([lr.days_requested or (lr.end_date - lr.start_date).days + 1 for lr in approved_leaves])
         penalty_total = 0
@@ -280,8 +254,7 @@ class PayrollService:
             penalty_days = total_leave_days - 4
             # Tính phạt cho từng loại nghỉ
             for lr in approved_leaves:
-                leave_penalty = LeavePenalty.objects.filter(leave_type=lr.leave_type).first()
-                percent = float(leave_penalty.penalty_percent) if leave_penalty else 0
+                percent = penalty_percents.get(lr.leave_type_id, 0)
                 # Số ngày nghỉ của đơn này vượt quá 4?
                 days = lr.days_requested or (lr.end_date - lr.start_date).days + 1
                 # Nếu còn penalty_days > 0 thì trừ tiếp
@@ -298,8 +271,9 @@ class PayrollService:
     
 
     @staticmethod
-    def create_salary_record(employee_id, base_salary, bonus, month, penalty_per_day=100000):
-        employee = Employee.objects.get(pk=employee_id)
+    def salary_record_fields(employee_id, base_salary, bonus, month, penalty_per_day=100000):
+        """Giá trị các trường của SalaryRecord tháng (đã làm tròn như khi lưu DB)"""
+        employee = PayrollService.get_employee(employee_id)
 
         # Lấy số ngày đi muộn, nghỉ, số ngày công
         late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
@@ -316,26 +290,16 @@ class PayrollService:
 
 
         # --- B5: penalty_total = tiền phạt do nghỉ phép vượt quá 4 ngày ---
-        from hrms.models import LeaveRequest, LeavePenalty
-        if start_month.month == 12:
-            next_month = date(start_month.year + 1, 1, 1)
-        else:
-            next_month = date(start_month.year, start_month.month + 1, 1)
-
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=start_month,
-            end_date__lt=next_month
-        )
+        _, next_month = month_bounds(month)
+        approved_leaves = [lr for lr in PayrollService.get_approved_leaves(employee.pk, month) if lr.end_date < next_month]
+        penalty_percents = PayrollService.get_leave_penalty_percents()
 
         total_leave_days = sum((lr.end_date - lr.start_date).days + 1 for lr in approved_leaves)
         penalty_total = 0
         if total_leave_days > 4:
             penalty_days = total_leave_days - 4
             for lr in approved_leaves:
-                leave_penalty = LeavePenalty.objects.filter(leave_type=lr.leave_type).first()
-                percent = float(leave_penalty.penalty_percent) if leave_penalty else 0
+                percent = penalty_percents.get(lr.leave_type_id, 0)
                 days = (lr.end_date - lr.start_date).days + 1
                 if penalty_days > 0:
                     apply_days = min(days, penalty_days)
@@ -351,19 +315,110 @@ class PayrollService:
             employee_id=employee_id,
             penalty_per_day=penalty_per_day
         )
-        # Tạo record với đúng deductions từ late+absent
-        record = SalaryRecord.objects.create(
-            employee_id=employee_id,
-            base_salary=base_salary_calc,
-            bonus=bonus,
-            deductions=deductions + penalty_total,
-            total_salary=total_salary,
-            month=month,
-            total_hours_worked=PayrollService.get_total_hours_worked(employee, month),
-            overtime_hours=PayrollService.calculate_overtime_bonus(employee, month) / 50000,
-            late_days=late_days,
-            absent_days=absent_days,
-            incomplete_days=incomplete_days
+        # Record với đúng deductions từ late+absent
+        return PayrollService._as_stored({
+            'base_salary': base_salary_calc,
+            'bonus': bonus,
+            'deductions': deductions + penalty_total,
+            'total_salary': total_salary,
+            'total_hours_worked': PayrollService.get_total_hours_worked(employee, month),
+            'overtime_hours': PayrollService.calculate_overtime_bonus(employee, month) / 50000,
+            'late_days': late_days,
+            'absent_days': absent_days,
+            'incomplete_days': incomplete_days,
+        })
+
+    @staticmethod
+    def _as_stored(fields):
+        """Làm tròn các trường Decimal theo decimal_places, để giá trị trong bộ nhớ trùng với giá trị trong DB"""
+        return as_stored(fields)
+
+    @staticmethod
+    def create_salary_record(employee_id, base_salary, bonus, month, penalty_per_day=100000):
+        fields = PayrollService.salary_record_fields(employee_id, base_salary, bonus, month, penalty_per_day)
+        return SalaryRecord.objects.create(employee_id=employee_id, month=month, **fields)
+
+    @staticmethod
+    def compute_input_fingerprint(employee, month, penalty_per_day=100000):
+        """
+        Hash các dữ liệu đầu vào của bảng lương tháng:
+        attendance (max updated_at + số dòng), trạng thái đơn nghỉ phép, lương, penalty.
+        Nếu fingerprint không đổi thì SalaryRecord đã lưu vẫn còn đúng.
+        """
+        row = {'id': employee.pk, 'salary': employee.salary, 'hire_date': employee.hire_date}
+        return BatchPayrollService.fingerprint_rows(month, [row], penalty_per_day)[employee.pk]
+
+    @staticmethod
+    def build_payslip(employee, month, record, overtime_bonus, penalty_per_day=100000):
+        """Xây dựng breakdown chi tiết cho payslip (dùng chung cho API và PDF)"""
+        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
+        base_salary = employee.salary
+
+        # Lấy thông tin chi tiết về đơn nghỉ phép trong tháng
+        start_month, next_month = month_bounds(month)
+
+        # Các đơn nghỉ được duyệt (dùng chung với calculate_salary) và bị từ chối trong tháng này
+        approved_leaves = PayrollService.get_approved_leaves(employee.pk, month)
+        penalty_percents = PayrollService.get_leave_penalty_percents()
+        rejected_leaves = LeaveRequest.objects.filter(
+            employee=employee,
+            status='rejected',
+            start_date__gte=start_month,
+            start_date__lt=next_month
+        )
+
+        # Phạt nghỉ phép (khi > 4 ngày) và breakdown, dùng chung với batch payroll
+        approved_days, leave_penalty_amount, leave_penalty_breakdown = BatchPayrollService.payslip_leave_penalty(
+            base_salary, [(lr.leave_type_id, lr.leave_type.name, lr.days_requested) for lr in approved_leaves],
+            penalty_percents,
         )
-        return record
+        rejected_days = sum([lr.days_requested or 0 for lr in rejected_leaves])
 
+        return BatchPayrollService.payslip(
+            employee.id, employee.user.get_full_name(), record, overtime_bonus,
+            (late_days, absent_days, num_days, incomplete_days), penalty_per_day,
+            approved_days, rejected_days, leave_penalty_amount, leave_penalty_breakdown,
+        )
+
+    @staticmethod
+    def get_salary_record(employee, month, penalty_per_day=100000):
+        """
+        Lấy SalaryRecord của tháng (kèm payslip đã cache).
+        Chỉ tính lại và ghi DB khi fingerprint dữ liệu đầu vào thay đổi;
+        nếu không thì trả về bản ghi đã lưu, không ghi gì cả.
+        """
+        with payroll_context():
+            # Employee của request được dùng lại, không query lại theo pk
+            memoized(('employee', employee.pk), lambda: employee)
+            fingerprint = PayrollService.compute_input_fingerprint(employee, month, penalty_per_day)
+            start_month = month.replace(day=1)
+            record = SalaryRecord.objects.filter(employee_id=employee.id, month=start_month).first()
+            if record and record.input_fingerprint == fingerprint and record.payslip:
+                return record
+
+            with transaction.atomic():
+                # Khóa bản ghi của tháng: request song song chờ rồi dùng lại kết quả vừa tính
+                record = SalaryRecord.objects.select_for_update().filter(
+                    employee_id=employee.id, month=start_month,
+                ).first()
+                if record and record.input_fingerprint == fingerprint and record.payslip:
+                    return record
+
+                overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
+                fields = PayrollService.salary_record_fields(
+                    employee_id=employee.id,
+                    base_salary=employee.salary,
+                    bonus=overtime_bonus,
+                    month=start_month,
+                    penalty_per_day=penalty_per_day
+                )
+                fields['payslip'] = PayrollService.build_payslip(
+                    employee, month, SalaryRecord(employee_id=employee.id, month=start_month, **fields),
+                    overtime_bonus, penalty_per_day,
+                )
+                fields['input_fingerprint'] = fingerprint
+                # Tính lại tại chỗ (unique employee_id + month); chưa có thì tạo mới
+                record, _ = SalaryRecord.objects.update_or_create(
+                    employee_id=employee.id, month=start_month, defaults=fields,
+                )
+                return record
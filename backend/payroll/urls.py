@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import MySalaryView, SetBaseSalaryView, PayslipPDFView, TeamSalaryView, EmployeeSalaryView
+from .views import MySalaryView, SetBaseSalaryView, PayslipPDFView, PayslipPDFJobView, TeamSalaryView, EmployeeSalaryView, DepartmentPayslipZipView
 from .attendance_integration import AttendancePayrollStatsView
 
 urlpatterns = [
@@ -9,4 +9,6 @@ urlpatterns = [
     path('set-base-salary/', SetBaseSalaryView.as_view(), name='set-base-salary'),
     path('attendance-stats/', AttendancePayrollStatsView.as_view(), name='attendance-payroll-stats'),
     path('payslip/', PayslipPDFView.as_view(), name='payslip-pdf'),
+    path('payslip/department/', DepartmentPayslipZipView.as_view(), name='department-payslip-zip'),
+    path('payslip/jobs/<int:employee_id>/<str:job_id>/', PayslipPDFJobView.as_view(), name='payslip-pdf-job'),
 ]
@@ -0,0 +1,94 @@
+"""
+Vectorized salary calculator
+============================
+
+Bản NumPy của PayrollService.calculate_base_salary + calculate_salary: nhận các
+mảng cột (mỗi phần tử là một nhân viên) và trả về mảng lương thực nhận trong một
+lần tính. Thứ tự các phép toán float giữ nguyên như bản scalar nên kết quả khớp
+chính xác từng đồng, dùng cho what-if và chạy lương hàng chục nghìn nhân viên.
+"""
+
+import numpy as np
+
+from .batch import HOURLY_OVERTIME_RATE, LEAVE_PENALTY_THRESHOLD, PENALTY_PER_DAY
+
+
+def calculate_base_salaries(base_salary, is_new_employee, num_days):
+    """Lương cơ bản sau khi chia theo ngày công cho nhân viên mới (num_days < 28)"""
+    base = np.asarray(base_salary, dtype=np.float64)
+    num_days = np.asarray(num_days, dtype=np.int64)
+    prorate = np.asarray(is_new_employee, dtype=bool) & (num_days < 28)
+    return np.where(prorate, base / 28 * num_days, base)
+
+
+def calculate_leave_penalties(base_salary, leave_days, leave_percents, threshold=LEAVE_PENALTY_THRESHOLD):
+    """
+    Tiền phạt nghỉ phép vượt ngưỡng.
+    leave_days / leave_percents: mảng 2 chiều (nhân viên x đơn nghỉ, theo thứ tự đơn),
+    các ô trống để 0.
+    """
+    daily_salary = np.asarray(base_salary, dtype=np.float64) / 28
+    leave_days = np.atleast_2d(np.asarray(leave_days, dtype=np.int64))
+    leave_percents = np.atleast_2d(np.asarray(leave_percents, dtype=np.float64))
+
+    total_leave_days = leave_days.sum(axis=1)
+    remaining = np.where(total_leave_days > threshold, total_leave_days - threshold, 0)
+    penalty = np.zeros(daily_salary.shape, dtype=np.float64)
+    # Cộng lần lượt từng cột để giữ đúng thứ tự cộng float như vòng lặp scalar
+    for column in range(leave_days.shape[1]):
+        apply_days = np.minimum(leave_days[:, column], remaining)
+        penalty = np.where(remaining > 0, penalty + daily_salary * (leave_percents[:, column] / 100) * apply_days, penalty)
+        remaining = remaining - apply_days
+    return np.trunc(penalty)
+
+
+def calculate_overtime_bonuses(overtime_hours, hourly_overtime_rate=HOURLY_OVERTIME_RATE):
+    """Tiền tăng ca, tương đương PayrollService.calculate_overtime_bonus (overtime_hours = số giây / 3600)"""
+    return np.trunc(np.asarray(overtime_hours, dtype=np.float64) * hourly_overtime_rate).astype(np.int64)
+
+
+def calculate_net_salaries(base_salary, is_new_employee, num_days, late_days, absent_days, incomplete_days,
+                           overtime_hours, leave_days, leave_percents, bonus=0, penalty_per_day=PENALTY_PER_DAY,
+                           hourly_overtime_rate=HOURLY_OVERTIME_RATE):
+    """
+    Mảng lương thực nhận, tương đương PayrollService.calculate_salary cho từng nhân viên.
+    bonus là thưởng thêm ngoài tiền tăng ca (số hoặc mảng).
+    """
+    base_salary_calc = calculate_base_salaries(base_salary, is_new_employee, num_days)
+    late_days = np.asarray(late_days, dtype=np.int64)
+    absent_days = np.asarray(absent_days, dtype=np.int64)
+    incomplete_days = np.asarray(incomplete_days, dtype=np.int64)
+    deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
+    penalty_total = calculate_leave_penalties(base_salary, leave_days, leave_percents)
+    bonus = np.asarray(bonus, dtype=np.int64) + calculate_overtime_bonuses(overtime_hours, hourly_overtime_rate)
+    return np.trunc(base_salary_calc + bonus - deductions - penalty_total).astype(np.int64)
+
+
+def columns_from_batch(results):
+    """
+    Chuyển kết quả BatchPayrollService.compute_month thành các mảng cột
+    (theo thứ tự employee_ids trả về) để đưa vào calculate_net_salaries.
+    """
+    employee_ids = list(results)
+    figures = [results[emp_id] for emp_id in employee_ids]
+    width = max([len(f['leave_penalty_items']) for f in figures] + [1])
+    leave_days = np.zeros((len(figures), width), dtype=np.int64)
+    leave_percents = np.zeros((len(figures), width), dtype=np.float64)
+    for row, f in enumerate(figures):
+        for column, (days, percent) in enumerate(f['leave_penalty_items']):
+            leave_days[row, column] = days
+            leave_percents[row, column] = percent
+
+    columns = {
+        'base_salary': np.array([float(f['base_salary']) for f in figures], dtype=np.float64),
+        'is_new_employee': np.array([f['is_new_employee'] for f in figures], dtype=bool),
+        'num_days': np.array([f['working_days'] for f in figures], dtype=np.int64),
+        'late_days': np.array([f['late_days'] for f in figures], dtype=np.int64),
+        'absent_days': np.array([f['absent_days'] for f in figures], dtype=np.int64),
+        'incomplete_days': np.array([f['incomplete_days'] for f in figures], dtype=np.int64),
+        'overtime_hours': np.array([f['overtime_seconds'] / 3600 for f in figures], dtype=np.float64),
+        'bonus': np.array([f['bonus'] - f['overtime_bonus'] for f in figures], dtype=np.int64),
+        'leave_days': leave_days,
+        'leave_percents': leave_percents,
+    }
+    return employee_ids, columns
@@ -11,6 +11,7 @@ Các view này xử lý logic tính lương và payslip cho cả Manager và Emp
    - Manager: có thể tải payslip của nhân viên trong cùng phòng ban
 4. TeamSalaryView: CHỈ MANAGER - Xem danh sách lương của team
 5. EmployeeSalaryView: CHỈ MANAGER - Xem chi tiết payslip của một nhân viên cụ thể
+6. DepartmentPayslipZipView: CHỈ MANAGER - Tải toàn bộ payslip của phòng ban (ZIP)
 """
 
 from rest_framework import status
@@ -19,8 +20,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from hrms.models import Employee
 from .services import PayrollService
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from .pdf import (cache_path, enqueue_payslip_pdf, get_payslip_pdf, is_valid_cache_key, job_status,
+                  payslip_cache_key, stream_payslip_zip)
 
 # ============================================================================
 # VIEW 1: SetBaseSalaryView
@@ -59,7 +62,12 @@ from rest_framework.permissions import IsAuthenticated
 from hrms.models import Employee
 from .models import SalaryRecord
 from .services import PayrollService
+from .context import payroll_context
+from .batch import BatchPayrollService, month_bounds
+from rest_framework.pagination import CursorPagination
+from django.db.models import Q
 from datetime import date, timedelta, datetime
+from decimal import Decimal, InvalidOperation
 
 # ============================================================================
 # VIEW 2: MySalaryView
@@ -99,119 +107,16 @@ class MySalaryView(APIView):
             # Mặc định: tháng hiện tại
             month = today.replace(day=1)
 
-        from payroll.services import PayrollService
         penalty_per_day = 100000  # Mức phạt mỗi ngày: 100,000 VND
-        base_salary = employee.salary
-        overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
-        bonus = overtime_bonus
-
-        # --- Gọi service để tạo/ cập nhật SalaryRecord ---
-        record = SalaryRecord.objects.filter(
-            employee_id=employee.id,
-            month__year=month.year,
-            month__month=month.month
-        ).first()
-
-        if record:
-            # Luôn tính lại để đảm bảo nhất quán với attendance/leave mới nhất
-            record.delete()
-
-        record = PayrollService.create_salary_record(
-            employee_id=employee.id,
-            base_salary=base_salary,
-            bonus=bonus,
-            month=month,
-            penalty_per_day=penalty_per_day
-        )
-
-        # Xây dựng breakdown chi tiết cho payslip (tương tự debug_salary.py)
-        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
-        basic_deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
-        leave_penalty = float(record.deductions) - basic_deductions
-
-        # Lấy thông tin chi tiết về đơn nghỉ phép trong tháng
-        from hrms.models import LeaveRequest
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year + 1, 1, 1)
-        else:
-            next_month = date(month.year, month.month + 1, 1)
-
-        # Query các đơn nghỉ được duyệt và bị từ chối trong tháng này
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
-        rejected_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='rejected',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
 
-        # Tính tổng số ngày nghỉ được duyệt/bị từ chối
-        approved_days = sum([lr.days_requested or 0 for lr in approved_leaves])
-        rejected_days = sum([lr.days_requested or 0 for lr in rejected_leaves])
-
-        # Tính breakdown phạt nghỉ phép (khi > 4 ngày)
-        total_leave_days = approved_days
-        leave_penalty_breakdown = []
-        leave_penalty_amount = 0
-        if total_leave_days > 4:
-            # Chỉ tính phạt cho số ngày vượt quá 4 ngày
-            penalty_days = total_leave_days - 4
-            from hrms.models import LeavePenalty
-            for lr in approved_leaves:
-                if penalty_days <= 0:
-                    break
-                days = lr.days_requested or 0
-                if days > 0:
-                    leave_penalty_obj = LeavePenalty.objects.filter(leave_type=lr.leave_type).first()
-                    percent = float(leave_penalty_obj.penalty_percent) if leave_penalty_obj else 0
-                    apply_days = min(days, penalty_days)
-                    daily_salary = float(base_salary) / 28
-                    penalty_amount = daily_salary * (percent / 100) * apply_days
-                    leave_penalty_amount += penalty_amount
-                    leave_penalty_breakdown.append({
-                        "leave_type": lr.leave_type.name,
-                        "days": apply_days,
-                        "penalty_percent": percent,
-                        "penalty_amount": int(penalty_amount)
-                    })
-                    penalty_days -= apply_days
-
-        # Xây dựng object payslip với đầy đủ thông tin
-        payslip = {
-            "employee_name": employee.user.get_full_name(),
-            "employee_id": employee.id,
-            "month": str(record.month),
-            "base_salary": float(record.base_salary),
-            "overtime_bonus": float(overtime_bonus),
-            "other_bonus": float(record.bonus) - float(overtime_bonus),
-            "gross_salary": float(record.base_salary) + float(record.bonus),
-            "late_days": late_days,
-            "absent_days": absent_days,
-            "incomplete_days": incomplete_days,
-            "working_days": num_days,
-            "late_penalty": late_days * penalty_per_day,
-            "absent_penalty": absent_days * penalty_per_day,
-            "incomplete_penalty": int(incomplete_days * penalty_per_day * 0.5),
-            "leave_penalty": int(leave_penalty_amount) if leave_penalty_amount > 0 else 0,
-            "leave_penalty_breakdown": leave_penalty_breakdown,
-            "approved_leave_days": approved_days,
-            "rejected_leave_days": rejected_days,
-            "total_leave_days": total_leave_days,
-            "leave_penalty_threshold": 4,
-            "total_deductions": int(record.deductions),
-            "net_salary": float(record.total_salary),
-        }
+        # --- Lấy SalaryRecord đã cache, chỉ tính lại khi attendance/leave/lương thay đổi ---
+        record = PayrollService.get_salary_record(employee, month, penalty_per_day)
+        payslip = record.payslip
 
         return Response({
-            'net_salary': record.total_salary,
-            'base_salary': record.base_salary,
-            'bonus': record.bonus,
+            'net_salary': float(record.total_salary),
+            'base_salary': float(record.base_salary),
+            'bonus': float(record.bonus),
             'deductions': int(record.deductions),
             'month': record.month,
             'total_hours_worked': float(record.total_hours_worked),
@@ -234,7 +139,9 @@ class MySalaryView(APIView):
 # CẢ MANAGER VÀ EMPLOYEE đều có thể sử dụng
 # Chức năng: Tạo và tải payslip dưới dạng PDF
 # Endpoint: GET /api/payroll/payslip/?month=YYYY-MM&employee_id=123
-# 
+# - PDF được cache trên đĩa theo hash nội dung payslip, trả kèm ETag (hỗ trợ If-None-Match)
+# - ?async=1: trả về 202 + job_id, tải file tại /api/payroll/payslip/jobs/<employee_id>/<job_id>/
+#
 # Phân quyền:
 # - Employee: chỉ tải được payslip của chính mình (không truyền employee_id)
 # - Manager: có thể tải payslip của nhân viên trong cùng phòng ban (truyền employee_id)
@@ -243,29 +150,61 @@ class PayslipPDFView(APIView):
     """Generate payslip as PDF for a given month"""
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
+    @staticmethod
+    def resolve_employee(request, employee_id_param):
+        """Trả về (employee, None) nếu được xem payslip, ngược lại (None, Response lỗi)"""
         user = request.user
         try:
             current_user_employee = Employee.objects.get(user=user)
         except Employee.DoesNotExist:
-            return Response({'error': 'Employee not found'}, status=404)
+            return None, Response({'error': 'Employee not found'}, status=404)
 
         # Kiểm tra xem manager có muốn xem payslip của nhân viên khác không
-        employee_id_param = request.query_params.get('employee_id')
-        if employee_id_param:
+        if employee_id_param and str(employee_id_param) != str(current_user_employee.id):
             # Manager đang xem payslip của thành viên team
             if current_user_employee.role != 'manager':
-                return Response({'error': 'Only managers can view other employees\' payslips'}, status=403)
+                return None, Response({'error': 'Only managers can view other employees\' payslips'}, status=403)
             try:
                 employee = Employee.objects.get(id=employee_id_param)
             except Employee.DoesNotExist:
-                return Response({'error': 'Employee not found'}, status=404)
+                return None, Response({'error': 'Employee not found'}, status=404)
             # Kiểm tra nhân viên có cùng phòng ban không
             if employee.department != current_user_employee.department:
-                return Response({'error': 'You can only view payslips of employees in your department'}, status=403)
+                return None, Response({'error': 'You can only view payslips of employees in your department'}, status=403)
+            return employee, None
+        # Xem payslip của chính mình
+        return current_user_employee, None
+
+    @staticmethod
+    def etag_matches(request, cache_key):
+        """Client đã có đúng phiên bản này chưa (ETag nằm trong If-None-Match, kể cả dạng W/ hoặc '*')"""
+        tags = [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == f'"{cache_key}"' for tag in tags)
+
+    @staticmethod
+    def owns_payslip(employee, cache_key):
+        """cache_key có phải hash của một payslip đã lưu của chính nhân viên này không"""
+        payslips = SalaryRecord.objects.filter(employee_id=employee.id).values_list('payslip', flat=True)
+        return any(payslip and payslip_cache_key(payslip) == cache_key for payslip in payslips)
+
+    @classmethod
+    def file_response(cls, request, cache_key, path, filename):
+        """Trả file PDF đã cache, hoặc 304 nếu client đã có đúng phiên bản (If-None-Match)"""
+        etag = f'"{cache_key}"'
+        if cls.etag_matches(request, cache_key):
+            response = HttpResponse(status=304)
         else:
-            # Xem payslip của chính mình
-            employee = current_user_employee
+            with open(path, 'rb') as f:
+                response = HttpResponse(f.read(), content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def get(self, request):
+        employee, error = self.resolve_employee(request, request.query_params.get('employee_id'))
+        if error is not None:
+            return error
 
         # Parse tháng từ query param
         month_param = request.query_params.get('month')
@@ -286,167 +225,43 @@ class PayslipPDFView(APIView):
             month = today.replace(day=1)
 
         penalty_per_day = 100000
-        base_salary = employee.salary
-        overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
-        bonus = overtime_bonus
-
-        record = SalaryRecord.objects.filter(
-            employee_id=employee.id,
-            month__year=month.year,
-            month__month=month.month
-        ).first()
-
-        if record:
-            record.delete()
-
-        record = PayrollService.create_salary_record(
-            employee_id=employee.id,
-            base_salary=base_salary,
-            bonus=bonus,
-            month=month,
-            penalty_per_day=penalty_per_day
-        )
+        record = PayrollService.get_salary_record(employee, month, penalty_per_day)
+        payslip = record.payslip
+        filename = f"payslip_{employee.id}_{month.strftime('%Y_%m')}.pdf"
 
-        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
-        basic_deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
-        
-        # Lấy thông tin chi tiết về đơn nghỉ phép cho PDF
-        from hrms.models import LeaveRequest, LeavePenalty
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year + 1, 1, 1)
-        else:
-            next_month = date(month.year, month.month + 1, 1)
+        # Chế độ async: đưa việc render vào hàng đợi, client lấy file qua job id
+        if request.query_params.get('async') in ('1', 'true'):
+            job_id = enqueue_payslip_pdf(payslip)
+            return Response({
+                'job_id': job_id,
+                'status': job_status(job_id) or 'pending',
+                'download_url': f"/api/payroll/payslip/jobs/{employee.id}/{job_id}/",
+            }, status=status.HTTP_202_ACCEPTED)
 
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
-        rejected_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='rejected',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
+        # PDF được cache trên đĩa theo hash nội dung payslip, chỉ render khi chưa có
+        cache_key = payslip_cache_key(payslip)
+        if not self.etag_matches(request, cache_key):
+            get_payslip_pdf(payslip)
+        return self.file_response(request, cache_key, cache_path(cache_key), filename)
 
-        approved_days = sum([lr.days_requested or 0 for lr in approved_leaves])
-        rejected_days = sum([lr.days_requested or 0 for lr in rejected_leaves])
-        total_leave_days = approved_days
-        
-        # Tính breakdown phạt nghỉ phép
-        leave_penalty_amount = 0
-        leave_penalty_breakdown = []
-        if total_leave_days > 4:
-            penalty_days = total_leave_days - 4
-            for lr in approved_leaves:
-                if penalty_days <= 0:
-                    break
-                days = lr.days_requested or 0
-                if days > 0:
-                    leave_penalty_obj = LeavePenalty.objects.filter(leave_type=lr.leave_type).first()
-                    percent = float(leave_penalty_obj.penalty_percent) if leave_penalty_obj else 0
-                    apply_days = min(days, penalty_days)
-                    daily_salary = float(base_salary) / 28
-                    penalty_amount = daily_salary * (percent / 100) * apply_days
-                    leave_penalty_amount += penalty_amount
-                    leave_penalty_breakdown.append({
-                        "leave_type": lr.leave_type.name,
-                        "days": apply_days,
-                        "penalty_percent": percent,
-                        "penalty_amount": int(penalty_amount)
-                    })
-                    penalty_days -= apply_days
-        
-        leave_penalty = int(leave_penalty_amount) if leave_penalty_amount > 0 else 0
 
-        # Tạo PDF response
-        response = HttpResponse(content_type='application/pdf')
-        filename = f"payslip_{employee.id}_{month.strftime('%Y_%m')}.pdf"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+class PayslipPDFJobView(PayslipPDFView):
+    """Trạng thái / file của một job render payslip PDF (job id = hash nội dung)"""
 
-        p = canvas.Canvas(response)
-        y = 800
-
-        # Header PDF
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(200, y, "PAYSLIP")
-        y -= 40
-
-        p.setFont("Helvetica", 11)
-        p.drawString(50, y, f"Employee: {employee.user.get_full_name()} (ID: {employee.id})")
-        y -= 20
-        p.drawString(50, y, f"Month: {month.strftime('%Y-%m')}")
-        y -= 30
-
-        # Phần thông tin nghỉ phép
-        if approved_days > 0 or rejected_days > 0:
-            p.setFont("Helvetica-Bold", 12)
-            p.drawString(50, y, "Leave Information")
-            y -= 20
-            p.setFont("Helvetica", 10)
-            if approved_days > 0:
-                p.drawString(70, y, f"Approved Leave: {approved_days} days")
-                y -= 15
-            if rejected_days > 0:
-                p.drawString(70, y, f"Rejected Leave: {rejected_days} days")
-                y -= 15
-            if total_leave_days > 4:
-                p.drawString(70, y, f"Penalty applied for: {total_leave_days - 4} days (over 4 days limit)")
-                y -= 15
-            y -= 10
-
-        # Phần Earnings (Thu nhập)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(50, y, "Earnings")
-        y -= 20
-        p.setFont("Helvetica", 11)
-        p.drawString(70, y, f"Base Salary: {float(record.base_salary):,.0f} VND")
-        y -= 15
-        p.drawString(70, y, f"Overtime Bonus: {float(overtime_bonus):,.0f} VND")
-        y -= 15
-        other_bonus = float(record.bonus) - float(overtime_bonus)
-        p.drawString(70, y, f"Other Bonus: {other_bonus:,.0f} VND")
-        y -= 20
-
-        # Phần Deductions (Khấu trừ)
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(50, y, "Deductions")
-        y -= 20
-        p.setFont("Helvetica", 11)
-        if late_days > 0:
-            p.drawString(70, y, f"Late Arrival ({late_days} days × 100,000): {late_days * penalty_per_day:,.0f} VND")
-            y -= 15
-        if absent_days > 0:
-            p.drawString(70, y, f"Absent ({absent_days} days × 100,000): {absent_days * penalty_per_day:,.0f} VND")
-            y -= 15
-        if incomplete_days > 0:
-            p.drawString(70, y, f"Incomplete Attendance ({incomplete_days} days × 50,000): {int(incomplete_days * penalty_per_day * 0.5):,.0f} VND")
-            y -= 15
-        if leave_penalty > 0:
-            p.drawString(70, y, f"Leave Penalty (over {4} days): {leave_penalty:,.0f} VND")
-            y -= 10
-            if leave_penalty_breakdown:
-                p.setFont("Helvetica", 9)
-                for item in leave_penalty_breakdown:
-                    p.drawString(90, y, f"  - {item['leave_type']} ({item['days']} days, {item['penalty_percent']}%): {item['penalty_amount']:,.0f} VND")
-                    y -= 12
-                p.setFont("Helvetica", 11)
-            y -= 5
-        y -= 10
-
-        # Tổng khấu trừ và lương thực nhận
-        p.setFont("Helvetica-Bold", 12)
-        p.drawString(50, y, f"Total Deductions: {int(record.deductions):,.0f} VND")
-        y -= 30
-
-        p.setFont("Helvetica-Bold", 13)
-        p.drawString(50, y, f"Net Salary: {float(record.total_salary):,.0f} VND")
-
-        p.showPage()
-        p.save()
-        return response
+    def get(self, request, employee_id, job_id):
+        employee, error = self.resolve_employee(request, employee_id)
+        if error is not None:
+            return error
+        if not is_valid_cache_key(job_id):
+            return Response({'error': 'Invalid job id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Job id chỉ là hash nội dung: chỉ trả về khi đó là payslip của chính nhân viên trong URL
+        job = job_status(job_id) if self.owns_payslip(employee, job_id) else None
+        if job is None:
+            return Response({'error': 'Job not found'}, status=404)
+        if job != 'ready':
+            return Response({'job_id': job_id, 'status': job}, status=status.HTTP_202_ACCEPTED if job == 'pending' else 500)
+        return self.file_response(request, job_id, cache_path(job_id), f"payslip_{employee.id}_{job_id[:8]}.pdf")
 
 
 # ============================================================================
@@ -456,7 +271,31 @@ class PayslipPDFView(APIView):
 # Chức năng: Manager xem danh sách lương của tất cả nhân viên trong cùng phòng ban
 # Endpoint: GET /api/payroll/team-salary/?month=YYYY-MM
 # Trả về: Danh sách lương của từng nhân viên trong team (không bao gồm chính manager)
+#
+# Chế độ snapshot: GET /api/payroll/team-salary/?month=YYYY-MM&source=snapshot
+# - Đọc SalaryRecord đã tính sẵn (run_payroll), phân trang bằng cursor (?cursor=, ?page_size=)
+# - Sắp xếp: ?ordering=net_salary|deductions|late_days (thêm "-" để giảm dần)
+# - Lọc: ?search=, ?position=, ?min_net_salary=, ?max_net_salary=, ?min_late_days=
 # ============================================================================
+class TeamSalaryCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-total_salary', 'id')
+    ordering_fields = {
+        'net_salary': 'total_salary',
+        'deductions': 'deductions',
+        'late_days': 'late_days',
+    }
+
+    def get_ordering(self, request, queryset, view):
+        param = request.query_params.get('ordering', '')
+        field = self.ordering_fields.get(param.lstrip('-'))
+        if field is None:
+            return self.ordering
+        return ('-' + field if param.startswith('-') else field, 'id')
+
+
 class TeamSalaryView(APIView):
     """Get salary list for all employees in manager's department"""
     permission_classes = [IsAuthenticated]
@@ -496,35 +335,79 @@ class TeamSalaryView(APIView):
             status='active'
         ).exclude(id=manager.id).select_related('user', 'department', 'position')
 
+        # Chế độ snapshot: đọc SalaryRecord đã tính sẵn, lọc/sắp xếp/phân trang trong SQL
+        if request.query_params.get('source') == 'snapshot':
+            return self.snapshot_response(request, month, team_employees)
+
         penalty_per_day = 100000
         team_salaries = []
 
         # Tính lương cho từng nhân viên trong team
-        for emp in team_employees:
-            # Tính lương cho nhân viên này
-            base_salary = emp.salary
-            overtime_bonus = PayrollService.calculate_overtime_bonus(emp, month)
-            bonus = overtime_bonus
-
-            # Lấy hoặc tạo salary record
-            record = SalaryRecord.objects.filter(
-                employee_id=emp.id,
-                month__year=month.year,
-                month__month=month.month
-            ).first()
-
-            if record:
-                record.delete()
-
-            record = PayrollService.create_salary_record(
-                employee_id=emp.id,
-                base_salary=base_salary,
-                bonus=bonus,
-                month=month,
-                penalty_per_day=penalty_per_day
+        # Một payroll_context cho cả request: bảng LeavePenalty chỉ đọc một lần cho cả team
+        with payroll_context():
+            for emp in team_employees:
+                # Tính lương cho nhân viên này
+                record = PayrollService.get_salary_record(emp, month, penalty_per_day)
+
+                # Thêm vào danh sách team salaries
+                team_salaries.append({
+                    'employee_id': emp.id,
+                    'employee_name': emp.user.get_full_name(),
+                    'employee_code': emp.employee_id,
+                    'position': emp.position.title,
+                    'net_salary': float(record.total_salary),
+                    'base_salary': float(record.base_salary),
+                    'bonus': float(record.bonus),
+                    'deductions': int(record.deductions),
+                    'month': str(record.month),
+                })
+
+        return Response({
+            'month': str(month),
+            'team_salaries': team_salaries,
+            'total_employees': len(team_salaries)
+        })
+
+    def snapshot_response(self, request, month, team_employees):
+        """
+        Danh sách lương team từ snapshot SalaryRecord của tháng.
+        Nhân viên chưa có snapshot hoặc có snapshot cũ (input_fingerprint khác dữ liệu hiện tại)
+        được tính lại bằng BatchPayrollService (số query cố định) và cập nhật tại chỗ kèm payslip,
+        không xóa/chèn lại bản ghi.
+        """
+        start_month, next_month = month_bounds(month)
+        month_records = SalaryRecord.objects.filter(month__gte=start_month, month__lt=next_month)
+        BatchPayrollService.refresh_snapshots(month, employees=team_employees)
+
+        # Lọc nhân viên (tên, mã nhân viên, vị trí) bằng subquery, không tải danh sách về Python
+        search = request.query_params.get('search')
+        if search:
+            team_employees = team_employees.filter(
+                Q(user__first_name__icontains=search) |
+                Q(user__last_name__icontains=search) |
+                Q(employee_id__icontains=search)
             )
+        position = request.query_params.get('position')
+        if position:
+            team_employees = team_employees.filter(position_id=position)
 
-            # Thêm vào danh sách team salaries
+        records = month_records.filter(employee_id__in=team_employees.values('id'))
+        try:
+            for param, lookup in [('min_net_salary', 'total_salary__gte'), ('max_net_salary', 'total_salary__lte'),
+                                  ('min_late_days', 'late_days__gte')]:
+                value = request.query_params.get(param)
+                if value:
+                    records = records.filter(**{lookup: Decimal(value) if 'salary' in param else int(value)})
+        except (InvalidOperation, ValueError):
+            return Response({'error': 'Invalid filter value.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = TeamSalaryCursorPagination()
+        page = paginator.paginate_queryset(records, request, view=self)
+        employees = Employee.objects.select_related('user', 'position').in_bulk([r.employee_id for r in page])
+
+        team_salaries = []
+        for record in page:
+            emp = employees[record.employee_id]
             team_salaries.append({
                 'employee_id': emp.id,
                 'employee_name': emp.user.get_full_name(),
@@ -534,13 +417,16 @@ class TeamSalaryView(APIView):
                 'base_salary': float(record.base_salary),
                 'bonus': float(record.bonus),
                 'deductions': int(record.deductions),
+                'late_days': record.late_days,
                 'month': str(record.month),
             })
 
         return Response({
             'month': str(month),
             'team_salaries': team_salaries,
-            'total_employees': len(team_salaries)
+            'total_employees': records.count(),
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
         })
 
 
@@ -597,111 +483,13 @@ class EmployeeSalaryView(APIView):
 
         # Tái sử dụng logic giống MySalaryView nhưng cho nhân viên được chỉ định
         penalty_per_day = 100000
-        base_salary = employee.salary
-        overtime_bonus = PayrollService.calculate_overtime_bonus(employee, month)
-        bonus = overtime_bonus
-
-        record = SalaryRecord.objects.filter(
-            employee_id=employee.id,
-            month__year=month.year,
-            month__month=month.month
-        ).first()
-
-        if record:
-            record.delete()
-
-        record = PayrollService.create_salary_record(
-            employee_id=employee.id,
-            base_salary=base_salary,
-            bonus=bonus,
-            month=month,
-            penalty_per_day=penalty_per_day
-        )
-
-        # Xây dựng breakdown payslip (giống MySalaryView)
-        late_days, absent_days, num_days, incomplete_days = PayrollService.get_late_or_absent_days(employee, month)
-        basic_deductions = (late_days + absent_days) * penalty_per_day + (incomplete_days * penalty_per_day * 0.5)
-        
-        # Lấy thông tin chi tiết về đơn nghỉ phép
-        from hrms.models import LeaveRequest
-        start_month = month.replace(day=1)
-        if month.month == 12:
-            next_month = date(month.year + 1, 1, 1)
-        else:
-            next_month = date(month.year, month.month + 1, 1)
-
-        approved_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='approved',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
-        rejected_leaves = LeaveRequest.objects.filter(
-            employee=employee,
-            status='rejected',
-            start_date__gte=start_month,
-            start_date__lt=next_month
-        )
-
-        approved_days = sum([lr.days_requested or 0 for lr in approved_leaves])
-        rejected_days = sum([lr.days_requested or 0 for lr in rejected_leaves])
-        total_leave_days = approved_days
-        
-        # Tính breakdown phạt nghỉ phép
-        leave_penalty_amount = 0
-        leave_penalty_breakdown = []
-        if total_leave_days > 4:
-            penalty_days = total_leave_days - 4
-            from hrms.models import LeavePenalty
-            for lr in approved_leaves:
-                if penalty_days <= 0:
-                    break
-                days = lr.days_requested or 0
-                if days > 0:
-                    leave_penalty_obj = LeavePenalty.objects.filter(leave_type=lr.leave_type).first()
-                    percent = float(leave_penalty_obj.penalty_percent) if leave_penalty_obj else 0
-                    apply_days = min(days, penalty_days)
-                    daily_salary = float(base_salary) / 28
-                    penalty_amount = daily_salary * (percent / 100) * apply_days
-                    leave_penalty_amount += penalty_amount
-                    leave_penalty_breakdown.append({
-                        "leave_type": lr.leave_type.name,
-                        "days": apply_days,
-                        "penalty_percent": percent,
-                        "penalty_amount": int(penalty_amount)
-                    })
-                    penalty_days -= apply_days
-
-        # Xây dựng object payslip
-        payslip = {
-            "employee_name": employee.user.get_full_name(),
-            "employee_id": employee.id,
-            "month": str(record.month),
-            "base_salary": float(record.base_salary),
-            "overtime_bonus": float(overtime_bonus),
-            "other_bonus": float(record.bonus) - float(overtime_bonus),
-            "gross_salary": float(record.base_salary) + float(record.bonus),
-            "late_days": late_days,
-            "absent_days": absent_days,
-            "incomplete_days": incomplete_days,
-            "working_days": num_days,
-            "late_penalty": late_days * penalty_per_day,
-            "absent_penalty": absent_days * penalty_per_day,
-            "incomplete_penalty": int(incomplete_days * penalty_per_day * 0.5),
-            "leave_penalty": int(leave_penalty_amount) if leave_penalty_amount > 0 else 0,
-            "leave_penalty_breakdown": leave_penalty_breakdown,
-            "approved_leave_days": approved_days,
-            "rejected_leave_days": rejected_days,
-            "total_leave_days": total_leave_days,
-            "leave_penalty_threshold": 4,
-            "total_deductions": int(record.deductions),
-            "net_salary": float(record.total_salary),
-        }
+        record = PayrollService.get_salary_record(employee, month, penalty_per_day)
+        payslip = record.payslip
 
         return Response({
-            'net_salary': record.total_salary,
-            'base_salary': record.base_salary,
-            'bonus': record.bonus,
+            'net_salary': float(record.total_salary),
+            'base_salary': float(record.base_salary),
+            'bonus': float(record.bonus),
             'deductions': int(record.deductions),
             'month': record.month,
             'total_hours_worked': float(record.total_hours_worked),
@@ -711,3 +499,66 @@ class EmployeeSalaryView(APIView):
             'incomplete_days': record.incomplete_days,
             'payslip': payslip,
         })
+
+
+# ============================================================================
+# VIEW 6: DepartmentPayslipZipView
+# ============================================================================
+# CHỈ MANAGER mới được sử dụng
+# Chức năng: Tải payslip PDF của tất cả nhân viên active trong phòng ban trong một file ZIP
+# Endpoint: GET /api/payroll/payslip/department/?month=YYYY-MM
+# - ZIP được stream dần, PDF chưa có trong cache được render song song (process pool)
+# ============================================================================
+class DepartmentPayslipZipView(APIView):
+    """Stream every payslip of the manager's department for a month as a ZIP"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            manager = Employee.objects.get(user=request.user)
+        except Employee.DoesNotExist:
+            return Response({'error': 'Employee not found'}, status=404)
+
+        if manager.role != 'manager':
+            return Response({'error': 'Only managers can export department payslips'}, status=403)
+
+        month_param = request.query_params.get('month')
+        if month_param:
+            try:
+                try:
+                    month_date = datetime.strptime(month_param, "%Y-%m").date()
+                except ValueError:
+                    month_date = datetime.strptime(month_param, "%Y-%m-%d").date()
+                month = month_date.replace(day=1)
+            except ValueError:
+                return Response(
+                    {"error": "Invalid month format. Use YYYY-MM or YYYY-MM-DD."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        else:
+            today = date.today()
+            month = today.replace(day=1)
+
+        # Lấy payslip (SalaryRecord đã cache) trước khi stream để lỗi DB không làm hỏng file ZIP giữa chừng:
+        # snapshot cũ/thiếu được tính lại hàng loạt, sau đó đọc payslip của cả phòng ban bằng một query
+        penalty_per_day = 100000
+        BatchPayrollService.refresh_snapshots(month, department=manager.department, penalty_per_day=penalty_per_day)
+        start_month, next_month = month_bounds(month)
+        payslips = SalaryRecord.objects.filter(
+            employee__department=manager.department,
+            employee__status='active',
+            month__gte=start_month,
+            month__lt=next_month,
+        ).order_by('employee_id').values_list('employee_id', 'payslip')
+        entries = [
+            (f"payslip_{employee_id}_{month.strftime('%Y_%m')}.pdf", payslip)
+            for employee_id, payslip in payslips
+        ]
+
+        response = StreamingHttpResponse(
+            stream_payslip_zip(entries, workers=settings.PAYSLIP_EXPORT_WORKERS),
+            content_type='application/zip'
+        )
+        filename = f"payslips_{manager.department_id}_{month.strftime('%Y_%m')}.zip"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
@@ -12,6 +12,7 @@ const AttendanceManagement = () => {
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
   const [currentTime, setCurrentTime] = useState(new Date());
+  const [streamConnected, setStreamConnected] = useState(false);
   const [filters, setFilters] = useState({
     date_from: new Date().toISOString().split('T')[0],
     date_to: new Date().toISOString().split('T')[0],
@@ -33,11 +34,27 @@ const AttendanceManagement = () => {
     fetchAttendanceRecords();
   }, []);
 
-  // Auto-refresh current status every 30 seconds
+  // Live updates from the attendance event stream
   useEffect(() => {
+    if (typeof EventSource === 'undefined') return undefined;
+    const source = new EventSource(hrapi.attendanceEventsUrl());
+    source.onopen = () => {
+      setStreamConnected(true);
+      // Catch up on anything missed while disconnected
+      fetchCurrentStatus();
+    };
+    source.onerror = () => setStreamConnected(false);
+    source.addEventListener('status_changed', () => fetchCurrentStatus());
+    source.addEventListener('attendance', () => fetchAttendanceStats());
+    return () => source.close();
+  }, []);
+
+  // Fall back to polling current status every 30 seconds while the stream is down
+  useEffect(() => {
+    if (streamConnected) return undefined;
     const interval = setInterval(fetchCurrentStatus, 30000);
     return () => clearInterval(interval);
-  }, []);
+  }, [streamConnected]);
 
   const fetchCurrentStatus = async () => {
     try {
@@ -116,7 +133,8 @@ const AttendanceManagement = () => {
       'on_break': 'bg-yellow-100 text-yellow-800',
       'checked_out': 'bg-blue-100 text-blue-800',
       'incomplete': 'bg-red-100 text-red-800',
-      'on_leave': 'bg-purple-100 text-purple-800'
+      'on_leave': 'bg-purple-100 text-purple-800',
+      'absent': 'bg-red-100 text-red-800'
     };
     return colors[status] || 'bg-gray-100 text-gray-800';
   };
@@ -135,6 +135,8 @@ export const hrapi = {
   getTodayAttendance: () => api.get('/attendance/today/'),
   getAttendanceStats: () => api.get('/attendance/stats/'),
   getCurrentStatus: () => api.get('/attendance/current_status/'),
+  // SSE stream (EventSource can't send headers, so the access token goes in the query string)
+  attendanceEventsUrl: () => `${API_BASE_URL}/attendance/events/?token=${encodeURIComponent(getAccessToken() || '')}`,
   
   // Real-time attendance actions
   checkIn: () => api.post('/attendance/check_in/'),